@@ -1,40 +1,82 @@
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Response
+from app.core.config import settings
+from app.services.analytics import analytics
 from app.services.auto_learner import auto_learner
 from app.services.rag_service import rag_service
+from app.services.answer_cache import answer_cache
+from app.services.answer_router import answer_router
+from app.services.conversation_store import conversation_store
+from app.services.ocr_cache import ocr_cache
+from app.services.llm_service import generation_limiter, get_llm_service
+from app.services.ann_index import INDEX_TYPES
 from app.schemas.admin import AnalyticsResponse, KnowledgeBaseStats, AutoLearningTrigger, DocumentInfo
 from app.services.verification_service import verification_service
+from app.services.case_store import case_store
 from pydantic import BaseModel
 from datetime import datetime
+from collections import deque
+from typing import Deque, Dict, Literal, Optional, Tuple
 import os
+import time
 
 router = APIRouter()
 
-# In-memory storage for demo (replace with DB in production)
-query_log = []
-upload_log = []
+# Most recent uploads for the knowledge base listing; counts live in the analytics engine
+upload_log: Deque[Dict] = deque(maxlen=settings.ANALYTICS_RECENT_ITEMS)
 
 @router.get("/analytics", response_model=AnalyticsResponse)
 def get_analytics():
     """
     Get system analytics and statistics
     """
-    # Calculate metrics
-    total_queries = len(query_log)
-    queries_today = len([q for q in query_log if q.get('date') == datetime.now().date().isoformat()])
+    # Read from running counters, never by rescanning a query log
+    totals = analytics.totals()
     
     # Knowledge health: percentage of FAISS index health (mock for now)
-    knowledge_health = 85.0 if rag_service.vector_store else 0.0
-    
-    recent_queries = [q.get('query', 'Unknown') for q in query_log[-5:]]
+    knowledge_health = 85.0 if not rag_service.empty else 0.0
     
     return {
-        "total_queries": total_queries,
-        "total_documents": len(upload_log),
-        "queries_today": queries_today,
+        "total_queries": totals.get("queries", 0),
+        "total_documents": totals.get("uploads", 0),
+        "queries_today": analytics.count_today("queries"),
         "knowledge_health": knowledge_health,
-        "recent_queries": recent_queries
+        "recent_queries": analytics.recent_queries()
     }
 
+def _time_range(start: Optional[datetime], end: Optional[datetime], default_hours: int = 24) -> Tuple[float, float]:
+    end_ts = end.timestamp() if end else time.time()
+    start_ts = start.timestamp() if start else end_ts - default_hours * 3600
+    if start_ts > end_ts:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start_ts, end_ts
+
+@router.get("/analytics/summary")
+def get_analytics_summary(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Optional[Literal["minute", "hour", "day"]] = None,
+):
+    """
+    Query, upload, answer and feedback counts, thumbs-up ratio, answer
+    latency percentiles and top queries for a time range (default: last 24 hours)
+    """
+    start_ts, end_ts = _time_range(start, end)
+    return analytics.summary(start_ts, end_ts, resolution)
+
+@router.get("/analytics/series")
+def get_analytics_series(
+    counter: str = "queries",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: Optional[Literal["minute", "hour", "day"]] = None,
+):
+    """
+    Per-bucket values of one counter (e.g. queries, answers_llm,
+    feedback_thumbs_down) for a time range (default: last 24 hours)
+    """
+    start_ts, end_ts = _time_range(start, end)
+    return analytics.series(counter, start_ts, end_ts, resolution)
+
 @router.get("/knowledge-base", response_model=KnowledgeBaseStats)
 def get_knowledge_base_stats():
     """
@@ -53,14 +95,15 @@ def get_knowledge_base_stats():
     vector_store_path = rag_service.vector_store_path
     vector_store_size = 0
     if os.path.exists(vector_store_path):
-        for file in os.listdir(vector_store_path):
-            file_path = os.path.join(vector_store_path, file)
-            if os.path.isfile(file_path):
-                vector_store_size += os.path.getsize(file_path)
+        # Includes the base snapshot and any not yet compacted segments
+        for root, _, files in os.walk(vector_store_path):
+            for file in files:
+                vector_store_size += os.path.getsize(os.path.join(root, file))
     
+    totals = analytics.totals()
     return {
-        "total_documents": len(upload_log),
-        "total_chunks": sum(d.get('chunks', 0) for d in upload_log),
+        "total_documents": totals.get("uploads", 0),
+        "total_chunks": totals.get("chunks_indexed", 0),
         "vector_store_size_mb": round(vector_store_size / (1024 * 1024), 2),
         "last_updated": upload_log[-1].get('indexed_at', 'Never') if upload_log else 'Never',
         "documents": documents_info
@@ -74,6 +117,13 @@ def trigger_auto_learning(
     """
     Trigger the auto-learning engine on a specific directory
     """
+    if not rag_service.claim_leadership():
+        # Another worker's manifest tracks the learned files
+        holder = rag_service.leader.holder() or {}
+        raise HTTPException(
+            status_code=409,
+            detail=f"Auto-learning runs in the index leader worker (pid {holder.get('pid')}); retry the request",
+        )
     if not os.path.exists(config.directory_path):
         os.makedirs(config.directory_path, exist_ok=True)
     
@@ -86,16 +136,131 @@ def trigger_auto_learning(
         "directory": config.directory_path
     }
 
+@router.get("/answer-cache")
+def get_answer_cache_stats():
+    """
+    Get semantic answer cache hit/miss statistics for threshold tuning
+    """
+    return answer_cache.stats()
+
+@router.delete("/answer-cache")
+def clear_answer_cache():
+    """
+    Drop all cached answers
+    """
+    answer_cache.clear()
+    return {"status": "cleared"}
+
+@router.get("/answer-router")
+def get_answer_router_stats():
+    """
+    Get how many questions were answered extractively vs by the LLM
+    """
+    return answer_router.stats()
+
+@router.get("/ocr-cache")
+def get_ocr_cache_stats():
+    """
+    Get OCR result cache size, hit rate and near-duplicate matches
+    """
+    if ocr_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **ocr_cache.stats()}
+
+@router.delete("/ocr-cache")
+def clear_ocr_cache():
+    """
+    Drop all cached OCR reports
+    """
+    if ocr_cache is not None:
+        ocr_cache.clear()
+    return {"status": "cleared"}
+
+@router.get("/conversations")
+def get_conversation_stats():
+    """
+    Get conversation store size and eviction counts
+    """
+    return conversation_store.stats()
+
+@router.get("/llm")
+def get_llm_status():
+    """
+    Get load, health and latency of every LLM backend in the pool
+    """
+    llm_service = get_llm_service()
+    return {
+        "backends": llm_service.pool_status(),
+        "generation_limiter": generation_limiter.stats(),
+        "session_contexts": llm_service.session_contexts.stats(),
+    }
+
+@router.post("/llm/health-check")
+async def check_llm_health():
+    """
+    Probe every LLM backend now instead of waiting for the next health check
+    """
+    llm_service = get_llm_service()
+    await llm_service.pool.check_health()
+    return {"backends": llm_service.pool_status()}
+
+@router.post("/index/compact")
+def compact_index(background_tasks: BackgroundTasks):
+    """
+    Fold pending index segments into a new base snapshot
+    """
+    pending = rag_service.index_store.pending_segments
+    background_tasks.add_task(rag_service.compact_index)
+    return {"status": "compacting", "pending_segments": pending}
+
+@router.get("/index/status")
+def get_index_status():
+    """
+    Get the vector index type, size and the report of the last rebuild
+    (build time, memory and recall against exact search)
+    """
+    return rag_service.index_status()
+
+@router.post("/index/rebuild")
+def rebuild_index(index_type: Optional[str] = None):
+    """
+    Rebuild the vector index in the background with the given or configured type
+    """
+    if index_type is not None and index_type not in INDEX_TYPES:
+        raise HTTPException(status_code=400, detail=f"index_type must be one of {INDEX_TYPES}")
+    started = rag_service.rebuild_index_async(index_type)
+    return {"status": "rebuilding" if started else "already running"}
+
+@router.post("/index/reembed")
+def reembed_index():
+    """
+    Re-embed all chunks with the configured embedding backend in the background
+    """
+    if rag_service.mapped:
+        raise HTTPException(
+            status_code=409,
+            detail="Re-embedding needs the whole index in memory; run it from a process with INDEX_SERVING_MODE=memory",
+        )
+    if not rag_service.claim_leadership():
+        # Its snapshot must replace the whole index, which only the leader writes
+        raise HTTPException(status_code=409, detail="Re-embedding runs in the index leader worker; retry the request")
+    started = rag_service.reembed_index_async()
+    return {"status": "re-embedding" if started else "already running"}
+
+@router.get("/auto-learn/status")
+def get_auto_learning_status():
+    """
+    Get watched directories, directory watcher state and progress of the
+    current or last ingestion run
+    """
+    return auto_learner.status()
+
 @router.post("/log-query")
 def log_query(query: str):
     """
     Log a query for analytics (called by chat endpoint)
     """
-    query_log.append({
-        "query": query,
-        "date": datetime.now().date().isoformat(),
-        "timestamp": datetime.now().isoformat()
-    })
+    analytics.record_query(query)
     return {"status": "logged"}
 
 
@@ -111,17 +276,59 @@ def log_upload(filename: str, chunks: int, size_kb: int):
         "size_kb": size_kb,
         "indexed_at": datetime.now().isoformat()
     })
+    analytics.record_upload(chunks)
     return {"status": "logged"}
 
 class VerificationDecision(BaseModel):
     remarks: str = None
 
+def _page_size(limit: Optional[int]) -> int:
+    return max(1, min(limit or settings.VERIFICATION_QUEUE_PAGE_SIZE, settings.VERIFICATION_QUEUE_MAX_PAGE_SIZE))
+
 @router.get("/verification/queue")
-def get_verification_queue():
+def get_verification_queue(response: Response, limit: Optional[int] = None, cursor: Optional[int] = None):
+    """
+    Get one page of pending verification cases, oldest first.
+    The next page's cursor is sent in the X-Next-Cursor header and the
+    number of pending cases in X-Total-Count.
+    """
+    items, next_cursor = verification_service.get_pending_cases(limit=_page_size(limit), cursor=cursor)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = str(next_cursor)
+    response.headers["X-Total-Count"] = str(case_store.counts().get("pending", 0))
+    return items
+
+@router.get("/verification/cases")
+def list_verification_cases(
+    status: Optional[str] = None,
+    report_status: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[int] = None,
+    newest_first: bool = False,
+):
+    """
+    Page through verification cases, filtered by review status
+    (pending/approved/rejected) and/or OCR result (verified/suspicious/error).
+    Items carry a report summary; open a case for the full report.
+    """
+    items, next_cursor = case_store.list(
+        status=status,
+        report_status=report_status,
+        limit=_page_size(limit),
+        cursor=cursor,
+        newest_first=newest_first,
+    )
+    return {"items": items, "next_cursor": next_cursor, "counts": case_store.counts()}
+
+@router.get("/verification/cases/{case_id}")
+def get_verification_case(case_id: str):
     """
-    Get all pending verification cases
+    Get a verification case with its full report
     """
-    return verification_service.get_pending_cases()
+    case = case_store.get(case_id)
+    if case is None:
+        raise HTTPException(status_code=404, detail="Case not found")
+    return case
 
 @router.post("/verification/{case_id}/approve")
 def approve_verification(case_id: str, decision: VerificationDecision):
@@ -1,16 +1,32 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from app.core.concurrency import GenerationQueueFull
+from app.core.config import settings
+from app.core.metrics import observe_stage, track_stage
+from app.services.analytics import analytics
 from app.services.rag_service import rag_service
-from app.services.llm_service import get_llm_service
+from app.services.llm_service import (
+    ANSWER_ERROR_MESSAGE,
+    SIMPLE_ANSWER_ERROR_MESSAGE,
+    generation_limiter,
+    get_llm_service,
+)
+from app.services.answer_cache import CachedAnswer, answer_cache
+from app.services.answer_router import RouteDecision, answer_router
+from app.services.course_partitions import course_key
+from app.services.conversation_store import conversation_store
 from app.schemas.chat import ChatRequest, ChatResponse, ChatMessage, ChatFeedback
-from typing import List, Dict, Optional
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, List, Dict, Optional
+import json
+import time
 import uuid
 
 router = APIRouter()
 
-# In-memory conversation storage (replace with Redis/DB in production)
-# In-memory storage (replace with DB/Redis in production)
-conversations: Dict[str, List[ChatMessage]] = {}
-feedback_store: List[Dict] = []
+# Most recent feedback entries; counts and ratios live in the analytics engine
+feedback_store: Deque[Dict] = deque(maxlen=settings.ANALYTICS_RECENT_ITEMS)
 
 def generate_suggested_questions(context: str) -> List[str]:
     """
@@ -24,77 +40,283 @@ def generate_suggested_questions(context: str) -> List[str]:
     ]
     return suggestions[:3]
 
-@router.post("/chat", response_model=ChatResponse)
-async def enhanced_chat(request: ChatRequest):
+class ChatTurn:
     """
-    Enhanced chat endpoint with LLM-powered responses and conversation memory
+    State carried from retrieval to the end of a single chat turn
+    """
+    def __init__(self, session_id: str, index_version: int):
+        self.session_id = session_id
+        self.index_version = index_version
+        self.query_embedding: List[float] = []
+        self.cached: Optional[CachedAnswer] = None
+        self.search_results = []
+        self.course: Optional[str] = None
+        self.route: Optional[RouteDecision] = None
+        # Answers that continue a session's LLM context are specific to it
+        # and must neither be served from nor stored in the shared cache
+        self.continues_session = False
+        self.started = time.perf_counter()
+
+    @property
+    def cache_scope(self) -> str:
+        return course_key(self.course) or ""
+
+    @property
+    def extractive_answer(self) -> Optional[str]:
+        return self.route.answer if self.route is not None else None
+
+    @property
+    def answer_path(self) -> str:
+        """
+        How the answer was produced: "cache", "extractive" or "llm"
+        """
+        if self.cached is not None:
+            return "cache"
+        return "extractive" if self.extractive_answer else "llm"
+
+async def _start_turn(request: ChatRequest) -> ChatTurn:
+    """
+    Record the user message, then answer from the cache or retrieve
+    supporting documents for a chat turn
     """
     # Generate or retrieve session ID
     session_id = request.session_id or str(uuid.uuid4())
     
-    # Retrieve conversation history
-    if session_id not in conversations:
-        conversations[session_id] = []
-    
     # Add user message to history
-    conversations[session_id].append(
-        ChatMessage(role="user", content=request.query)
-    )
+    await conversation_store.aappend(session_id, ChatMessage(role="user", content=request.query))
     
     # Build context from conversation history
     conversation_context = "\n".join([
         f"{msg.role}: {msg.content}" 
-        for msg in conversations[session_id][-5:]  # Last 5 messages
+        for msg in await conversation_store.arecent(session_id, 5)  # Last 5 messages
     ])
     
-    # Search knowledge base with context if provided
-    context_filter = {}
-    if request.role == "student" and request.course:
-         # In a real vector DB, we would filter by metadata
-         # context_filter = {"course": request.course}
-         pass
-
-    search_results = rag_service.search(request.query, k=3)
-    
-    # Get LLM service
-    llm_service = get_llm_service()
-    
-    if not search_results:
-        # No context available - use LLM to generate general response
-        answer = llm_service.generate_simple_answer(request.query)
-        sources = []
-    else:
-        # Combine search results into context
-        context_text = "\n\n".join([
-            f"Document {i+1}:\n{doc.page_content}" 
-            for i, doc in enumerate(search_results)
-        ])
-        
-        # Use LLM to generate coherent answer from context
-        answer = llm_service.generate_answer(request.query, context_text)
-        
-        # Extract sources
-        sources = [
-            {
-                "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
-                "metadata": str(doc.metadata)
-            }
-            for doc in search_results
-        ]
+    # Capture the index version before retrieval so answers generated from a
+    # stale index are never cached
+    turn = ChatTurn(session_id, rag_service.index_version)
+    # Restrict retrieval (and cached answers) to the requested course; a
+    # course without indexed material is searched, and cached, as all courses
+    turn.course = await rag_service.aresolve_course(request.course)
+    turn.continues_session = get_llm_service().continues_session(session_id)
     
+    # Embedding + FAISS search are CPU-bound; they run micro-batched on
+    # background threads so the event loop only awaits the results
+    with track_stage("chat.embedding"):
+        turn.query_embedding = await rag_service.aembed_query(request.query)
+    if not turn.continues_session:
+        with track_stage("chat.cache_lookup"):
+            turn.cached = answer_cache.lookup(turn.query_embedding, turn.index_version, scope=turn.cache_scope)
+    if turn.cached is None:
+        with track_stage("chat.search"):
+            hits = await rag_service.asearch_by_vector(
+                turn.query_embedding, k=3, course=turn.course, query=request.query, with_distances=True
+            )
+        turn.search_results = [doc for doc, _ in hits]
+        # Answer directly from the retrieved text when it clearly contains
+        # the answer, saving an LLM generation
+        if hits:
+            with track_stage("chat.route"):
+                turn.route = await answer_router.route(request.query, turn.query_embedding, hits)
+    return turn
+
+def _build_context(search_results) -> str:
+    """
+    Combine search results into the context passed to the LLM
+    """
+    return "\n\n".join([
+        f"Document {i+1}:\n{doc.page_content}" 
+        for i, doc in enumerate(search_results)
+    ])
+
+def _build_sources(search_results) -> List[Dict[str, str]]:
+    """
+    Extract sources shown alongside the answer
+    """
+    return [
+        {
+            "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content,
+            "metadata": str(doc.metadata)
+        }
+        for doc in search_results
+    ]
+
+async def _finish_turn(turn: ChatTurn, answer: str, sources: List[Dict[str, str]], failed: bool = False) -> List[str]:
+    """
+    Record the assistant message, cache fresh answers and return suggested
+    follow-up questions. The (partial) answer of a `failed` generation is
+    recorded but never cached.
+    """
     # Add assistant response to history
-    conversations[session_id].append(
+    await conversation_store.aappend(
+        turn.session_id,
         ChatMessage(role="assistant", content=answer, sources=[s["metadata"] for s in sources])
     )
     
+    if (
+        not failed
+        and turn.cached is None
+        and not turn.continues_session
+        and answer
+        and answer not in (ANSWER_ERROR_MESSAGE, SIMPLE_ANSWER_ERROR_MESSAGE)
+    ):
+        answer_cache.store(turn.query_embedding, answer, sources, turn.index_version, scope=turn.cache_scope)
+    
+    elapsed = time.perf_counter() - turn.started
+    analytics.record_answer(elapsed * 1000, turn.answer_path)
+    observe_stage(f"chat.answer.{turn.answer_path}", elapsed)
+    
     # Generate suggested questions
-    suggested_questions = generate_suggested_questions(answer)
+    return generate_suggested_questions(answer)
+
+def _service_busy(reason: str) -> HTTPException:
+    """
+    Build the 503 returned when no generation slot is available
+    """
+    return HTTPException(
+        status_code=503,
+        detail=f"Chat service is busy, please retry shortly ({reason})",
+        headers={"Retry-After": "5"}
+    )
+
+def _sse_event(event: str, data: Dict) -> str:
+    """
+    Format a Server-Sent Events message
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _generate(request: ChatRequest, turn: ChatTurn):
+    """
+    Generate an answer with the LLM once a generation slot is available
+    """
+    # Get LLM service
+    llm_service = get_llm_service()
+    
+    try:
+        with track_stage("chat.generation_queue"):
+            await generation_limiter.acquire()
+    except GenerationQueueFull as e:
+        raise _service_busy(str(e))
+    try:
+        if not turn.search_results:
+            # No context available - use LLM to generate general response
+            result = await llm_service.agenerate(request.query, session_id=turn.session_id)
+            sources = []
+        else:
+            # Use LLM to generate coherent answer from context
+            result = await llm_service.agenerate(
+                request.query, _build_context(turn.search_results), session_id=turn.session_id
+            )
+            sources = _build_sources(turn.search_results)
+    finally:
+        generation_limiter.release()
+    return result.text, sources, result.timings
+
+@router.post("/chat", response_model=ChatResponse)
+async def enhanced_chat(request: ChatRequest):
+    """
+    Enhanced chat endpoint with LLM-powered responses and conversation memory
+    """
+    with track_stage("chat.total"):
+        turn = await _start_turn(request)
+        
+        if turn.cached is not None:
+            answer, sources, timings = turn.cached.answer, turn.cached.sources, None
+        elif turn.extractive_answer:
+            answer, sources, timings = turn.extractive_answer, _build_sources(turn.search_results), None
+        else:
+            answer, sources, timings = await _generate(request, turn)
+        
+        suggested_questions = await _finish_turn(turn, answer, sources)
     
     return ChatResponse(
         answer=answer,
         sources=sources,
         suggested_questions=suggested_questions,
-        session_id=session_id
+        session_id=turn.session_id,
+        timings=timings,
+        answer_path=turn.answer_path
+    )
+
+@router.post("/chat/stream")
+async def stream_chat(request: ChatRequest):
+    """
+    Streaming variant of the chat endpoint using Server-Sent Events.
+    
+    Emits a `sources` event as soon as retrieval finishes, then one `token`
+    event per generated chunk (a single one for cached and extractive
+    answers), and finally a `done` event with the session ID, suggested
+    questions, LLM timings and the answer path. A generation that fails
+    ends the stream with an `error` event instead of `done`.
+    """
+    turn = await _start_turn(request)
+    
+    if turn.cached is not None:
+        tokens = None
+        answer = turn.cached.answer
+        sources = turn.cached.sources
+    elif turn.extractive_answer:
+        tokens = None
+        answer = turn.extractive_answer
+        sources = _build_sources(turn.search_results)
+    else:
+        # Reject up front while the wait queue is full so overload is a clean
+        # 503 rather than an error event in the middle of a stream
+        if generation_limiter.is_saturated():
+            raise _service_busy("generation queue is full")
+        
+        llm_service = get_llm_service()
+        if not turn.search_results:
+            tokens = llm_service.astream(request.query, session_id=turn.session_id)
+            sources = []
+        else:
+            tokens = llm_service.astream(
+                request.query, _build_context(turn.search_results), session_id=turn.session_id
+            )
+            sources = _build_sources(turn.search_results)
+    
+    async def event_stream() -> AsyncIterator[str]:
+        yield _sse_event("sources", {"session_id": turn.session_id, "sources": sources})
+        
+        if tokens is None:
+            full_answer = answer
+            yield _sse_event("token", {"token": full_answer})
+        else:
+            try:
+                with track_stage("chat.generation_queue"):
+                    await generation_limiter.acquire()
+            except GenerationQueueFull as e:
+                yield _sse_event("error", {"detail": f"Chat service is busy, please retry shortly ({e})"})
+                return
+            
+            parts = []
+            try:
+                async for token in tokens:
+                    if not parts:
+                        observe_stage("chat.first_token", time.perf_counter() - turn.started)
+                    parts.append(token)
+                    yield _sse_event("token", {"token": token})
+            finally:
+                generation_limiter.release()
+            full_answer = "".join(parts).strip()
+            
+            if tokens.error is not None:
+                await _finish_turn(turn, full_answer, sources, failed=True)
+                yield _sse_event("error", {"detail": tokens.error})
+                return
+        
+        # Store the full answer once generation has finished
+        suggested_questions = await _finish_turn(turn, full_answer, sources)
+        yield _sse_event("done", {
+            "session_id": turn.session_id,
+            "suggested_questions": suggested_questions,
+            "timings": tokens.timings if tokens is not None else None,
+            "answer_path": turn.answer_path
+        })
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
 @router.delete("/chat/{session_id}")
@@ -102,8 +324,8 @@ async def clear_conversation(session_id: str):
     """
     Clear conversation history for a session
     """
-    if session_id in conversations:
-        del conversations[session_id]
+    await conversation_store.adelete(session_id)
+    get_llm_service().forget_session(session_id)
     return {"status": "cleared", "session_id": session_id}
 
 @router.post("/chat/feedback")
@@ -115,8 +337,9 @@ async def submit_feedback(feedback: ChatFeedback):
         "session_id": feedback.session_id,
         "type": feedback.feedback_type,
         "comment": feedback.comment,
-        "timestamp": "now" # In real app use datetime.now()
+        "timestamp": datetime.now().isoformat()
     }
     feedback_store.append(feedback_entry)
+    analytics.record_feedback(feedback.feedback_type)
     print(f"Feedback received: {feedback_entry}")
     return {"status": "received", "thank_you": True}
@@ -1,7 +1,7 @@
 import shutil
 import os
-from typing import Any
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from app import schemas
 from app.services.rag_service import rag_service
 from app.api.v1 import auth
@@ -14,10 +14,12 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 @router.post("/upload", response_model=schemas.DocumentResponse)
 async def upload_document(
     file: UploadFile = File(...),
+    course: Optional[str] = Form(None),
     # current_user: models.User = Depends(auth.get_current_active_user) # TODO: Enable auth
 ) -> Any:
     """
-    Upload a PDF document and ingest it into the RAG system.
+    Upload a PDF document and ingest it into the RAG system, optionally
+    tagged with the course it belongs to.
     """
     if file.content_type != "application/pdf":
         raise HTTPException(status_code=400, detail="Only PDF files are supported")
@@ -32,7 +34,7 @@ async def upload_document(
 
     # Ingest into RAG
     try:
-        chunks = rag_service.ingest_file(file_path)
+        chunks = rag_service.ingest_file(file_path, course=course)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"RAG Ingestion failed: {str(e)}")
 
@@ -44,6 +46,6 @@ async def upload_document(
     }
 
 @router.post("/query")
-def query_knowledge_base(query: str):
-    results = rag_service.search(query)
+def query_knowledge_base(query: str, course: Optional[str] = None):
+    results = rag_service.search(query, course=course)
     return [{"content": doc.page_content, "metadata": doc.metadata} for doc in results]
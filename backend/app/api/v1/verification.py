@@ -1,40 +1,104 @@
+import asyncio
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from app.schemas.verification import VerificationReport
-from app.services.verification_service import verification_service
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from app.schemas.verification import VerificationReport, VerificationJobStatus
+from app.services.verification_jobs import VerificationQueueFull, verification_jobs
 
 router = APIRouter()
 
-@router.post("/verify-document", response_model=VerificationReport)
-async def verify_document(file: UploadFile = File(...)):
+ALLOWED_CONTENT_TYPES = ["image/jpeg", "image/png", "image/jpg", "application/pdf"]
+
+async def _read_document(file: UploadFile) -> bytes:
     """
-    Verify the authenticity of a scanned document (marksheet, certificate, etc.)
-    using OCR and anomaly detection
+    Validate the upload type and read its bytes
     """
-    # Validate file type
-    if file.content_type not in ["image/jpeg", "image/png", "image/jpg", "application/pdf"]:
+    if file.content_type not in ALLOWED_CONTENT_TYPES:
         raise HTTPException(
             status_code=400,
             detail="Only image files (JPG, PNG) and PDFs are supported"
         )
+    return await file.read()
+
+async def _submit(image_bytes: bytes):
+    """
+    Queue a verification job, or 503 when the OCR queue is full
+    """
+    try:
+        # Hashing, cache lookups and reading the PDF block; keep them off the event loop
+        return await asyncio.to_thread(verification_jobs.submit, image_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except VerificationQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"Verification service is busy, please retry shortly ({e})",
+            headers={"Retry-After": "10"}
+        )
+
+def _get_job(job_id: str):
+    job = verification_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Verification job {job_id} not found")
+    return job
+
+@router.post("/verify-document", response_model=VerificationReport)
+async def verify_document(file: UploadFile = File(...)):
+    """
+    Verify the authenticity of a scanned document (marksheet, certificate, etc.)
+    using OCR and anomaly detection.
+    
+    OCR runs in the worker pool (PDF pages in parallel); this endpoint waits
+    for the report. Use POST /jobs to get a job ID back immediately instead.
+    """
+    image_bytes = await _read_document(file)
+    job = await _submit(image_bytes)
     
     try:
-        # Read file bytes
-        image_bytes = await file.read()
-        
-        # Run verification
-        report = verification_service.verify_document(image_bytes)
-        
-        # Submit to workflow queue for manual review
-        case_id = verification_service.submit_to_queue(report)
-        report['case_id'] = case_id
-        
-        return report
-        
+        report = await verification_jobs.wait(job)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Verification failed: {str(e)}"
         )
+    
+    # The completed job was submitted to the manual review queue under its ID
+    report['case_id'] = job.job_id
+    return report
+
+@router.post("/jobs", response_model=VerificationJobStatus, status_code=202)
+async def submit_verification_job(file: UploadFile = File(...)):
+    """
+    Queue a document for verification and return its job (and case) ID
+    right away; poll GET /jobs/{job_id} for progress
+    """
+    image_bytes = await _read_document(file)
+    job = await _submit(image_bytes)
+    return verification_jobs.status(job)
+
+@router.get("/jobs/{job_id}", response_model=VerificationJobStatus)
+def get_verification_job(job_id: str):
+    """
+    Get the status of a verification job
+    """
+    return verification_jobs.status(_get_job(job_id))
+
+@router.get("/jobs/{job_id}/result", response_model=VerificationReport)
+def get_verification_result(job_id: str):
+    """
+    Get the report of a finished verification job. Returns 202 with the job
+    status while it is still queued or running.
+    """
+    job = _get_job(job_id)
+    if not job.finished:
+        return JSONResponse(
+            status_code=202,
+            content=jsonable_encoder(verification_jobs.status(job)),
+            headers={"Retry-After": "2"}
+        )
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Verification failed: {job.error}")
+    return {**job.report, "case_id": job.job_id}
 
 @router.get("/verification/health")
 def check_ocr_health():
@@ -47,7 +111,8 @@ def check_ocr_health():
             "status": "operational",
             "ocr_engine": "PaddleOCR",
             "languages_supported": ["en"],
-            "message": "Document verification service is ready"
+            "message": "Document verification service is ready",
+            "workers": verification_jobs.stats()
         }
     except Exception as e:
         return {
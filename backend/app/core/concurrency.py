@@ -0,0 +1,163 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Generic, List, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class GenerationQueueFull(Exception):
+    """
+    Raised when a request cannot get a generation slot because the wait
+    queue is full or the wait timed out
+    """
+
+
+class GenerationLimiter:
+    """
+    Caps the number of in-flight LLM generations. Requests beyond the cap
+    wait in a bounded FIFO queue instead of piling up on the backend.
+    """
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.in_flight = 0
+        self.waiting = 0
+
+    def is_saturated(self) -> bool:
+        """
+        True when all slots are busy and the wait queue is full
+        """
+        return self._semaphore.locked() and self.waiting >= self.max_queued
+
+    async def acquire(self) -> None:
+        """
+        Wait for a generation slot, raising GenerationQueueFull if the queue
+        is already full or the slot does not free up within the timeout
+        """
+        if self.is_saturated():
+            raise GenerationQueueFull(
+                f"{self.waiting} requests already waiting for a generation slot"
+            )
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise GenerationQueueFull(
+                f"No generation slot became free within {self.queue_timeout}s"
+            )
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_queued": self.max_queued,
+        }
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Collects items submitted concurrently from many callers and processes
+    them together in a single call.
+
+    A background thread takes the first waiting item, keeps collecting until
+    `max_batch_size` items are gathered or `max_wait_ms` has passed, then
+    calls `process_batch` once with the whole batch. `process_batch` must
+    return one result per item, in order.
+    """
+    def __init__(
+        self,
+        process_batch: Callable[[List[T]], List[R]],
+        max_batch_size: int,
+        max_wait_ms: float,
+        name: str = "micro-batcher",
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[Tuple[T, Future]]" = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.items = 0
+
+    def submit_future(self, item: T) -> "Future[R]":
+        """
+        Queue an item and return a future for its result
+        """
+        self._ensure_worker()
+        future: "Future[R]" = Future()
+        self._queue.put((item, future))
+        return future
+
+    def submit(self, item: T) -> R:
+        """
+        Queue an item and block until its batch has been processed
+        """
+        return self.submit_future(item).result()
+
+    async def asubmit(self, item: T) -> R:
+        """
+        Queue an item and await its result without tying up a thread
+        """
+        return await asyncio.wrap_future(self.submit_future(item))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    else:
+                        # Still take anything that is already waiting
+                        batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            futures = [future for _, future in batch]
+            try:
+                results = self.process_batch([item for item, _ in batch])
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.items += len(batch)
+            for future, result in zip(futures, results):
+                future.set_result(result)
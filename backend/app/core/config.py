@@ -14,7 +14,10 @@ class Settings(BaseSettings):
         "http://localhost:5174"
     ]
 
-    @validator("BACKEND_CORS_ORIGINS", pre=True)
+    @validator(
+        "BACKEND_CORS_ORIGINS", "AUTO_LEARN_WATCH_DIRECTORIES", "LLM_BACKENDS",
+        "WARMUP_COMPONENTS", "READINESS_REQUIRED_COMPONENTS", pre=True
+    )
     def assemble_cors_origins(cls, v: Union[str, List[str]]) -> List[str]:
         if isinstance(v, str) and not v.startswith("["):
             return [i.strip() for i in v.split(",")]
@@ -35,6 +38,159 @@ class Settings(BaseSettings):
             return v
         return f"postgresql://{values.get('POSTGRES_USER')}:{values.get('POSTGRES_PASSWORD')}@{values.get('POSTGRES_SERVER')}/{values.get('POSTGRES_DB')}"
 
+    # Embeddings: torch (sentence-transformers), onnx or onnx_int8 (ONNX Runtime),
+    # or hash (offline feature hashing for benchmarks, no semantic quality).
+    # An index built by another backend is checked on load and re-embedded
+    # if its vectors disagree with the current model
+    EMBEDDING_BACKEND: str = "torch"
+    EMBEDDING_ONNX_DIR: str = "models/all-MiniLM-L6-v2-onnx"
+    EMBEDDING_BATCH_SIZE: int = 32
+    EMBEDDING_THREADS: int = 0  # 0 = ONNX Runtime default
+    EMBEDDING_COMPAT_MIN_COSINE: float = 0.98
+    EMBEDDING_COMPAT_SAMPLE: int = 32
+    EMBEDDING_REEMBED_ON_MISMATCH: bool = True
+
+    # Ollama generation
+    OLLAMA_BASE_URL: str = "http://localhost:11434"
+    LLM_MODEL: str = "gemma3:1b"
+    LLM_TEMPERATURE: float = 0.7
+    LLM_NUM_PREDICT: int = 512
+    LLM_NUM_CTX: int = 4096
+    LLM_KEEP_ALIVE: str = "30m"
+    LLM_REQUEST_TIMEOUT_SECONDS: float = 120.0
+    # Continue each chat session from its previous Ollama context
+    LLM_SESSION_CONTEXT_ENABLED: bool = True
+    LLM_SESSION_CONTEXT_MAX_SESSIONS: int = 512
+    LLM_SESSION_CONTEXT_TTL_SECONDS: float = 1800.0
+    # Backend pool: "url[|model[|max_concurrent]]" entries, e.g.
+    # LLM_BACKENDS='["http://box1:11434", "http://box2:11434|gemma3:1b|1"]'.
+    # Empty = a single backend at OLLAMA_BASE_URL running LLM_MODEL
+    LLM_BACKENDS: List[str] = []
+    LLM_BACKEND_MAX_CONCURRENT: int = 2
+    LLM_BACKEND_EJECT_AFTER_FAILURES: int = 3
+    LLM_BACKEND_EJECTION_SECONDS: float = 30.0
+    LLM_HEALTH_CHECK_INTERVAL_SECONDS: float = 10.0  # 0 = passive checks only
+
+    # Chat pipeline
+    LLM_MAX_CONCURRENT_GENERATIONS: int = 4
+    LLM_MAX_QUEUED_GENERATIONS: int = 64
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 60.0
+
+    # Query embedding / search micro-batching
+    QUERY_BATCH_MAX_SIZE: int = 32
+    QUERY_BATCH_MAX_WAIT_MS: float = 5.0
+
+    # FAISS index persistence
+    INDEX_COMPACTION_SEGMENTS: int = 32
+    INDEX_COMPACTION_INTERVAL_SECONDS: float = 300.0
+    # memory: every process loads a private copy of the index and
+    # docstore; extra workers only see each other's new documents after a
+    # restart, and only the first (leader) watches directories and compacts.
+    # mmap: workers memory-map the base snapshot and read chunks from its
+    # SQLite chunk store, sharing both through the page cache, so a host can
+    # run one uvicorn worker per core; changes since the snapshot are synced
+    # from the segment log every INDEX_SYNC_INTERVAL_SECONDS
+    INDEX_SERVING_MODE: str = "memory"
+    INDEX_SYNC_INTERVAL_SECONDS: float = 2.0
+
+    # Bulk ingestion (auto-learning): 0 parse workers = one per core minus one
+    INGEST_PARSE_WORKERS: int = 0
+    INGEST_EMBED_BATCH_SIZE: int = 512
+
+    # Directory watching for auto-learning: auto (inotify, else polling), inotify, poll or off
+    AUTO_LEARN_WATCH_DIRECTORIES: List[str] = []
+    AUTO_LEARN_WATCHER: str = "auto"
+    AUTO_LEARN_DEBOUNCE_SECONDS: float = 2.0
+    AUTO_LEARN_POLL_INTERVAL_SECONDS: float = 30.0
+    # Tag files under <watched dir>/<course>/ with that course
+    AUTO_LEARN_COURSE_FROM_DIRECTORY: bool = True
+
+    # Vector index type: flat, ivf_flat, hnsw, ivf_pq or ivf_sq8. Non-flat
+    # indexes are built in the background once the corpus reaches the threshold
+    VECTOR_INDEX_TYPE: str = "flat"
+    VECTOR_INDEX_REBUILD_THRESHOLD: int = 50000
+    VECTOR_INDEX_RETRAIN_GROWTH: float = 4.0
+    VECTOR_INDEX_NLIST: int = 0  # 0 = derive from corpus size
+    VECTOR_INDEX_NPROBE: int = 16
+    VECTOR_INDEX_HNSW_M: int = 32
+    VECTOR_INDEX_HNSW_EF_CONSTRUCTION: int = 80
+    VECTOR_INDEX_HNSW_EF_SEARCH: int = 64
+    VECTOR_INDEX_PQ_M: int = 48
+    VECTOR_INDEX_RECALL_SAMPLE: int = 200
+    # Rebuild non-flat indexes once this fraction of positions are deleted chunks
+    VECTOR_INDEX_TOMBSTONE_RATIO: float = 0.2
+
+    # Hybrid retrieval: dense and BM25 candidates merged by reciprocal-rank fusion
+    HYBRID_SEARCH_ENABLED: bool = True
+    HYBRID_DENSE_WEIGHT: float = 1.0
+    HYBRID_LEXICAL_WEIGHT: float = 1.0
+    HYBRID_DENSE_CANDIDATES: int = 20
+    HYBRID_LEXICAL_CANDIDATES: int = 20
+    HYBRID_RRF_K: int = 60
+    BM25_K1: float = 1.2
+    BM25_B: float = 0.75
+
+    # Conversation history: memory, sqlite or redis
+    CONVERSATION_BACKEND: str = "memory"
+    CONVERSATION_MAX_MESSAGES: int = 20
+    CONVERSATION_TTL_SECONDS: float = 7200.0
+    CONVERSATION_MAX_MEMORY_MB: int = 64
+    CONVERSATION_SQLITE_PATH: str = "conversations.db"
+    REDIS_URL: str = "redis://localhost:6379/0"
+
+    # Semantic answer cache
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_SIMILARITY_THRESHOLD: float = 0.95
+    ANSWER_CACHE_MAX_ENTRIES: int = 2048
+    ANSWER_CACHE_TTL_SECONDS: float = 3600.0
+    ANSWER_CACHE_MAX_MEMORY_MB: int = 64
+
+    # Extractive fast path: answer straight from the retrieved chunks, without
+    # the LLM, when the best chunk and sentence match the question closely
+    ANSWER_ROUTER_ENABLED: bool = True
+    ANSWER_ROUTER_MIN_RETRIEVAL_SIMILARITY: float = 0.55  # query vs chunk cosine
+    ANSWER_ROUTER_MIN_SPAN_SCORE: float = 0.7  # mean of sentence cosine and query term coverage
+    ANSWER_ROUTER_MAX_CHUNKS: int = 2
+    ANSWER_ROUTER_MAX_SENTENCES: int = 2
+
+    # Document verification (OCR) runs in worker processes, each holding its
+    # own PaddleOCR model
+    VERIFICATION_WORKERS: int = 2
+    VERIFICATION_MAX_QUEUED_JOBS: int = 32  # waiting beyond the running ones
+    VERIFICATION_THREADS_PER_WORKER: int = 0  # 0 = cores / workers
+    VERIFICATION_JOB_RETENTION: int = 1000  # finished jobs kept for polling
+    # Scans are downsized to this longest side (pixels) before OCR; larger
+    # images only slow PaddleOCR down
+    VERIFICATION_MAX_IMAGE_SIDE: int = 2000
+    VERIFICATION_PDF_DPI: int = 200
+    VERIFICATION_PDF_MAX_PAGES: int = 10  # later pages are not rasterized
+    # Reports of previously verified uploads, keyed by content hash
+    OCR_CACHE_ENABLED: bool = True
+    OCR_CACHE_PATH: str = "ocr_cache.db"
+    OCR_CACHE_MAX_MB: int = 256
+    OCR_CACHE_NEAR_DUPLICATE_DISTANCE: int = 6  # dHash bits; -1 = no near-duplicate matching
+
+    # Verification review cases (SQLite, survives restarts)
+    VERIFICATION_CASE_DB_PATH: str = "verification_cases.db"
+    VERIFICATION_QUEUE_PAGE_SIZE: int = 50
+    VERIFICATION_QUEUE_MAX_PAGE_SIZE: int = 500
+
+    # Usage analytics (in-memory time buckets)
+    ANALYTICS_MINUTE_BUCKETS: int = 1440  # last 24 hours per minute
+    ANALYTICS_HOUR_BUCKETS: int = 720  # last 30 days per hour
+    ANALYTICS_DAY_BUCKETS: int = 400  # last ~13 months per day
+    ANALYTICS_TOP_QUERIES: int = 50  # query frequency sketch size per hour/day bucket
+    ANALYTICS_RECENT_ITEMS: int = 500  # uploads and feedback entries kept for listing
+
+    # Startup: the embedding model and index (rag), the LLM and the OCR
+    # workers are loaded by background warm-up tasks once the app starts,
+    # never at import time. /ready answers 503 until the required ones are
+    # warm; components not warmed up load on first use instead
+    WARMUP_ENABLED: bool = True
+    WARMUP_COMPONENTS: List[str] = ["rag", "llm", "ocr"]
+    WARMUP_RETRY_SECONDS: float = 15.0  # 0 = don't retry failed warm-ups
+    READINESS_REQUIRED_COMPONENTS: List[str] = ["rag"]
+
     # Security
     SECRET_KEY: str = "CHANGEME_IN_PRODUCTION_SECRET_KEY_12345"
     ALGORITHM: str = "HS256"
@@ -0,0 +1,89 @@
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from app.core.metrics import registry
+
+# pending: warm-up scheduled; lazy: loads on first use (no warm-up);
+# disabled: not used by this deployment
+COMPONENT_STATES = ("pending", "lazy", "loading", "ready", "failed", "disabled")
+SERVING_STATES = ("lazy", "ready", "disabled")
+
+
+class ReadinessTracker:
+    """
+    Startup state of the heavy components (embedding model and index, LLM,
+    OCR workers) for the /ready probe. /health only says the process is up;
+    /ready says whether the components traffic depends on are loaded, so a
+    pod only receives requests once they no longer pay for initialization.
+    """
+    def __init__(self):
+        self._components: Dict[str, Dict] = {}
+        self._required: tuple = ()
+        self._lock = threading.Lock()
+
+    def configure(self, components: Dict[str, str], required: Iterable[str]) -> None:
+        """
+        Register the components at startup with their initial states; only
+        the required ones gate readiness
+        """
+        with self._lock:
+            self._required = tuple(required)
+            for name, state in components.items():
+                self._components[name] = {"state": state}
+
+    def _set(self, name: str, state: str, detail: Optional[str] = None) -> None:
+        now = time.time()
+        with self._lock:
+            component = self._components.setdefault(name, {"state": "lazy"})
+            if state == "loading":
+                # A warm-up step may start a nested load of the same component
+                if component["state"] != "loading":
+                    component["started_at"] = now
+                    component["seconds"] = None
+            elif component["state"] == "loading" and "started_at" in component:
+                component["seconds"] = round(now - component["started_at"], 3)
+            component["state"] = state
+            component["detail"] = detail
+            component["updated_at"] = now
+
+    def loading(self, name: str) -> None:
+        self._set(name, "loading")
+
+    def ready(self, name: str, detail: Optional[str] = None) -> None:
+        self._set(name, "ready", detail)
+
+    def failed(self, name: str, error: Exception) -> None:
+        self._set(name, "failed", (str(error).strip().splitlines() or [type(error).__name__])[0])
+
+    def disabled(self, name: str, detail: Optional[str] = None) -> None:
+        self._set(name, "disabled", detail)
+
+    def status(self) -> Dict:
+        with self._lock:
+            components = {
+                name: {
+                    "state": component["state"],
+                    "required": name in self._required,
+                    "detail": component.get("detail"),
+                    "seconds": component.get("seconds"),
+                    "updated_at": datetime.fromtimestamp(component["updated_at"]).isoformat(timespec="seconds")
+                    if "updated_at" in component else None,
+                }
+                for name, component in self._components.items()
+            }
+        ready = all(components.get(name, {"state": "pending"})["state"] in SERVING_STATES for name in self._required)
+        return {"status": "ready" if ready else "starting", "components": components}
+
+
+readiness = ReadinessTracker()
+
+
+def _collect_metrics():
+    for name, component in readiness.status()["components"].items():
+        yield "dabba_component_ready", "gauge", "1 when the component is loaded (or loads lazily)", {"component": name}, int(
+            component["state"] in SERVING_STATES
+        )
+
+registry.add_collector(_collect_metrics)
@@ -1,13 +1,44 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.metrics import registry
+from app.core.readiness import readiness
 
 from app.api.api import api_router
+from app.services.auto_learner import auto_learner
+from app.services.llm_service import close_llm_service
+from app.services.rag_service import rag_service
+from app.services.verification_jobs import verification_jobs
+from app.services.warmup import configure_readiness, warm_up
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Models, index and OCR workers load in the background: the server
+    # binds right away and /ready reports when they are warm
+    configure_readiness()
+    # With several workers only the leader watches directories, so every
+    # new file is ingested once
+    leader = rag_service.claim_leadership()
+    warmup_task = asyncio.create_task(warm_up()) if settings.WARMUP_ENABLED else None
+    if leader:
+        auto_learner.start_watching()
+    else:
+        print("Directory watching runs in the index leader worker")
+    yield
+    if warmup_task is not None:
+        warmup_task.cancel()
+    auto_learner.stop_watching()
+    await close_llm_service()
+    verification_jobs.shutdown()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.PROJECT_VERSION,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan
 )
 
 # Set all CORS enabled origins
@@ -18,6 +49,7 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Total-Count"],
     )
 
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -29,3 +61,20 @@ def root():
 @app.get("/health")
 def health_check():
     return {"status": "healthy"}
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Readiness probe: 200 once the required components are warm, 503 while
+    they are still loading (or failed), with each component's state
+    """
+    status = readiness.status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Stage latencies, counters, queue depths and in-flight counts in the
+    Prometheus text exposition format
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict
+from typing import Any, List, Optional, Dict
 from pydantic import BaseModel
 
 class ChatMessage(BaseModel):
@@ -19,6 +19,8 @@ class ChatResponse(BaseModel):
     sources: List[Dict[str, str]]
     suggested_questions: List[str]
     session_id: str
+    timings: Optional[Dict[str, Any]] = None  # LLM prompt-eval vs generation timings
+    answer_path: Optional[str] = None  # "cache", "extractive" or "llm"
 
 class ChatFeedback(BaseModel):
     session_id: str
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+from datetime import datetime
 
 class VerificationReport(BaseModel):
     status: str  # "verified", "suspicious", "error"
@@ -9,3 +10,19 @@ class VerificationReport(BaseModel):
     issues: List[str]
     extracted_text: str
     details: List[Dict] = []
+    case_id: Optional[str] = None
+    pages: Optional[List[Dict]] = None  # per-page summary for PDFs
+    total_pages: Optional[int] = None
+    perceptual_hash: Optional[str] = None  # dHash of image scans
+    near_duplicates: Optional[List[Dict]] = None  # similar previously verified scans
+    cache: Optional[Dict] = None  # set when the report came from the OCR cache
+
+class VerificationJobStatus(BaseModel):
+    job_id: str
+    case_id: str  # review queue case created when the job completes
+    status: str  # "queued", "running", "completed", "failed"
+    queue_position: Optional[int] = None  # jobs ahead of this one while queued
+    submitted_at: datetime
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    pages: Optional[int] = None  # page count for PDFs
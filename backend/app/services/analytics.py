@@ -0,0 +1,386 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+
+# Latency histogram bin upper bounds (ms): 1ms to ~10min, 20% apart, so a
+# percentile read from the histogram is within 20% of the exact value
+LATENCY_BOUNDS_MS: List[float] = [1.2 ** i for i in range(74)]
+PERCENTILES = (50, 90, 95, 99)
+FEEDBACK_TYPES = ("thumbs_up", "thumbs_down")
+MAX_QUERY_CHARS = 200
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())[:MAX_QUERY_CHARS]
+
+
+def local_seconds(timestamp: float) -> float:
+    """
+    Unix timestamp shifted by the local UTC offset in effect at that
+    moment, so bucket boundaries fall on local hours and midnights on both
+    sides of a daylight saving change
+    """
+    return timestamp + time.localtime(timestamp).tm_gmtoff
+
+
+class _CountGroup:
+    """
+    Keys of a Space-Saving sketch that share one count, a node in the
+    sketch's list of groups ordered by count
+    """
+    __slots__ = ("count", "keys", "prev", "next")
+
+    def __init__(self, count: int):
+        self.count = count
+        self.keys: Dict[str, None] = {}  # insertion-ordered set
+        self.prev: Optional["_CountGroup"] = None
+        self.next: Optional["_CountGroup"] = None
+
+
+class SpaceSavingSketch:
+    """
+    Approximate top-k counter (Space-Saving) holding at most `capacity`
+    keys. A key's count may be overestimated by at most its recorded error,
+    and any key seen more than total/capacity times is always present.
+
+    Keys are grouped by count in a linked list ordered from the smallest
+    count up (the stream-summary structure), so finding the key to evict
+    and moving a key to its next count are both O(1).
+    """
+    __slots__ = ("capacity", "_group_of", "_errors", "_smallest")
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._group_of: Dict[str, _CountGroup] = {}
+        self._errors: Dict[str, int] = {}
+        self._smallest: Optional[_CountGroup] = None
+
+    def add(self, key: str) -> None:
+        group = self._group_of.get(key)
+        if group is not None:
+            self._increment(key, group)
+            return
+        if len(self._group_of) < self.capacity:
+            smallest = self._smallest
+            if smallest is None or smallest.count != 1:
+                smallest = self._link(_CountGroup(1), None)
+            smallest.keys[key] = None
+            self._group_of[key] = smallest
+            self._errors[key] = 0
+            return
+        # Replace the oldest key with the smallest count; the newcomer
+        # inherits that count as its error
+        smallest = self._smallest
+        victim = next(iter(smallest.keys))
+        del smallest.keys[victim], self._group_of[victim], self._errors[victim]
+        smallest.keys[key] = None
+        self._group_of[key] = smallest
+        self._errors[key] = smallest.count
+        self._increment(key, smallest)
+
+    def items(self) -> Iterator[Tuple[str, int, int]]:
+        """
+        (key, count, error) of every tracked key
+        """
+        for key, group in self._group_of.items():
+            yield key, group.count, self._errors[key]
+
+    def _increment(self, key: str, group: _CountGroup) -> None:
+        target = group.next
+        if target is None or target.count != group.count + 1:
+            target = self._link(_CountGroup(group.count + 1), group)
+        del group.keys[key]
+        target.keys[key] = None
+        self._group_of[key] = target
+        if not group.keys:
+            self._unlink(group)
+
+    def _link(self, group: _CountGroup, after: Optional[_CountGroup]) -> _CountGroup:
+        """
+        Insert `group` after `after`, or at the front when it is None
+        """
+        group.prev = after
+        group.next = after.next if after is not None else self._smallest
+        if group.next is not None:
+            group.next.prev = group
+        if after is not None:
+            after.next = group
+        else:
+            self._smallest = group
+        return group
+
+    def _unlink(self, group: _CountGroup) -> None:
+        if group.prev is not None:
+            group.prev.next = group.next
+        else:
+            self._smallest = group.next
+        if group.next is not None:
+            group.next.prev = group.prev
+
+
+class Bucket:
+    """
+    Counters, latency histogram and query sketch for one time interval
+    """
+    __slots__ = ("index", "counters", "latency", "queries")
+
+    def __init__(self, index: int):
+        self.index = index
+        self.counters: Dict[str, int] = {}
+        self.latency: Optional[List[int]] = None
+        self.queries: Optional[SpaceSavingSketch] = None
+
+
+class BucketRing:
+    """
+    The last `size` buckets of `width` seconds in a fixed array. A slot is
+    reused once its interval falls out of the window, so memory and range
+    queries are bounded by `size` whatever the traffic.
+    """
+    def __init__(self, width: int, size: int, sketch_capacity: int = 0):
+        self.width = width
+        self.size = size
+        self.sketch_capacity = sketch_capacity
+        self._slots: List[Optional[Bucket]] = [None] * size
+
+    def index(self, timestamp: float) -> int:
+        return int(timestamp // self.width)
+
+    def bucket(self, timestamp: float) -> Bucket:
+        index = self.index(timestamp)
+        slot = index % self.size
+        bucket = self._slots[slot]
+        if bucket is None or bucket.index != index:
+            bucket = Bucket(index)
+            if self.sketch_capacity:
+                bucket.queries = SpaceSavingSketch(self.sketch_capacity)
+            self._slots[slot] = bucket
+        return bucket
+
+    def covers(self, timestamp: float, now: float) -> bool:
+        return self.index(timestamp) > self.index(now) - self.size
+
+    def indices(self, start: float, end: float, now: float) -> range:
+        """
+        Indices of the retained buckets overlapping [start, end]
+        """
+        return range(max(self.index(start), self.index(now) - self.size + 1), self.index(end) + 1)
+
+    def range(self, start: float, end: float, now: float) -> Iterator[Bucket]:
+        """
+        Buckets overlapping [start, end], oldest first
+        """
+        for index in self.indices(start, end, now):
+            bucket = self._slots[index % self.size]
+            if bucket is not None and bucket.index == index:
+                yield bucket
+
+
+class AnalyticsEngine:
+    """
+    Streaming usage analytics in fixed-size time buckets.
+
+    Every event updates one bucket per resolution (minute, hour and day
+    rings) plus the all-time totals, so recording is O(1) and memory is
+    bounded. Queries and answer latencies are summarized per bucket: query
+    frequencies in a Space-Saving sketch (hour and day buckets) and
+    latencies in a log-scale histogram, both of which merge across buckets.
+    A time-range query reads at most one ring's worth of buckets, so the
+    dashboard costs the same however many events have been recorded.
+    Bucket boundaries follow the server's local time zone; ranges are
+    rounded out to whole buckets.
+    """
+    def __init__(
+        self,
+        minute_buckets: int = 1440,
+        hour_buckets: int = 720,
+        day_buckets: int = 400,
+        top_queries: int = 50,
+        recent_queries: int = 5,
+    ):
+        self.rings: Dict[str, BucketRing] = {
+            "minute": BucketRing(60, minute_buckets),
+            "hour": BucketRing(3600, hour_buckets, top_queries),
+            "day": BucketRing(86400, day_buckets, top_queries),
+        }
+        self.top_queries = top_queries
+        self._totals: Dict[str, int] = {}
+        self._recent: Deque[str] = deque(maxlen=recent_queries)
+        self._started = time.time()
+        self._lock = threading.Lock()
+
+    def record_query(self, query: str) -> None:
+        key = normalize_query(query)
+        with self._lock:
+            self._recent.append(query)
+            buckets = self._current()
+            for bucket in buckets:
+                if bucket.queries is not None and key:
+                    bucket.queries.add(key)
+            self._count(buckets, "queries")
+
+    def record_answer(self, latency_ms: float, path: str) -> None:
+        """
+        A finished chat answer, its end-to-end latency and how it was produced
+        """
+        latency_bin = min(bisect_left(LATENCY_BOUNDS_MS, latency_ms), len(LATENCY_BOUNDS_MS) - 1)
+        with self._lock:
+            buckets = self._current()
+            for bucket in buckets:
+                if bucket.latency is None:
+                    bucket.latency = [0] * len(LATENCY_BOUNDS_MS)
+                bucket.latency[latency_bin] += 1
+            self._count(buckets, "answers")
+            self._count(buckets, f"answers_{path}")
+
+    def record_upload(self, chunks: int) -> None:
+        with self._lock:
+            buckets = self._current()
+            self._count(buckets, "uploads")
+            self._count(buckets, "chunks_indexed", chunks)
+
+    def record_feedback(self, feedback_type: str) -> None:
+        counter = f"feedback_{feedback_type}" if feedback_type in FEEDBACK_TYPES else "feedback_other"
+        with self._lock:
+            self._count(self._current(), counter)
+
+    def _current(self) -> List[Bucket]:
+        """
+        The current bucket of every ring (caller holds the lock)
+        """
+        local = local_seconds(time.time())
+        return [ring.bucket(local) for ring in self.rings.values()]
+
+    def _count(self, buckets: List[Bucket], counter: str, value: int = 1) -> None:
+        for bucket in buckets:
+            bucket.counters[counter] = bucket.counters.get(counter, 0) + value
+        self._totals[counter] = self._totals.get(counter, 0) + value
+
+    def totals(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._totals)
+
+    def recent_queries(self) -> List[str]:
+        with self._lock:
+            return list(self._recent)
+
+    def count_today(self, counter: str) -> int:
+        local = local_seconds(time.time())
+        with self._lock:
+            bucket = self.rings["day"].bucket(local)
+            return bucket.counters.get(counter, 0)
+
+    def resolution_for(self, start: float, now: Optional[float] = None) -> str:
+        """
+        Finest resolution whose ring still covers `start`
+        """
+        now = now if now is not None else time.time()
+        for name, ring in self.rings.items():
+            if ring.covers(local_seconds(start), local_seconds(now)):
+                return name
+        return "day"
+
+    def _range(self, start: float, end: float, resolution: str) -> Iterator[Bucket]:
+        return self.rings[resolution].range(local_seconds(start), local_seconds(end), local_seconds(time.time()))
+
+    def summary(self, start: float, end: float, resolution: Optional[str] = None) -> Dict:
+        """
+        Totals, feedback ratio, answer latency percentiles and top queries
+        between two Unix timestamps
+        """
+        resolution = resolution or self.resolution_for(start)
+        # Query frequencies are only sketched per hour and day
+        sketch_resolution = "hour" if resolution == "minute" else resolution
+        counters: Dict[str, int] = {}
+        latency = [0] * len(LATENCY_BOUNDS_MS)
+        queries: Dict[str, List[int]] = {}
+        with self._lock:
+            for bucket in self._range(start, end, resolution):
+                for name, value in bucket.counters.items():
+                    counters[name] = counters.get(name, 0) + value
+                if bucket.latency is not None:
+                    latency = [a + b for a, b in zip(latency, bucket.latency)]
+            for bucket in self._range(start, end, sketch_resolution):
+                if bucket.queries is None:
+                    continue
+                for key, count, error in bucket.queries.items():
+                    merged = queries.setdefault(key, [0, 0])
+                    merged[0] += count
+                    merged[1] += error
+
+        up = counters.get("feedback_thumbs_up", 0)
+        down = counters.get("feedback_thumbs_down", 0)
+        top = sorted(queries.items(), key=lambda item: item[1][0], reverse=True)[:self.top_queries]
+        return {
+            "start": datetime.fromtimestamp(start).isoformat(timespec="seconds"),
+            "end": datetime.fromtimestamp(end).isoformat(timespec="seconds"),
+            "resolution": resolution,
+            "counters": counters,
+            "feedback": {
+                "thumbs_up": up,
+                "thumbs_down": down,
+                "thumbs_up_ratio": round(up / (up + down), 3) if up + down else None,
+            },
+            "latency_ms": percentiles(latency),
+            "top_queries": [
+                {"query": key, "count": count, "max_overcount": error} for key, (count, error) in top
+            ],
+        }
+
+    def series(self, counter: str, start: float, end: float, resolution: Optional[str] = None) -> Dict:
+        """
+        Per-bucket values of one counter between two Unix timestamps
+        """
+        resolution = resolution or self.resolution_for(start)
+        ring = self.rings[resolution]
+        with self._lock:
+            values = {bucket.index: bucket.counters.get(counter, 0) for bucket in self._range(start, end, resolution)}
+        points = [
+            {
+                # Bucket starts are local wall-clock times
+                "start": datetime.fromtimestamp(index * ring.width, tz=timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds"),
+                "value": values.get(index, 0),
+            }
+            for index in ring.indices(local_seconds(start), local_seconds(end), local_seconds(time.time()))
+        ]
+        return {"counter": counter, "resolution": resolution, "points": points}
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "since": datetime.fromtimestamp(self._started).isoformat(timespec="seconds"),
+                "rings": {name: {"bucket_seconds": ring.width, "buckets": ring.size} for name, ring in self.rings.items()},
+                "top_queries_capacity": self.top_queries,
+            }
+
+
+def percentiles(histogram: List[int]) -> Dict:
+    """
+    Approximate latency percentiles (bin upper bounds) from a histogram
+    """
+    total = sum(histogram)
+    result: Dict = {"count": total}
+    for p in PERCENTILES:
+        if not total:
+            result[f"p{p}"] = None
+            continue
+        rank, seen = total * p / 100, 0
+        for bound, count in zip(LATENCY_BOUNDS_MS, histogram):
+            seen += count
+            if seen >= rank:
+                result[f"p{p}"] = round(bound, 1)
+                break
+    return result
+
+
+analytics = AnalyticsEngine(
+    minute_buckets=settings.ANALYTICS_MINUTE_BUCKETS,
+    hour_buckets=settings.ANALYTICS_HOUR_BUCKETS,
+    day_buckets=settings.ANALYTICS_DAY_BUCKETS,
+    top_queries=settings.ANALYTICS_TOP_QUERIES,
+)
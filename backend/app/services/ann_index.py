@@ -0,0 +1,204 @@
+import math
+import time
+from typing import Dict, Optional
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "ivf_sq8")
+
+# k-means wants roughly this many training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def default_nlist(ntotal: int) -> int:
+    """
+    Number of IVF lists for a corpus of the given size (~4 * sqrt(n))
+    """
+    if settings.VECTOR_INDEX_NLIST > 0:
+        return settings.VECTOR_INDEX_NLIST
+    nlist = int(4 * math.sqrt(ntotal))
+    return max(1, min(nlist, ntotal // MIN_POINTS_PER_CENTROID))
+
+
+def factory_string(index_type: str, ntotal: int) -> str:
+    """
+    FAISS index_factory description for a configured index type
+    """
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{settings.VECTOR_INDEX_HNSW_M}"
+    nlist = default_nlist(ntotal)
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    if index_type == "ivf_pq":
+        return f"IVF{nlist},PQ{settings.VECTOR_INDEX_PQ_M}x8"
+    if index_type == "ivf_sq8":
+        return f"IVF{nlist},SQ8"
+    raise ValueError(f"Unknown vector index type '{index_type}', expected one of {INDEX_TYPES}")
+
+
+def min_training_points(index_type: str, ntotal: int) -> int:
+    """
+    Smallest corpus that gives the quantizers of this index type enough data
+    """
+    if index_type in ("flat", "hnsw"):
+        return 1
+    minimum = default_nlist(ntotal) * MIN_POINTS_PER_CENTROID
+    if index_type == "ivf_pq":
+        # 8-bit PQ codebooks have 256 centroids per sub-quantizer
+        minimum = max(minimum, 256 * MIN_POINTS_PER_CENTROID)
+    return minimum
+
+
+def build_index(vectors: np.ndarray, index_type: str) -> faiss.Index:
+    """
+    Train (if needed) and fill an index of the given type with `vectors`.
+
+    Positions in the new index match row numbers in `vectors`, so the
+    LangChain index_to_docstore_id mapping stays valid.
+    """
+    ntotal, dim = vectors.shape
+    index = faiss.index_factory(dim, factory_string(index_type, ntotal), faiss.METRIC_L2)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = settings.VECTOR_INDEX_HNSW_EF_CONSTRUCTION
+
+    if not index.is_trained:
+        max_train = default_nlist(ntotal) * 256
+        if ntotal > max_train:
+            rng = np.random.default_rng(0)
+            sample = vectors[rng.choice(ntotal, max_train, replace=False)]
+        else:
+            sample = vectors
+        index.train(sample)
+
+    index.add(vectors)
+    apply_search_params(index)
+    return index
+
+
+def apply_search_params(index: faiss.Index) -> None:
+    """
+    Apply the configured nprobe / efSearch to a built or loaded index
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = settings.VECTOR_INDEX_NPROBE
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = settings.VECTOR_INDEX_HNSW_EF_SEARCH
+
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector) -> faiss.SearchParameters:
+    """
+    Per-query parameters that restrict a search to `selector`, carrying the
+    configured nprobe / efSearch (parameters replace the index's own)
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = settings.VECTOR_INDEX_HNSW_EF_SEARCH
+    elif faiss.try_extract_index_ivf(index) is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = settings.VECTOR_INDEX_NPROBE
+    else:
+        params = faiss.SearchParameters()
+    params.sel = selector
+    # The SWIG object does not keep the selector alive on its own
+    params._selector = selector
+    return params
+
+
+def load_mapped(path: str) -> faiss.Index:
+    """
+    Memory-map a saved index instead of reading it into process memory.
+    Pages are loaded on demand and shared with every other process mapping
+    the same file. The mapped index is read-only: adding to it aborts.
+    """
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+    apply_search_params(index)
+    return index
+
+
+def index_type_of(index: faiss.Index) -> str:
+    """
+    Map a FAISS index back to its configured type name
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        return "flat"
+    if isinstance(ivf, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(ivf, faiss.IndexIVFScalarQuantizer):
+        return "ivf_sq8"
+    return "ivf_flat"
+
+
+def reconstruct_all(index: faiss.Index) -> np.ndarray:
+    """
+    Read every stored vector back out of an index, in position order.
+
+    Exact for flat, IVF-Flat and HNSW; approximate for PQ/SQ8 codes.
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_rows(index: faiss.Index, positions) -> np.ndarray:
+    """
+    Read the stored vectors at the given positions
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.make_direct_map()
+    if len(positions) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    return np.stack([index.reconstruct(int(p)) for p in positions])
+
+
+def recall_report(vectors: np.ndarray, index: faiss.Index, k: int, sample_size: int) -> Dict:
+    """
+    Compare an ANN index against exact search over the same vectors.
+
+    Uses stored vectors as queries and brute-force k-NN as ground truth.
+    """
+    ntotal = vectors.shape[0]
+    if ntotal == 0:
+        return {"k": k, "queries": 0, "recall_at_k": None}
+
+    k = min(k, ntotal)
+    rng = np.random.default_rng(0)
+    queries = vectors[rng.choice(ntotal, min(sample_size, ntotal), replace=False)]
+
+    start = time.perf_counter()
+    _, exact = faiss.knn(queries, vectors, k)
+    flat_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, approx = index.search(queries, k)
+    ann_seconds = time.perf_counter() - start
+
+    hits = sum(len(set(exact[i]) & set(approx[i])) for i in range(len(queries)))
+    return {
+        "k": k,
+        "queries": len(queries),
+        "recall_at_k": round(hits / (len(queries) * k), 4),
+        "flat_ms_per_query": round(flat_seconds * 1000 / len(queries), 4),
+        "ann_ms_per_query": round(ann_seconds * 1000 / len(queries), 4),
+    }
+
+
+def memory_bytes(index: Optional[faiss.Index]) -> int:
+    """
+    Size of the serialized index, a good proxy for its resident memory
+    """
+    if index is None:
+        return 0
+    return int(faiss.serialize_index(index).nbytes)
@@ -0,0 +1,191 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding_backends import l2_normalize
+
+
+class CachedAnswer:
+    __slots__ = ("answer", "sources", "scope", "created_at", "size_bytes", "slot")
+
+    def __init__(self, answer: str, sources: List[Dict[str, str]], scope: str, slot: int):
+        self.answer = answer
+        self.sources = sources
+        self.scope = scope
+        self.created_at = time.monotonic()
+        self.slot = slot
+        self.size_bytes = _estimate_size(answer, sources)
+
+
+def _estimate_size(answer: str, sources: List[Dict[str, str]]) -> int:
+    # Rough but stable estimate of the payload we keep per entry
+    size = len(answer.encode("utf-8")) + 200
+    for source in sources:
+        size += sum(len(v) for v in source.values()) + 100
+    return size
+
+
+class SemanticAnswerCache:
+    """
+    Answer cache keyed by query-embedding similarity.
+
+    Queries whose normalized embedding has cosine similarity above the
+    threshold with a cached query reuse that answer. Entries are evicted LRU
+    once the entry or memory cap is reached, expire after a TTL, and are all
+    dropped when the knowledge base index version changes.
+    """
+    def __init__(
+        self,
+        similarity_threshold: float,
+        max_entries: int,
+        ttl_seconds: float,
+        max_memory_bytes: int,
+        enabled: bool = True,
+    ):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_bytes = max_memory_bytes
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedAnswer]" = OrderedDict()  # slot -> entry, LRU order
+        self._matrix: Optional[np.ndarray] = None  # one normalized query embedding per slot
+        self._valid: Optional[np.ndarray] = None
+        self._free_slots: List[int] = []
+        self._index_version: Optional[int] = None
+        self._memory_bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def lookup(self, embedding: Sequence[float], index_version: int, scope: str = "") -> Optional[CachedAnswer]:
+        """
+        Return the cached answer for the most similar query in the same scope,
+        or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        query = l2_normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            sims = self._matrix @ query
+            sims[~self._valid] = -1.0
+            candidates = np.nonzero(sims >= self.similarity_threshold)[0]
+            now = time.monotonic()
+            for slot in candidates[np.argsort(-sims[candidates])]:
+                entry = self._entries[int(slot)]
+                if now - entry.created_at > self.ttl_seconds:
+                    self._evict(entry)
+                    continue
+                if entry.scope != scope:
+                    continue
+                self._entries.move_to_end(entry.slot)
+                self.hits += 1
+                return entry
+
+            self.misses += 1
+            return None
+
+    def store(
+        self,
+        embedding: Sequence[float],
+        answer: str,
+        sources: List[Dict[str, str]],
+        index_version: int,
+        scope: str = "",
+    ) -> None:
+        """
+        Cache an answer generated against the given index version
+        """
+        if not self.enabled:
+            return
+
+        query = l2_normalize(embedding)
+        with self._lock:
+            self._check_version(index_version)
+            if index_version != self._index_version:
+                # Generated against an index that has since changed
+                return
+
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, query.shape[0]), dtype=np.float32)
+                self._valid = np.zeros(self.max_entries, dtype=bool)
+                self._free_slots = list(range(self.max_entries - 1, -1, -1))
+
+            if not self._free_slots:
+                self._evict(next(iter(self._entries.values())))
+            slot = self._free_slots.pop()
+
+            entry = CachedAnswer(answer, sources, scope, slot)
+            self._matrix[slot] = query
+            self._valid[slot] = True
+            self._entries[slot] = entry
+            self._memory_bytes += entry.size_bytes + query.nbytes
+
+            while self._memory_bytes > self.max_memory_bytes and len(self._entries) > 1:
+                self._evict(next(iter(self._entries.values())))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "memory_bytes": self._memory_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "similarity_threshold": self.similarity_threshold,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+                "max_memory_bytes": self.max_memory_bytes,
+            }
+
+    def _check_version(self, index_version: int) -> None:
+        if self._index_version is None:
+            self._index_version = index_version
+        elif index_version > self._index_version:
+            self._clear()
+            self._index_version = index_version
+            self.invalidations += 1
+
+    def _evict(self, entry: CachedAnswer) -> None:
+        del self._entries[entry.slot]
+        self._valid[entry.slot] = False
+        self._free_slots.append(entry.slot)
+        self._memory_bytes -= entry.size_bytes + self._matrix.shape[1] * 4
+        self.evictions += 1
+
+    def _clear(self) -> None:
+        self._entries.clear()
+        if self._valid is not None:
+            self._valid[:] = False
+            self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._memory_bytes = 0
+
+
+answer_cache = SemanticAnswerCache(
+    similarity_threshold=settings.ANSWER_CACHE_SIMILARITY_THRESHOLD,
+    max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+    max_memory_bytes=settings.ANSWER_CACHE_MAX_MEMORY_MB * 1024 * 1024,
+    enabled=settings.ANSWER_CACHE_ENABLED,
+)
@@ -0,0 +1,206 @@
+import re
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.core.config import settings
+from app.services.embedding_backends import l2_normalize
+from app.services.lexical_index import tokenize
+from app.services.rag_service import rag_service
+
+# Sentence boundaries: end punctuation, blank lines and list items
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\n(?=\s*(?:[-•*]|\d+[.)])\s)")
+MIN_SENTENCE_WORDS = 4
+MAX_SENTENCES_PER_CHUNK = 24
+# Sentences embedded for one question, across all its chunks
+MAX_SENTENCES_PER_TURN = 16
+# Questions asking for explanation or synthesis are left to the LLM
+GENERATIVE_CUES = frozenset(
+    "explain why compare difference differences summarize summarise summary describe elaborate discuss example examples".split()
+)
+
+EmbedTexts = Callable[[List[str]], Awaitable[List[List[float]]]]
+# (document, L2 distance to the query or None when only BM25 found it)
+SearchHit = Tuple[Document, Optional[float]]
+
+
+class RouteDecision:
+    """
+    Outcome of routing one question: an extractive answer, or None to generate
+    """
+    __slots__ = ("answer", "reason", "retrieval_similarity", "span_score")
+
+    def __init__(
+        self,
+        answer: Optional[str],
+        reason: str,
+        retrieval_similarity: Optional[float] = None,
+        span_score: Optional[float] = None,
+    ):
+        self.answer = answer
+        self.reason = reason
+        self.retrieval_similarity = retrieval_similarity
+        self.span_score = span_score
+
+    @property
+    def path(self) -> str:
+        return "extractive" if self.answer else "llm"
+
+
+def split_sentences(text: str) -> List[str]:
+    sentences = []
+    for part in SENTENCE_PATTERN.split(text):
+        sentence = " ".join(part.split())
+        if len(sentence.split()) >= MIN_SENTENCE_WORDS:
+            sentences.append(sentence)
+    return sentences[:MAX_SENTENCES_PER_CHUNK]
+
+
+def similarity_from_distance(distance: float) -> float:
+    """
+    Cosine similarity of unit vectors from their squared L2 distance, as
+    returned by the FAISS index (the embedding models output unit vectors)
+    """
+    return 1.0 - distance / 2.0
+
+
+def term_coverage(query_terms: Sequence[str], sentence: str) -> float:
+    """
+    Fraction of the query's terms that occur in the sentence
+    """
+    if not query_terms:
+        return 0.0
+    sentence_terms = set(tokenize(sentence))
+    return sum(1 for term in query_terms if term in sentence_terms) / len(query_terms)
+
+
+class AnswerRouter:
+    """
+    Decides per question whether the retrieved chunks can answer it directly.
+
+    The best chunk's cosine similarity to the query comes from its FAISS
+    distance and must clear the retrieval threshold first; only then are the
+    top chunks split into sentences (at most MAX_SENTENCES_PER_TURN) and
+    embedded with the query embedding model. A question gets an extractive
+    answer when its best sentence clears the span threshold, where a sentence's
+    span score is the mean of its cosine similarity to the query and the
+    fraction of query terms it contains. The answer is the best sentences
+    (in document order) with [n] citations to the sources; anything else
+    falls back to LLM generation.
+    """
+    def __init__(
+        self,
+        embed_texts: EmbedTexts,
+        min_retrieval_similarity: float,
+        min_span_score: float,
+        max_chunks: int = 2,
+        max_sentences: int = 2,
+        enabled: bool = True,
+    ):
+        self.embed_texts = embed_texts
+        self.min_retrieval_similarity = min_retrieval_similarity
+        self.min_span_score = min_span_score
+        self.max_chunks = max_chunks
+        self.max_sentences = max_sentences
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._route_ms = 0.0
+
+    async def route(self, query: str, query_embedding: Sequence[float], hits: Sequence[SearchHit]) -> RouteDecision:
+        started = time.perf_counter()
+        decision = await self._route(query, query_embedding, hits)
+        with self._lock:
+            key = decision.path if decision.answer else f"llm:{decision.reason}"
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._route_ms += (time.perf_counter() - started) * 1000
+        if decision.answer:
+            print(
+                f"⚡ Extractive answer (retrieval {decision.retrieval_similarity:.2f}, "
+                f"span {decision.span_score:.2f}), skipping LLM generation"
+            )
+        return decision
+
+    async def _route(self, query: str, query_embedding: Sequence[float], hits: Sequence[SearchHit]) -> RouteDecision:
+        if not self.enabled:
+            return RouteDecision(None, "disabled")
+        if not hits:
+            return RouteDecision(None, "no_context")
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms:
+            return RouteDecision(None, "no_terms")
+        if GENERATIVE_CUES.intersection(query_terms):
+            return RouteDecision(None, "open_ended")
+
+        hits = list(hits[:self.max_chunks])
+        query_vector = l2_normalize(query_embedding)
+        retrieval_similarity = await self._retrieval_similarity(query_vector, hits)
+        if retrieval_similarity < self.min_retrieval_similarity:
+            return RouteDecision(None, "low_retrieval_similarity", retrieval_similarity)
+
+        spans: List[Tuple[int, int, str]] = []  # (chunk number, position, sentence)
+        for number, (doc, _) in enumerate(hits):
+            spans.extend((number, position, s) for position, s in enumerate(split_sentences(doc.page_content)))
+        spans = spans[:MAX_SENTENCES_PER_TURN]
+        if not spans:
+            return RouteDecision(None, "no_sentences", retrieval_similarity)
+
+        vectors = await self.embed_texts([s for _, _, s in spans])
+        similarities = l2_normalize(vectors) @ query_vector
+        scores = [
+            (float(cosine) + term_coverage(query_terms, sentence)) / 2
+            for cosine, (_, _, sentence) in zip(similarities, spans)
+        ]
+        best_score = max(scores)
+        if best_score < self.min_span_score:
+            return RouteDecision(None, "low_span_score", retrieval_similarity, best_score)
+
+        ranked = sorted(range(len(spans)), key=lambda i: scores[i], reverse=True)
+        chosen = [i for i in ranked[:self.max_sentences] if scores[i] >= self.min_span_score]
+        chosen.sort(key=lambda i: spans[i][:2])
+        answer = " ".join(f"{spans[i][2]} [{spans[i][0] + 1}]" for i in chosen)
+        return RouteDecision(answer, "confident", retrieval_similarity, best_score)
+
+    async def _retrieval_similarity(self, query_vector: np.ndarray, hits: List[SearchHit]) -> float:
+        """
+        Best chunk's cosine similarity to the query, from the search
+        distances. Chunks found only by BM25 have no distance and are
+        embedded, which only happens when none of them have one.
+        """
+        distances = [distance for _, distance in hits if distance is not None]
+        if distances:
+            return similarity_from_distance(min(distances))
+        vectors = await self.embed_texts([doc.page_content for doc, _ in hits])
+        return float((l2_normalize(vectors) @ query_vector).max())
+
+    def stats(self) -> Dict:
+        with self._lock:
+            routed = sum(self._counts.values())
+            extractive = self._counts.get("extractive", 0)
+            return {
+                "enabled": self.enabled,
+                "routed": routed,
+                "extractive": extractive,
+                "extractive_ratio": round(extractive / routed, 3) if routed else 0.0,
+                "paths": dict(self._counts),
+                "avg_route_ms": round(self._route_ms / routed, 2) if routed else 0.0,
+                "min_retrieval_similarity": self.min_retrieval_similarity,
+                "min_span_score": self.min_span_score,
+            }
+
+
+def create_answer_router(embed_texts: EmbedTexts) -> AnswerRouter:
+    return AnswerRouter(
+        embed_texts,
+        min_retrieval_similarity=settings.ANSWER_ROUTER_MIN_RETRIEVAL_SIMILARITY,
+        min_span_score=settings.ANSWER_ROUTER_MIN_SPAN_SCORE,
+        max_chunks=settings.ANSWER_ROUTER_MAX_CHUNKS,
+        max_sentences=settings.ANSWER_ROUTER_MAX_SENTENCES,
+        enabled=settings.ANSWER_ROUTER_ENABLED,
+    )
+
+
+answer_router = create_answer_router(rag_service.aembed_texts)
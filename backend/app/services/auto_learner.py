@@ -1,37 +1,204 @@
 import os
+import threading
 import time
-from typing import List
+from typing import Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.metrics import track_stage
 from app.services.rag_service import rag_service
+from app.services.directory_watcher import DirectoryWatcher
+from app.services.ingestion_pipeline import IngestionPipeline
+from app.services.learning_manifest import LearningManifest, file_sha256
 
 class AutoLearningService:
     def __init__(self):
         self.watched_directories = []
-        self.known_files = set()
+        # Survives restarts so unchanged files are not ingested again
+        self.manifest = LearningManifest(f"{rag_service.vector_store_path}_manifest.json")
+        self.last_scan: Optional[Dict] = None
+        self.pipeline = IngestionPipeline(
+            rag_service,
+            parse_workers=settings.INGEST_PARSE_WORKERS,
+            embed_batch_size=settings.INGEST_EMBED_BATCH_SIZE,
+        )
+        self._scan_lock = threading.Lock()
+        self.watcher: Optional[DirectoryWatcher] = None
 
     def add_watch_directory(self, path: str):
         if os.path.exists(path) and path not in self.watched_directories:
             self.watched_directories.append(path)
             print(f"Started watching directory: {path}")
+            if self.watcher is not None:
+                self.watcher.watch(path)
+
+    def start_watching(self) -> None:
+        """
+        Watch the configured directories and learn changes as they happen
+        """
+        for directory in settings.AUTO_LEARN_WATCH_DIRECTORIES:
+            os.makedirs(directory, exist_ok=True)
+            self.add_watch_directory(directory)
+        if settings.AUTO_LEARN_WATCHER == "off" or self.watcher is not None:
+            return
+
+        self.watcher = DirectoryWatcher(
+            self._on_watched_changes,
+            backend=settings.AUTO_LEARN_WATCHER,
+            debounce_seconds=settings.AUTO_LEARN_DEBOUNCE_SECONDS,
+            poll_interval_seconds=settings.AUTO_LEARN_POLL_INTERVAL_SECONDS,
+        )
+        for directory in self.watched_directories:
+            self.watcher.watch(directory)
+        self.watcher.start()
+        # Catch up on whatever changed while the app was down
+        self.watcher.request_rescan()
+
+    def stop_watching(self) -> None:
+        if self.watcher is not None:
+            self.watcher.stop()
+            self.watcher = None
+
+    def _on_watched_changes(self, paths: Optional[Set[str]]) -> None:
+        if paths is None:
+            self.scan_and_learn()
+        else:
+            self.learn_paths(paths)
 
     def scan_and_learn(self):
         """
-        Scans watched directories for new PDF files and ingests them.
+        Scans watched directories and brings the index in line with them:
+        new PDFs are ingested, changed ones re-learned and deleted ones forgotten.
+        """
+        # Overlapping triggers would ingest the same new files twice
+        if not self._scan_lock.acquire(blocking=False):
+            print("Auto-learning scan already running, skipping")
+            return 0
+
+        try:
+            with track_stage("autolearn.scan"):
+                found = []
+                for directory in self.watched_directories:
+                    for root, _, files in os.walk(directory):
+                        for file in files:
+                            if file.endswith(".pdf"):
+                                found.append(os.path.abspath(os.path.join(root, file)))
+
+                # Forget files that disappeared from a directory we can still see
+                seen = set(found)
+                gone = []
+                for directory in self.watched_directories:
+                    if os.path.isdir(directory):
+                        gone.extend(p for p in self.manifest.paths_under(directory) if p not in seen)
+                return self._sync(found, gone)
+        finally:
+            self._scan_lock.release()
+
+    def learn_paths(self, paths: Set[str]) -> int:
+        """
+        Learn only the given created, changed or deleted paths (from the watcher)
+        """
+        # Wait for a running scan instead of skipping; these changes would be lost
+        with self._scan_lock:
+            found = []
+            gone = []
+            for path in paths:
+                path = os.path.abspath(path)
+                if os.path.isfile(path):
+                    if path.endswith(".pdf"):
+                        found.append(path)
+                elif not os.path.exists(path):
+                    # A deleted file, or a deleted/moved-away directory
+                    if self.manifest.get(path) is not None:
+                        gone.append(path)
+                    gone.extend(self.manifest.paths_under(path))
+            return self._sync(found, gone)
+
+    def _sync(self, paths: List[str], gone: List[str]) -> int:
         """
-        new_knowledge_count = 0
+        Ingest new and changed files among `paths` and drop the chunks of `gone` files
+        """
+        summary = {"unchanged": 0, "added": 0, "changed": 0, "deleted": 0, "failed": 0}
+        to_learn = {}  # path -> (stat, sha256, previous manifest entry)
+        for path in paths:
+            try:
+                change = self._check_file(path)
+            except OSError as e:
+                print(f"Failed to read {path}: {e}")
+                continue
+            if change is None:
+                summary["unchanged"] += 1
+                continue
+            print(f"Discovered {'changed' if change[2] else 'new'} knowledge: {os.path.basename(path)}")
+            to_learn[path] = change
+
+        for path in gone:
+            entry = self.manifest.remove(path)
+            if entry is None:
+                continue
+            rag_service.delete_documents(entry["chunk_ids"])
+            summary["deleted"] += 1
+            print(f"Forgot deleted knowledge: {os.path.basename(path)}")
+
+        def on_indexed(files: Dict[str, List[str]]) -> None:
+            # Record files as soon as their chunks are persisted, so a crash
+            # partway through a bulk load does not re-ingest (and duplicate)
+            # the files that were already indexed
+            for path, chunk_ids in files.items():
+                stat, sha256, previous = to_learn[path]
+                self.manifest.set(path, stat.st_size, stat.st_mtime_ns, sha256, chunk_ids)
+                if previous is not None:
+                    rag_service.delete_documents(previous["chunk_ids"])
+                    summary["changed"] += 1
+                else:
+                    summary["added"] += 1
+            self.manifest.save()
+
+        courses = {path: course for path in to_learn if (course := self._course_for(path))}
+        learned = self.pipeline.run(list(to_learn), courses, on_indexed) if to_learn else {}
+        # Files that failed keep serving their previous version until re-learned
+        summary["failed"] += sum(1 for path in to_learn if path not in learned)
+
+        self.manifest.save()
+        self.last_scan = {**summary, "finished_at": time.time()}
+        return len(learned)
+
+    def _course_for(self, path: str) -> Optional[str]:
+        """
+        Course of a file from the layout <watched dir>/<course>/.../<file>.pdf
+        """
+        if not settings.AUTO_LEARN_COURSE_FROM_DIRECTORY:
+            return None
         for directory in self.watched_directories:
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    if file.endswith(".pdf"):
-                        full_path = os.path.join(root, file)
-                        if full_path not in self.known_files:
-                            print(f"Discovered new knowledge: {file}")
-                            try:
-                                rag_service.ingest_file(full_path)
-                                self.known_files.add(full_path)
-                                new_knowledge_count += 1
-                            except Exception as e:
-                                print(f"Failed to learn from {file}: {e}")
-        
-        return new_knowledge_count
+            relative = os.path.relpath(path, os.path.abspath(directory))
+            if relative.startswith(os.pardir):
+                continue
+            parts = relative.split(os.sep)
+            if len(parts) > 1:
+                return parts[0]
+        return None
+
+    def _check_file(self, path: str) -> Optional[Tuple[os.stat_result, str, Optional[Dict]]]:
+        """
+        Return (stat, sha256, previous entry) if the file needs learning, None if unchanged
+        """
+        stat = os.stat(path)
+        entry = self.manifest.get(path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return None
+
+        # Stat changed (or new file); only the content hash decides
+        sha256 = file_sha256(path)
+        if entry and entry["sha256"] == sha256:
+            self.manifest.set(path, stat.st_size, stat.st_mtime_ns, sha256, entry["chunk_ids"])
+            return None
+        return stat, sha256, entry
+
+    def status(self) -> Dict:
+        return {
+            "watched_directories": self.watched_directories,
+            "known_files": len(self.manifest),
+            "last_scan": self.last_scan,
+            "watcher": self.watcher.status() if self.watcher is not None else {"running": False},
+            "ingestion": self.pipeline.status(),
+        }
 
 auto_learner = AutoLearningService()
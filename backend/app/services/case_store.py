@@ -0,0 +1,181 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+CASE_STATUSES = ("pending", "approved", "rejected")
+
+# Large report fields only returned when a single case is opened
+DETAIL_FIELDS = ("details", "pages")
+
+
+def _timestamp(value: float) -> str:
+    return datetime.fromtimestamp(value).isoformat(timespec="seconds")
+
+
+class SQLiteCaseStore:
+    """
+    Verification review cases in a SQLite file (WAL mode).
+
+    Listing rows hold only a small report summary; the full report (with
+    the per-block bbox details) lives in a separate table and is read only
+    when a case is opened. Lists are paginated by keyset on an increasing
+    sequence number through (status, seq) and (report_status, seq)
+    indexes, and per-status counts are kept in their own table, so every
+    queue query costs O(page) however many cases have accumulated.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS verification_cases (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                case_id TEXT NOT NULL UNIQUE,
+                status TEXT NOT NULL,
+                report_status TEXT,
+                summary TEXT NOT NULL,
+                remarks TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS verification_cases_status
+                ON verification_cases (status, seq);
+            CREATE INDEX IF NOT EXISTS verification_cases_report_status
+                ON verification_cases (report_status, seq);
+            CREATE TABLE IF NOT EXISTS verification_reports (
+                case_id TEXT PRIMARY KEY,
+                report TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS verification_case_counts (
+                status TEXT PRIMARY KEY,
+                count INTEGER NOT NULL
+            );
+        """)
+
+    def add(self, case_id: str, report: Dict, status: str = "pending") -> None:
+        summary = {k: v for k, v in report.items() if k not in DETAIL_FIELDS}
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT INTO verification_cases "
+                    "(case_id, status, report_status, summary, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (case_id, status, report.get("status"), json.dumps(summary, separators=(",", ":")), now, now),
+                )
+                self._conn.execute(
+                    "INSERT INTO verification_reports (case_id, report) VALUES (?, ?)",
+                    (case_id, json.dumps(report, separators=(",", ":"))),
+                )
+                self._count(status, 1)
+
+    def get(self, case_id: str, include_report: bool = True) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT seq, case_id, status, summary, remarks, created_at, updated_at "
+                "FROM verification_cases WHERE case_id = ?",
+                (case_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            case = self._case(row)
+            if include_report:
+                report = self._conn.execute(
+                    "SELECT report FROM verification_reports WHERE case_id = ?", (case_id,)
+                ).fetchone()
+                if report is not None:
+                    case["report"] = json.loads(report[0])
+        return case
+
+    def update_status(self, case_id: str, status: str, remarks: Optional[str] = None) -> bool:
+        with self._lock:
+            with self._transaction():
+                row = self._conn.execute(
+                    "SELECT status FROM verification_cases WHERE case_id = ?", (case_id,)
+                ).fetchone()
+                if row is None:
+                    return False
+                self._conn.execute(
+                    "UPDATE verification_cases SET status = ?, remarks = ?, updated_at = ? WHERE case_id = ?",
+                    (status, remarks, time.time(), case_id),
+                )
+                if row[0] != status:
+                    self._count(row[0], -1)
+                    self._count(status, 1)
+        return True
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        report_status: Optional[str] = None,
+        limit: int = 50,
+        cursor: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> Tuple[List[Dict], Optional[int]]:
+        """
+        One page of cases (summaries only) and the cursor for the next page
+        """
+        clauses, params = [], []
+        if status is not None:
+            clauses.append("status = ?")
+            params.append(status)
+        if report_status is not None:
+            clauses.append("report_status = ?")
+            params.append(report_status)
+        if cursor is not None:
+            clauses.append("seq < ?" if newest_first else "seq > ?")
+            params.append(cursor)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        order = "DESC" if newest_first else "ASC"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, case_id, status, summary, remarks, created_at, updated_at "
+                f"FROM verification_cases {where} ORDER BY seq {order} LIMIT ?",
+                (*params, limit + 1),
+            ).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [self._case(row) for row in rows[:limit]], next_cursor
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, count FROM verification_case_counts").fetchall())
+        return {**{status: 0 for status in CASE_STATUSES}, **counts}
+
+    @staticmethod
+    def _case(row) -> Dict:
+        _, case_id, status, summary, remarks, created_at, updated_at = row
+        return {
+            "case_id": case_id,
+            "status": status,
+            "timestamp": _timestamp(created_at),
+            "updated_at": _timestamp(updated_at),
+            "remarks": remarks,
+            "report": json.loads(summary),
+        }
+
+    def _count(self, status: str, delta: int) -> None:
+        self._conn.execute(
+            "INSERT INTO verification_case_counts (status, count) VALUES (?, ?) "
+            "ON CONFLICT(status) DO UPDATE SET count = count + excluded.count",
+            (status, delta),
+        )
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+
+case_store = SQLiteCaseStore(settings.VERIFICATION_CASE_DB_PATH)
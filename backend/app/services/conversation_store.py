@@ -0,0 +1,360 @@
+import asyncio
+import json
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.schemas.chat import ChatMessage
+
+CONVERSATION_BACKENDS = ("memory", "sqlite", "redis")
+
+# Messages are stored as compact (role code, content, sources) tuples
+_ROLE_CODES = {"user": "u", "assistant": "a", "system": "s"}
+_ROLE_NAMES = {code: role for role, code in _ROLE_CODES.items()}
+_Message = Tuple[str, str, Optional[Tuple[str, ...]]]
+
+
+def _pack(message: ChatMessage) -> _Message:
+    sources = tuple(message.sources) if message.sources else None
+    return _ROLE_CODES.get(message.role, message.role), message.content, sources
+
+
+def _unpack(message: _Message) -> ChatMessage:
+    role, content, sources = message
+    return ChatMessage(role=_ROLE_NAMES.get(role, role), content=content, sources=list(sources) if sources else None)
+
+
+def _encode(message: ChatMessage) -> str:
+    return json.dumps(_pack(message), separators=(",", ":"))
+
+
+def _decode(data) -> ChatMessage:
+    role, content, sources = json.loads(data)
+    return _unpack((role, content, sources))
+
+
+class ConversationStore(ABC):
+    """
+    Chat history per session, capped at `max_messages` per session and
+    dropped after `ttl_seconds` without activity.
+
+    Async handlers use the a* variants, which run the blocking SQLite or
+    Redis calls on a worker thread so the event loop never waits on I/O.
+    """
+    def __init__(self, max_messages: int, ttl_seconds: float):
+        self.max_messages = max_messages
+        self.ttl_seconds = ttl_seconds
+
+    @abstractmethod
+    def append(self, session_id: str, message: ChatMessage) -> None:
+        ...
+
+    @abstractmethod
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        """
+        The last `limit` (default: all kept) messages of a session, oldest first
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def stats(self) -> Dict:
+        ...
+
+    async def aappend(self, session_id: str, message: ChatMessage) -> None:
+        await asyncio.to_thread(self.append, session_id, message)
+
+    async def arecent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        return await asyncio.to_thread(self.recent, session_id, limit)
+
+    async def adelete(self, session_id: str) -> None:
+        await asyncio.to_thread(self.delete, session_id)
+
+
+class _Session:
+    __slots__ = ("messages", "last_access", "size_bytes")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[_Message] = deque(maxlen=max_messages)
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+
+
+class MemoryConversationStore(ConversationStore):
+    """
+    In-process store with idle TTL and a global memory budget; when the
+    budget is exceeded the least recently used sessions are evicted.
+    """
+    def __init__(self, max_messages: int, ttl_seconds: float, max_memory_bytes: int):
+        super().__init__(max_messages, ttl_seconds)
+        self.max_memory_bytes = max_memory_bytes
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._evicted = {"ttl": 0, "memory": 0}
+
+    @staticmethod
+    def _size(message: _Message) -> int:
+        size = 120 + sys.getsizeof(message[1])
+        if message[2]:
+            size += sum(sys.getsizeof(s) for s in message[2])
+        return size
+
+    def append(self, session_id: str, message: ChatMessage) -> None:
+        packed = _pack(message)
+        size = self._size(packed)
+        with self._lock:
+            self._purge_expired()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session(self.max_messages)
+            if len(session.messages) == session.messages.maxlen:
+                dropped = self._size(session.messages[0])
+                session.size_bytes -= dropped
+                self._bytes -= dropped
+            session.messages.append(packed)
+            session.size_bytes += size
+            self._bytes += size
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+
+            # Evict least recently used sessions, never the one just written
+            while self._bytes > self.max_memory_bytes and len(self._sessions) > 1:
+                _, evicted = self._sessions.popitem(last=False)
+                self._bytes -= evicted.size_bytes
+                self._evicted["memory"] += 1
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return []
+            if time.monotonic() - session.last_access > self.ttl_seconds:
+                self._drop(session_id)
+                self._evicted["ttl"] += 1
+                return []
+            session.last_access = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            messages = list(session.messages)
+        if limit is not None:
+            messages = messages[-limit:]
+        return [_unpack(m) for m in messages]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    # Pure in-memory work: cheaper inline than a thread hop
+    async def aappend(self, session_id: str, message: ChatMessage) -> None:
+        self.append(session_id, message)
+
+    async def arecent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        return self.recent(session_id, limit)
+
+    async def adelete(self, session_id: str) -> None:
+        self.delete(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "memory_bytes": self._bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "evicted": dict(self._evicted),
+            }
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._bytes -= session.size_bytes
+
+    def _purge_expired(self) -> None:
+        # Sessions are kept in access order, so expired ones are at the front
+        now = time.monotonic()
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access <= self.ttl_seconds:
+                break
+            self._drop(session_id)
+            self._evicted["ttl"] += 1
+
+
+class SQLiteConversationStore(ConversationStore):
+    """
+    History in a local SQLite file (WAL mode), shared by all workers on the host
+    """
+    PURGE_INTERVAL_SECONDS = 60.0
+
+    def __init__(self, path: str, max_messages: int, ttl_seconds: float):
+        super().__init__(max_messages, ttl_seconds)
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS conversation_sessions (
+                session_id TEXT PRIMARY KEY,
+                last_access REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS conversation_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS conversation_messages_session
+                ON conversation_messages (session_id, id);
+            CREATE INDEX IF NOT EXISTS conversation_sessions_access
+                ON conversation_sessions (last_access);
+        """)
+
+    def append(self, session_id: str, message: ChatMessage) -> None:
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT INTO conversation_messages (session_id, message) VALUES (?, ?)",
+                    (session_id, _encode(message)),
+                )
+                self._conn.execute(
+                    "DELETE FROM conversation_messages WHERE session_id = ? AND id NOT IN "
+                    "(SELECT id FROM conversation_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                    (session_id, session_id, self.max_messages),
+                )
+                self._touch(session_id, now)
+            if now - self._last_purge > self.PURGE_INTERVAL_SECONDS:
+                self._last_purge = now
+                self._purge_expired(now)
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_access FROM conversation_sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return []
+            if now - row[0] > self.ttl_seconds:
+                with self._transaction():
+                    self._delete(session_id)
+                return []
+            rows = self._conn.execute(
+                "SELECT message FROM conversation_messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit if limit is not None else self.max_messages),
+            ).fetchall()
+            self._touch(session_id, now)
+        return [_decode(r[0]) for r in reversed(rows)]
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            with self._transaction():
+                self._delete(session_id)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM conversation_sessions").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM conversation_messages").fetchone()[0]
+        return {"backend": "sqlite", "path": self.path, "sessions": sessions, "messages": messages}
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _touch(self, session_id: str, now: float) -> None:
+        self._conn.execute(
+            "INSERT INTO conversation_sessions (session_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+            (session_id, now),
+        )
+
+    def _delete(self, session_id: str) -> None:
+        self._conn.execute("DELETE FROM conversation_messages WHERE session_id = ?", (session_id,))
+        self._conn.execute("DELETE FROM conversation_sessions WHERE session_id = ?", (session_id,))
+
+    def _purge_expired(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        with self._transaction():
+            self._conn.execute(
+                "DELETE FROM conversation_messages WHERE session_id IN "
+                "(SELECT session_id FROM conversation_sessions WHERE last_access < ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM conversation_sessions WHERE last_access < ?", (cutoff,))
+
+
+class RedisConversationStore(ConversationStore):
+    """
+    History in Redis lists (one key per session), shared by every worker.
+    The cap is applied with LTRIM and the idle TTL with EXPIRE; the global
+    memory budget is left to the server's maxmemory policy.
+    """
+    def __init__(self, url: str, max_messages: int, ttl_seconds: float, prefix: str = "chat:history:"):
+        super().__init__(max_messages, ttl_seconds)
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def append(self, session_id: str, message: ChatMessage) -> None:
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.rpush(key, _encode(message))
+        pipe.ltrim(key, -self.max_messages, -1)
+        pipe.expire(key, int(self.ttl_seconds))
+        pipe.execute()
+
+    def recent(self, session_id: str, limit: Optional[int] = None) -> List[ChatMessage]:
+        key = self.prefix + session_id
+        pipe = self.client.pipeline()
+        pipe.lrange(key, -(limit or self.max_messages), -1)
+        pipe.expire(key, int(self.ttl_seconds))
+        rows, _ = pipe.execute()
+        return [_decode(r) for r in rows]
+
+    def delete(self, session_id: str) -> None:
+        self.client.delete(self.prefix + session_id)
+
+    def stats(self) -> Dict:
+        return {"backend": "redis", "prefix": self.prefix}
+
+
+def create_conversation_store(backend: Optional[str] = None) -> ConversationStore:
+    backend = backend or settings.CONVERSATION_BACKEND
+    if backend == "memory":
+        return MemoryConversationStore(
+            settings.CONVERSATION_MAX_MESSAGES,
+            settings.CONVERSATION_TTL_SECONDS,
+            settings.CONVERSATION_MAX_MEMORY_MB * 1024 * 1024,
+        )
+    if backend == "sqlite":
+        return SQLiteConversationStore(
+            settings.CONVERSATION_SQLITE_PATH,
+            settings.CONVERSATION_MAX_MESSAGES,
+            settings.CONVERSATION_TTL_SECONDS,
+        )
+    if backend == "redis":
+        return RedisConversationStore(
+            settings.REDIS_URL,
+            settings.CONVERSATION_MAX_MESSAGES,
+            settings.CONVERSATION_TTL_SECONDS,
+        )
+    raise ValueError(f"Unknown conversation backend '{backend}', expected one of {CONVERSATION_BACKENDS}")
+
+
+conversation_store = create_conversation_store()
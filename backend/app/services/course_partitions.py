@@ -0,0 +1,100 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+from app.services import ann_index
+
+
+def course_key(course: Optional[str]) -> Optional[str]:
+    """
+    Normalized partition key for a course name ("OS", " os " -> "os")
+    """
+    if course is None:
+        return None
+    key = course.strip().lower()
+    return key or None
+
+
+class CourseFilters:
+    """
+    Course of every position in a LangChain FAISS store's index.
+
+    A course-scoped query searches the global index restricted to its
+    course's positions through an IDSelectorBitmap, so only the course's
+    vectors are scored and no second copy of them is kept. Positions follow
+    the index: chunks are appended as they are added, and the whole mapping
+    is re-read from the store whenever positions are renumbered or chunks
+    removed (load, deletes, rebuilds, re-embedding). Not thread-safe;
+    callers hold the RAG service lock.
+    """
+    def __init__(self):
+        # Course code per index position, -1 for chunks without a course
+        self._codes = np.zeros(0, dtype=np.int32)
+        self._code_of: Dict[str, int] = {}
+        self._counts: Dict[str, int] = {}
+        # Bitmaps and search parameters per course, until positions change
+        self._filters: Dict[str, Tuple[np.ndarray, faiss.SearchParameters]] = {}
+
+    def _code(self, course: Optional[str]) -> int:
+        key = course_key(course)
+        if key is None:
+            return -1
+        return self._code_of.setdefault(key, len(self._code_of))
+
+    def append(self, courses: Sequence[Optional[str]]) -> None:
+        """
+        Record the courses of chunks just added at the end of the index
+        """
+        codes = np.array([self._code(course) for course in courses], dtype=np.int32)
+        self._codes = np.concatenate([self._codes, codes])
+        self._count()
+
+    def resync(self, store: Optional[FAISS]) -> None:
+        """
+        Re-read the course of every position from the store
+        """
+        self._code_of = {}
+        if store is None:
+            self._codes = np.zeros(0, dtype=np.int32)
+        else:
+            docs = store.docstore._dict
+            mapping = store.index_to_docstore_id
+            codes = np.full(store.index.ntotal, -1, dtype=np.int32)
+            for position, id_ in mapping.items():
+                doc = docs.get(id_)
+                # Tombstoned positions belong to no course
+                if doc is not None:
+                    codes[position] = self._code(doc.metadata.get("course"))
+            self._codes = codes
+        self._count()
+
+    def _count(self) -> None:
+        counts = np.bincount(self._codes[self._codes >= 0], minlength=len(self._code_of))
+        self._counts = {key: int(counts[code]) for key, code in self._code_of.items() if counts[code]}
+        self._filters = {}
+
+    def has(self, course: Optional[str]) -> bool:
+        return course_key(course) in self._counts
+
+    def search_params(self, course: str, store: FAISS) -> Optional[faiss.SearchParameters]:
+        """
+        Search parameters restricting the store's index to one course's
+        positions, or None when the course has no chunks
+        """
+        if len(self._codes) != store.index.ntotal:
+            # Positions changed behind our back; never filter with a stale map
+            self.resync(store)
+        key = course_key(course)
+        if key not in self._counts:
+            return None
+        if key not in self._filters:
+            bitmap = np.packbits(self._codes == self._code_of[key], bitorder="little")
+            selector = faiss.IDSelectorBitmap(len(self._codes), faiss.swig_ptr(bitmap))
+            # The bitmap must outlive the selector that points into it
+            self._filters[key] = (bitmap, ann_index.search_parameters(store.index, selector))
+        return self._filters[key][1]
+
+    def stats(self) -> Dict[str, int]:
+        return dict(sorted(self._counts.items()))
@@ -0,0 +1,342 @@
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+WATCHER_BACKENDS = ("auto", "inotify", "poll")
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# Completed writes, renames in and out, creates (for directories) and deletes
+WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE
+    | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    """
+    Minimal ctypes binding to Linux inotify
+    """
+    def __init__(self):
+        libc_name = ctypes.util.find_library("c")
+        if libc_name is None:
+            raise OSError("libc not found")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(self._libc, "inotify_init1"):
+            raise OSError("inotify is not available on this platform")
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def read_events(self) -> List[Tuple[int, int, str]]:
+        """
+        Drain pending events as (wd, mask, name) tuples
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """
+    Long-running watcher that reports changed files under a set of directories.
+
+    Uses inotify on Linux (one watch per directory, no periodic walks) and
+    falls back to polling with stat snapshots elsewhere. Events are
+    debounced: a path is only reported once it has been quiet for
+    `debounce_seconds`, so a file being copied is ingested once, after the
+    copy finished. Changed paths (existing, created or deleted) are passed to
+    `on_changes` on a separate thread; `on_changes(None)` asks for a full
+    rescan, e.g. after the kernel event queue overflowed.
+    """
+    def __init__(
+        self,
+        on_changes: Callable[[Optional[Set[str]]], None],
+        backend: str = "auto",
+        debounce_seconds: float = 2.0,
+        poll_interval_seconds: float = 30.0,
+        suffix: str = ".pdf",
+    ):
+        if backend not in WATCHER_BACKENDS:
+            raise ValueError(f"Unknown watcher backend '{backend}', expected one of {WATCHER_BACKENDS}")
+        self.on_changes = on_changes
+        self.requested_backend = backend
+        self.backend: Optional[str] = None
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self.suffix = suffix
+        self.directories: List[str] = []
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pending: Dict[str, float] = {}
+        self._batches: "queue.Queue[Optional[Set[str]]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._inotify: Optional[_Inotify] = None
+        self._watches: Dict[int, str] = {}
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._stats = {"events": 0, "batches": 0, "paths_dispatched": 0, "rescans": 0, "last_dispatch_at": None}
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def watch(self, directory: str) -> None:
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if directory in self.directories:
+                return
+            self.directories.append(directory)
+        if self._inotify is not None:
+            self._add_tree(directory)
+        elif self.backend == "poll":
+            self._snapshot.update(self._scan(directory))
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop.clear()
+        self.backend = self._select_backend()
+        if self.backend == "inotify":
+            for directory in list(self.directories):
+                self._add_tree(directory)
+            target = self._run_inotify
+        else:
+            for directory in list(self.directories):
+                self._snapshot.update(self._scan(directory))
+            target = self._run_poll
+
+        self._threads = [
+            threading.Thread(target=target, name="directory-watcher", daemon=True),
+            threading.Thread(target=self._dispatch_loop, name="directory-watcher-dispatch", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        print(f"Directory watcher started ({self.backend}) on {len(self.directories)} directories")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        self._batches.put(set())  # wake the dispatcher
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+        self._watches.clear()
+        self._snapshot.clear()
+        print("Directory watcher stopped")
+
+    def request_rescan(self) -> None:
+        self._stats["rescans"] += 1
+        self._batches.put(None)
+
+    def status(self) -> Dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "running": self.running,
+            "backend": self.backend,
+            "requested_backend": self.requested_backend,
+            "directories": list(self.directories),
+            "watches": len(self._watches) if self.backend == "inotify" else None,
+            "tracked_files": len(self._snapshot) if self.backend == "poll" else None,
+            "pending_paths": pending,
+            "queued_batches": self._batches.qsize(),
+            "debounce_seconds": self.debounce_seconds,
+            **self._stats,
+        }
+
+    def _select_backend(self) -> str:
+        if self.requested_backend == "poll":
+            return "poll"
+        try:
+            self._inotify = _Inotify()
+            return "inotify"
+        except OSError as e:
+            print(f"inotify unavailable ({e}), falling back to polling every {self.poll_interval_seconds}s")
+            return "poll"
+
+    def _mark(self, path: str) -> None:
+        with self._lock:
+            self._pending[path] = time.monotonic()
+
+    def _flush_ready(self) -> None:
+        """
+        Hand over paths that have been quiet for the debounce interval
+        """
+        now = time.monotonic()
+        with self._lock:
+            ready = {p for p, t in self._pending.items() if now - t >= self.debounce_seconds}
+            for path in ready:
+                del self._pending[path]
+        if ready:
+            self._batches.put(ready)
+
+    def _dispatch_loop(self) -> None:
+        while not self._stop.is_set():
+            batch = self._batches.get()
+            # Merge everything queued while the previous batch was being learned
+            rescan = batch is None
+            paths = set(batch or ())
+            while True:
+                try:
+                    more = self._batches.get_nowait()
+                except queue.Empty:
+                    break
+                if more is None:
+                    rescan = True
+                else:
+                    paths.update(more)
+            if self._stop.is_set():
+                return
+            if not rescan and not paths:
+                continue
+            try:
+                if rescan:
+                    self.on_changes(None)
+                if paths:
+                    self._stats["batches"] += 1
+                    self._stats["paths_dispatched"] += len(paths)
+                    self.on_changes(paths)
+                self._stats["last_dispatch_at"] = time.time()
+            except Exception as e:
+                print(f"Directory watcher callback failed: {e}")
+
+    # inotify backend
+
+    def _add_tree(self, directory: str) -> None:
+        """
+        Watch a directory and all of its subdirectories
+        """
+        for root, _, _ in os.walk(directory):
+            try:
+                wd = self._inotify.add_watch(root)
+            except OSError as e:
+                # Usually fs.inotify.max_user_watches; the rest of the tree is still watched
+                print(f"Cannot watch {root}: {e}")
+                continue
+            self._watches[wd] = root
+
+    def _run_inotify(self) -> None:
+        fd = self._inotify.fd
+        while not self._stop.is_set():
+            with self._lock:
+                oldest = min(self._pending.values(), default=None)
+            timeout = 1.0 if oldest is None else max(0.0, oldest + self.debounce_seconds - time.monotonic())
+            try:
+                readable, _, _ = select.select([fd], [], [], min(timeout, 1.0))
+            except (OSError, ValueError):
+                return  # closed by stop()
+            if readable:
+                for wd, mask, name in self._inotify.read_events():
+                    self._handle_event(wd, mask, name)
+            self._flush_ready()
+
+    def _handle_event(self, wd: int, mask: int, name: str) -> None:
+        self._stats["events"] += 1
+        if mask & IN_Q_OVERFLOW:
+            print("inotify event queue overflowed, scheduling a full rescan")
+            self.request_rescan()
+            return
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        directory = self._watches.get(wd)
+        if directory is None:
+            return
+        if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+            self._mark(directory)
+            return
+
+        path = os.path.join(directory, name)
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may land in the new directory before it is watched
+                self._add_tree(path)
+                for root, _, files in os.walk(path):
+                    for file in files:
+                        if file.endswith(self.suffix):
+                            self._mark(os.path.join(root, file))
+            elif mask & IN_MOVED_FROM:
+                self._mark(path)
+            return
+
+        if name.endswith(self.suffix) and mask & (IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_DELETE):
+            self._mark(path)
+
+    # polling backend
+
+    def _scan(self, directory: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for root, _, files in os.walk(directory):
+            for file in files:
+                if not file.endswith(self.suffix):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _run_poll(self) -> None:
+        last_poll = time.monotonic()
+        tick = min(self.poll_interval_seconds, max(self.debounce_seconds, 0.1))
+        while not self._stop.wait(tick):
+            if time.monotonic() - last_poll >= self.poll_interval_seconds:
+                last_poll = time.monotonic()
+                current: Dict[str, Tuple[int, int]] = {}
+                for directory in list(self.directories):
+                    current.update(self._scan(directory))
+                for path in current.keys() | self._snapshot.keys():
+                    if current.get(path) != self._snapshot.get(path):
+                        self._stats["events"] += 1
+                        self._mark(path)
+                self._snapshot = current
+            self._flush_ready()
@@ -0,0 +1,24 @@
+from typing import List, Optional
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.document_loaders import PyPDFLoader
+
+# Kept free of heavy imports (embeddings, FAISS) so it can run in spawned
+# ingestion worker processes without loading the models
+
+def load_and_split(file_path: str, course: Optional[str] = None) -> List[Document]:
+    """
+    Load a PDF and split it into chunks ready for embedding, tagged with
+    `course` when given
+    """
+    # 1. Load PDF
+    loader = PyPDFLoader(file_path)
+    documents = loader.load()
+
+    # 2. Split Text
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks = text_splitter.split_documents(documents)
+    if course:
+        for chunk in chunks:
+            chunk.metadata["course"] = course
+    return chunks
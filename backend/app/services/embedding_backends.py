@@ -0,0 +1,211 @@
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx_int8", "hash")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+HF_MODEL_ID = f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+# sentence-transformers truncates all-MiniLM-L6-v2 inputs at 256 tokens
+MAX_SEQ_LENGTH = 256
+# Same width as all-MiniLM-L6-v2 so hashed indexes look like real ones
+HASH_EMBEDDING_DIM = 384
+HASH_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def l2_normalize(vectors) -> np.ndarray:
+    """
+    Scale vectors (along the last axis) to unit length; zero vectors stay zero
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic feature-hashing embeddings: every word and word pair adds
+    +-1 to a dimension picked by its hash, then the vector is L2 normalized.
+
+    Needs no model download and embeds tens of thousands of texts per
+    second, so benchmarks and offline runs can build large indexes. Texts
+    sharing words get similar vectors, but there is no semantic
+    understanding; never use it for real retrieval.
+    """
+    def __init__(self, dimension: int = HASH_EMBEDDING_DIM):
+        self.dimension = dimension
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text).tolist() for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text).tolist()
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        words = HASH_TOKEN_PATTERN.findall(text.lower())
+        for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vector[digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        return l2_normalize(vector)
+
+
+class OnnxMiniLMEmbeddings(Embeddings):
+    """
+    all-MiniLM-L6-v2 run through ONNX Runtime instead of PyTorch.
+
+    Reproduces the sentence-transformers pipeline (tokenize, truncate to
+    256 tokens, mean pooling over the attention mask, L2 normalization), so
+    the fp32 model gives the same vectors as HuggingFaceEmbeddings up to
+    float rounding. With `quantize` the weights are converted to int8 by
+    dynamic quantization, which is faster on CPU at a small cosine drift.
+
+    The ONNX model is exported from the Hugging Face checkpoint on first use
+    (needs torch once) and cached under `model_dir`; serving only needs
+    onnxruntime and a fast tokenizer.
+    """
+    def __init__(self, model_dir: str, quantize: bool = False, batch_size: int = 32, threads: int = 0):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.model_path = self._ensure_model(model_dir, quantize)
+        has_tokenizer = os.path.exists(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir if has_tokenizer else HF_MODEL_ID)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            self.model_path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # Batch texts of similar length together to keep padding small
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = np.zeros((len(texts), 0), dtype=np.float32)
+        for start in range(0, len(order), self.batch_size):
+            rows = order[start:start + self.batch_size]
+            batch = self._embed([texts[i] for i in rows])
+            if vectors.shape[1] == 0:
+                vectors = np.zeros((len(texts), batch.shape[1]), dtype=np.float32)
+            vectors[rows] = batch
+        return vectors.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer(
+            texts, padding=True, truncation=True, max_length=MAX_SEQ_LENGTH, return_tensors="np"
+        )
+        inputs = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        if "token_type_ids" in self._input_names and "token_type_ids" not in inputs:
+            inputs["token_type_ids"] = np.zeros_like(inputs["input_ids"])
+        hidden = self.session.run(None, inputs)[0]
+
+        mask = encoded["attention_mask"].astype(np.float32)[:, :, None]
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return l2_normalize(pooled)
+
+    @staticmethod
+    def _ensure_model(model_dir: str, quantize: bool) -> str:
+        fp32_path = os.path.join(model_dir, "model.onnx")
+        int8_path = os.path.join(model_dir, "model-int8.onnx")
+        if not os.path.exists(fp32_path):
+            export_onnx_model(model_dir)
+        if not quantize:
+            return fp32_path
+        if not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            print(f"Quantizing {fp32_path} to int8")
+            tmp_path = f"{int8_path}.tmp"
+            quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+            os.replace(tmp_path, int8_path)
+        return int8_path
+
+
+def export_onnx_model(model_dir: str) -> None:
+    """
+    Export the Hugging Face all-MiniLM-L6-v2 encoder and tokenizer to `model_dir`
+    """
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    print(f"Exporting {HF_MODEL_ID} to ONNX in {model_dir}")
+    os.makedirs(model_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(HF_MODEL_ID)
+    model = AutoModel.from_pretrained(HF_MODEL_ID)
+    model.eval()
+
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    tmp_path = os.path.join(model_dir, "model.onnx.tmp")
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in names),
+            tmp_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]},
+            opset_version=14,
+        )
+    os.replace(tmp_path, os.path.join(model_dir, "model.onnx"))
+    tokenizer.save_pretrained(model_dir)
+
+
+def create_embeddings(backend: Optional[str] = None) -> Embeddings:
+    """
+    Embedding model for the configured backend. ONNX backends fall back to
+    PyTorch when onnxruntime is not installed.
+    """
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {EMBEDDING_BACKENDS}")
+
+    if backend == "hash":
+        return HashingEmbeddings()
+    if backend != "torch":
+        try:
+            return OnnxMiniLMEmbeddings(
+                settings.EMBEDDING_ONNX_DIR,
+                quantize=backend == "onnx_int8",
+                batch_size=settings.EMBEDDING_BATCH_SIZE,
+                threads=settings.EMBEDDING_THREADS,
+            )
+        except ImportError as e:
+            print(f"ONNX embedding backend unavailable ({e}), using PyTorch")
+
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def embedding_fingerprint(embeddings: Embeddings) -> Dict:
+    """
+    Identifies which model/backend produced the vectors in an index
+    """
+    if isinstance(embeddings, HashingEmbeddings):
+        return {"model": f"hashing-{embeddings.dimension}", "backend": "hash"}
+    if isinstance(embeddings, OnnxMiniLMEmbeddings):
+        backend = "onnx_int8" if embeddings.quantize else "onnx"
+    else:
+        backend = "torch"
+    return {"model": EMBEDDING_MODEL_NAME, "backend": backend}
+
+
+def cosine_agreement(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Row-wise cosine similarity between two sets of vectors
+    """
+    return (l2_normalize(a) * l2_normalize(b)).sum(axis=1)
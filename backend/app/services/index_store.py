@@ -0,0 +1,504 @@
+import fcntl
+import json
+import os
+import pickle
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from app.services import ann_index
+from app.services.shared_index import CHUNK_STORE_EXTENSION, ChunkStore, SharedIndex, write_chunk_store
+
+CURRENT_FILE = "CURRENT"
+SEGMENTS_DIR = "segments"
+LEGACY_INDEX_NAME = "index"
+EMBEDDING_FILE = "EMBEDDING"
+LOCK_FILE = "LOCK"
+LEADER_FILE = "LEADER"
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write a file so readers only ever see the old or the complete new content
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(os.path.dirname(path) or ".")
+
+
+def delete_from_store(store: FAISS, ids: List[str]) -> int:
+    """
+    Remove chunks from a LangChain FAISS store and return how many were removed.
+
+    Flat indexes drop the vectors (LangChain renumbers positions). Other
+    index types cannot renumber or remove in place, so their vectors are
+    left as tombstones: the chunk disappears from the docstore and search
+    skips the position until the next rebuild purges it.
+    """
+    present = [id_ for id_ in ids if id_ in store.docstore._dict]
+    if not present:
+        return 0
+    if isinstance(store.index, faiss.IndexFlat):
+        store.delete(present)
+    else:
+        store.docstore.delete(present)
+    return len(present)
+
+
+def tombstone_count(store: Optional[FAISS]) -> int:
+    """
+    Positions in the index whose chunk has been deleted
+    """
+    if store is None:
+        return 0
+    return len(store.index_to_docstore_id) - len(store.docstore._dict)
+
+
+@contextmanager
+def file_lock(path: str, blocking: bool = True):
+    """
+    Exclusive advisory lock shared by all processes on the host; yields
+    False instead of waiting when `blocking` is off and the lock is taken
+    """
+    with open(path, "a+b") as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class LeaderLock:
+    """
+    Elects one process per index directory to run the background work that
+    must not run once per worker (directory watching, compaction). The
+    first process to take a non-blocking flock on LEADER keeps it for its
+    lifetime; the kernel releases it when the process exits or dies, and
+    the file records who holds it.
+    """
+    def __init__(self, path: str):
+        self.path = os.path.join(path, LEADER_FILE)
+        self._file = None
+        # flock conflicts between two descriptors of the same process too
+        self._lock = threading.Lock()
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def try_acquire(self, info: Dict) -> bool:
+        with self._lock:
+            if self._file is not None:
+                return True
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            f = open(self.path, "a+")
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(info))
+            f.flush()
+            self._file = f
+            return True
+
+    def holder(self) -> Optional[Dict]:
+        """
+        What the current leader recorded about itself, if readable
+        """
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class SegmentedIndexStore:
+    """
+    On-disk persistence for the LangChain FAISS store as a base snapshot plus
+    an append-only log of segments.
+
+    Layout under `path`:
+        CURRENT                  {"base": "index-<n>", "compacted_through": <seq>, "snapshot": <n>}
+        EMBEDDING                {"model": ..., "backend": ...} that produced the vectors
+        index-<n>.faiss/.pkl     base snapshot in FAISS.save_local format
+        segments/<seq>.seg       one pickled add/delete record per change after the base
+
+    Ingest only writes a small segment with the new vectors and chunks, and
+    deletes only write the removed chunk IDs.
+    Compaction folds the segments into a new base snapshot; the snapshot is
+    written under a fresh name and only becomes live when CURRENT is
+    atomically replaced, so a crash at any point leaves a loadable index.
+    A pre-existing `index.faiss`/`index.pkl` pair is used as the initial base.
+
+    Several processes may share the directory: segment numbers are claimed
+    with an exclusive link, so concurrent writers never overwrite each
+    other. For mmap serving (see SharedIndex) snapshots also get an
+    `index-<n>.db` chunk store, and compaction runs under a host-wide lock.
+    """
+    def __init__(self, path: str, embeddings: Embeddings, chunk_store: bool = False):
+        self.path = path
+        self.embeddings = embeddings
+        # Write a chunk store next to every snapshot (mmap serving)
+        self.chunk_store = chunk_store
+        self.segments_path = os.path.join(path, SEGMENTS_DIR)
+        self._base: Optional[str] = None
+        self._compacted_through = 0
+        self._snapshot = 0
+        self._next_seq = 1
+        # Segments reflected in this process's store (memory mode)
+        self._applied: Set[int] = set()
+        self._compact_lock = threading.Lock()
+
+    @property
+    def pending_segments(self) -> int:
+        """
+        Number of segments written since the last compaction
+        """
+        return self._next_seq - 1 - self._compacted_through
+
+    def load(self) -> Optional[FAISS]:
+        """
+        Load the base snapshot and replay every segment written after it
+        """
+        self._read_current()
+
+        store = None
+        if self._base is not None:
+            store = FAISS.load_local(
+                self.path,
+                self.embeddings,
+                index_name=self._base,
+                allow_dangerous_deserialization=True
+            )
+
+        last_seq = self._compacted_through
+        for seq in self._segment_seqs():
+            if seq <= self._compacted_through:
+                continue
+            with open(self._segment_file(seq), "rb") as f:
+                record = pickle.load(f)
+            store = self._apply(store, record)
+            self._applied.add(seq)
+            last_seq = seq
+        self._next_seq = last_seq + 1
+
+        if self.pending_segments:
+            print(f"Replayed {self.pending_segments} index segment(s) on top of base snapshot")
+        return store
+
+    def append(self, ids: List[str], texts: List[str], vectors: np.ndarray, metadatas: List[Dict]) -> int:
+        """
+        Persist newly added chunks as the next segment and return its sequence number
+        """
+        return self._write_segment({
+            "op": "add",
+            "ids": ids,
+            "texts": texts,
+            "metadatas": metadatas,
+            "vectors": np.asarray(vectors, dtype=np.float32),
+        })
+
+    def append_delete(self, ids: List[str]) -> int:
+        """
+        Persist the removal of chunks as the next segment
+        """
+        return self._write_segment({"op": "delete", "ids": ids})
+
+    def _write_segment(self, record: Dict) -> int:
+        os.makedirs(self.segments_path, exist_ok=True)
+        tmp_path = os.path.join(self.segments_path, f"seg.tmp-{os.getpid()}-{threading.get_ident()}")
+        with open(tmp_path, "wb") as f:
+            f.write(pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL))
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            while True:
+                # Other processes may write segments too: start past every
+                # number in use (listed before CURRENT is read, so a
+                # compaction in between cannot hide the numbers it folded)
+                seqs = self._segment_seqs()
+                seq = max(self._next_seq, seqs[-1] + 1 if seqs else 1, self._read_compacted_through() + 1)
+                try:
+                    # link() fails instead of replacing when the number is taken
+                    os.link(tmp_path, self._segment_file(seq))
+                except FileExistsError:
+                    self._next_seq = seq + 1
+                    continue
+                self._next_seq = seq + 1
+                if self._read_compacted_through() < seq:
+                    self._applied.add(seq)
+                    break
+                # A concurrent compaction already claimed this number and may
+                # delete the file; write the record again under a later one
+                self._remove(self._segment_file(seq))
+        finally:
+            self._remove(tmp_path)
+        _fsync_dir(self.segments_path)
+        return seq
+
+    def compact(self, store: FAISS, lock: threading.RLock, force: bool = False,
+                prepare: Optional[Callable[[], None]] = None) -> None:
+        """
+        Fold all segments into a new base snapshot.
+
+        Only the in-memory serialization happens under `lock`; the file
+        writes run while searches and ingests continue. `force` writes a
+        snapshot even without pending segments, e.g. after the index was
+        rebuilt with a different type. `prepare` runs under `lock` first,
+        e.g. to replay other processes' segments into `store`.
+        """
+        with self._compact_lock:
+            with lock:
+                if prepare is not None:
+                    prepare()
+                through = self._next_seq - 1
+                if through == self._compacted_through and not force:
+                    return
+                index_bytes = faiss.serialize_index(store.index).tobytes()
+                docstore_bytes = pickle.dumps((store.docstore, store.index_to_docstore_id))
+            self._write_snapshot(through, index_bytes, docstore_bytes)
+
+    def compact_shared(self, prepare: Optional[Callable[[FAISS], bool]] = None, force: bool = False) -> bool:
+        """
+        Compaction for mmap serving, where no process holds the full store:
+        under the host-wide lock, load base and segments into a transient
+        store, let `prepare` adjust it (e.g. build the configured ANN index;
+        it returns True when it changed the store) and write the snapshot
+        with its chunk store. Returns False when another process is already
+        compacting or there was nothing to do.
+        """
+        with self._compact_lock, file_lock(self._lock_file(), blocking=False) as acquired:
+            if not acquired:
+                return False
+            store = self.load()
+            through = self._next_seq - 1
+            if store is None:
+                return False
+            changed = prepare(store) if prepare is not None else False
+            if through == self._compacted_through and not (force or changed):
+                return False
+            index_bytes = faiss.serialize_index(store.index).tobytes()
+            docstore_bytes = pickle.dumps((store.docstore, store.index_to_docstore_id))
+            self._write_snapshot(through, index_bytes, docstore_bytes, chunks=store)
+            return True
+
+    def _write_snapshot(self, through: int, index_bytes: bytes, docstore_bytes: bytes,
+                        chunks: Optional[FAISS] = None) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        snapshot = self._snapshot + 1
+        base = f"index-{snapshot:06d}"
+        atomic_write(os.path.join(self.path, f"{base}.faiss"), index_bytes)
+        atomic_write(os.path.join(self.path, f"{base}.pkl"), docstore_bytes)
+        if chunks is not None and self.chunk_store:
+            write_chunk_store(self._chunk_store_file(base), chunks)
+
+        old_base = self._base
+        atomic_write(
+            os.path.join(self.path, CURRENT_FILE),
+            json.dumps({"base": base, "compacted_through": through, "snapshot": snapshot}).encode("utf-8")
+        )
+        self._base = base
+        self._compacted_through = through
+        self._snapshot = snapshot
+
+        # The new snapshot is live; older files are garbage now
+        if old_base is not None and old_base != base:
+            for ext in (".faiss", ".pkl", CHUNK_STORE_EXTENSION):
+                self._remove(os.path.join(self.path, f"{old_base}{ext}"))
+        for seq in self._segment_seqs():
+            if seq <= through:
+                self._remove(self._segment_file(seq))
+        print(f"Compacted FAISS index into snapshot {base}")
+
+    def open_shared(self) -> SharedIndex:
+        """
+        Map the current base snapshot and replay the segments written after
+        it into a SharedIndex delta
+        """
+        self._read_current()
+        base, index, chunks = self._base, None, None
+        if base is not None:
+            self._ensure_chunk_store(base)
+            index = ann_index.load_mapped(os.path.join(self.path, f"{base}.faiss"))
+            chunks = ChunkStore(self._chunk_store_file(base))
+        shared = SharedIndex(base, index, chunks, self.embeddings)
+
+        base_now, records = self.read_updates(shared)
+        if base_now != base:
+            # Compacted while mapping; map the new snapshot instead
+            shared.close()
+            return self.open_shared()
+        for seq, record in records:
+            shared.apply(record)
+            shared.applied.add(seq)
+        if records:
+            print(f"Replayed {len(records)} index segment(s) on top of mapped snapshot {base}")
+        return shared
+
+    def read_updates(self, shared: SharedIndex) -> Tuple[Optional[str], List[Tuple[int, Dict]]]:
+        """
+        Current base name and the segments `shared` has not applied yet
+        (none when the base changed: the caller reopens instead)
+        """
+        self._read_current()
+        if self._base != shared.base_name:
+            return self._base, []
+        records = []
+        for seq in self._segment_seqs():
+            if seq <= self._compacted_through or seq in shared.applied:
+                continue
+            try:
+                with open(self._segment_file(seq), "rb") as f:
+                    records.append((seq, pickle.load(f)))
+            except FileNotFoundError:
+                # Folded into a new snapshot meanwhile; the next sync maps it
+                break
+            self._next_seq = max(self._next_seq, seq + 1)
+        return self._base, records
+
+    def _ensure_chunk_store(self, base: str) -> None:
+        """
+        Snapshots written by a memory-mode process have no chunk store yet;
+        one process converts the pickled docstore while the others wait
+        """
+        path = self._chunk_store_file(base)
+        if os.path.exists(path):
+            return
+        with file_lock(self._lock_file()):
+            if os.path.exists(path):
+                return
+            store = FAISS.load_local(self.path, self.embeddings, index_name=base, allow_dangerous_deserialization=True)
+            count = write_chunk_store(path, store)
+            _fsync_dir(self.path)
+            print(f"Wrote chunk store for snapshot {base} ({count} chunks)")
+
+    def read_embedding_fingerprint(self) -> Optional[Dict]:
+        """
+        Model/backend that produced the stored vectors, None for older indexes
+        """
+        path = os.path.join(self.path, EMBEDDING_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def write_embedding_fingerprint(self, fingerprint: Dict) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        atomic_write(os.path.join(self.path, EMBEDDING_FILE), json.dumps(fingerprint).encode("utf-8"))
+
+    def replay_foreign(self, store: Optional[FAISS]) -> Tuple[Optional[FAISS], List[Dict]]:
+        """
+        Apply to `store` the segments other processes wrote since it was
+        loaded (memory mode, where every process holds a private store), so
+        a snapshot of it keeps their changes. Returns the store and the
+        applied records; the caller holds the store's lock.
+        """
+        records = []
+        for seq in self._segment_seqs():
+            if seq <= self._compacted_through or seq in self._applied:
+                continue
+            try:
+                with open(self._segment_file(seq), "rb") as f:
+                    record = pickle.load(f)
+            except FileNotFoundError:
+                continue
+            store = self._apply(store, record)
+            self._applied.add(seq)
+            self._next_seq = max(self._next_seq, seq + 1)
+            records.append(record)
+        return store, records
+
+    def _apply(self, store: Optional[FAISS], record: Dict) -> Optional[FAISS]:
+        if record["op"] == "add":
+            text_embeddings = list(zip(record["texts"], record["vectors"].tolist()))
+            if store is None:
+                return FAISS.from_embeddings(
+                    text_embeddings, self.embeddings, metadatas=record["metadatas"], ids=record["ids"]
+                )
+            store.add_embeddings(text_embeddings, metadatas=record["metadatas"], ids=record["ids"])
+            return store
+        if record["op"] == "delete":
+            if store is not None:
+                delete_from_store(store, record["ids"])
+            return store
+        raise ValueError(f"Unknown index segment op: {record['op']}")
+
+    def _read_current(self) -> None:
+        current_path = os.path.join(self.path, CURRENT_FILE)
+        if os.path.exists(current_path):
+            with open(current_path, "r") as f:
+                current = json.load(f)
+            self._base = current["base"]
+            self._compacted_through = current["compacted_through"]
+            self._snapshot = current.get("snapshot", 0)
+        elif os.path.exists(os.path.join(self.path, f"{LEGACY_INDEX_NAME}.faiss")):
+            self._base = LEGACY_INDEX_NAME
+            self._compacted_through = 0
+            self._snapshot = 0
+        else:
+            self._base = None
+            self._compacted_through = 0
+            self._snapshot = 0
+        self._next_seq = max(self._next_seq, self._compacted_through + 1)
+
+    def _read_compacted_through(self) -> int:
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE), "r") as f:
+                return json.load(f)["compacted_through"]
+        except FileNotFoundError:
+            return 0
+
+    def _segment_seqs(self) -> List[int]:
+        if not os.path.isdir(self.segments_path):
+            return []
+        seqs = []
+        for name in os.listdir(self.segments_path):
+            if name.endswith(".seg"):
+                seqs.append(int(name[:-len(".seg")]))
+        return sorted(seqs)
+
+    def _segment_file(self, seq: int) -> str:
+        return os.path.join(self.segments_path, f"{seq:012d}.seg")
+
+    def _chunk_store_file(self, base: str) -> str:
+        return os.path.join(self.path, f"{base}{CHUNK_STORE_EXTENSION}")
+
+    def _lock_file(self) -> str:
+        os.makedirs(self.path, exist_ok=True)
+        return os.path.join(self.path, LOCK_FILE)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,192 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+
+from app.services.document_processing import load_and_split
+
+
+class IngestionPipeline:
+    """
+    Bulk ingestion of many PDFs.
+
+    Parsing and splitting run in a pool of worker processes. Chunks are
+    streamed into large embedding batches as files finish, and every batch
+    is merged into the index (and persisted) in a single step instead of
+    once per file.
+    """
+    def __init__(self, rag_service, parse_workers: int = 0, embed_batch_size: int = 512):
+        self.rag_service = rag_service
+        self.parse_workers = parse_workers or max(1, (os.cpu_count() or 2) - 1)
+        self.embed_batch_size = embed_batch_size
+        self._lock = threading.Lock()
+        self.progress: Dict = {"status": "idle"}
+
+    def run(
+        self,
+        file_paths: List[str],
+        courses: Optional[Dict[str, str]] = None,
+        on_indexed: Optional[Callable[[Dict[str, List[str]]], None]] = None,
+    ) -> Dict[str, List[str]]:
+        """
+        Ingest the given files, tagging chunks with the course in `courses`
+        (keyed by path) when there is one. `on_indexed` is called with the
+        {path: chunk IDs} of the files in each batch right after the batch is
+        persisted, so callers can record progress that survives a crash
+        midway through the run.
+
+        Returns:
+            Docstore IDs of the indexed chunks for every file that was
+            ingested successfully (files without text map to an empty list)
+        """
+        self._start_progress(len(file_paths))
+        indexed: Dict[str, List[str]] = {}
+        pending: List[Document] = []
+        pending_files: Dict[str, int] = {}  # file -> number of its chunks in `pending`
+
+        def flush():
+            if not pending:
+                return
+            start = time.perf_counter()
+            try:
+                ids = self.rag_service.add_documents(pending)
+            except Exception as e:
+                # Only this batch is lost; files indexed so far stay indexed
+                for path in pending_files:
+                    print(f"Failed to learn from {path}: {e}")
+                    self._record_failure(path, e)
+                pending.clear()
+                pending_files.clear()
+                return
+            # A file's chunks are always added to one batch together
+            offset = 0
+            batch: Dict[str, List[str]] = {}
+            for path, count in pending_files.items():
+                batch[path] = ids[offset:offset + count]
+                offset += count
+            indexed.update(batch)
+            if on_indexed is not None:
+                on_indexed(batch)
+            self._update(
+                files_indexed=len(indexed),
+                chunks_indexed=self.progress["chunks_indexed"] + len(pending),
+                last_batch_seconds=round(time.perf_counter() - start, 2),
+            )
+            pending.clear()
+            pending_files.clear()
+
+        try:
+            for path, chunks, error in self._parse(file_paths, courses or {}):
+                if error is not None:
+                    print(f"Failed to learn from {path}: {error}")
+                    self._record_failure(path, error)
+                    continue
+
+                self._update(files_parsed=self.progress["files_parsed"] + 1)
+                if not chunks:
+                    indexed[path] = []
+                    if on_indexed is not None:
+                        on_indexed({path: []})
+                    continue
+                pending.extend(chunks)
+                pending_files[path] = pending_files.get(path, 0) + len(chunks)
+                if len(pending) >= self.embed_batch_size:
+                    flush()
+            flush()
+        except Exception as e:
+            self._update(status="failed", error=str(e), finished_at=time.time())
+            raise
+
+        self._update(status="completed", finished_at=time.time(), files_indexed=len(indexed))
+        return indexed
+
+    def _parse(self, file_paths: List[str], courses: Dict[str, str]):
+        """
+        Yield (path, chunks, error) as files finish parsing, in completion order
+        """
+        # Starting worker processes costs a few seconds, not worth it for a handful of files
+        if len(file_paths) < 4 or self.parse_workers <= 1:
+            for path in file_paths:
+                try:
+                    yield path, load_and_split(path, courses.get(path)), None
+                except Exception as e:
+                    yield path, None, e
+            return
+
+        # Spawn rather than fork: the parent holds model and FAISS threads
+        context = multiprocessing.get_context("spawn")
+        workers = min(self.parse_workers, len(file_paths))
+        # Parsed chunks wait in memory until the embedder takes them, so only
+        # a couple of files per worker are submitted ahead of it
+        max_in_flight = 2 * workers
+        remaining = iter(file_paths)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {}
+
+            def submit_next() -> None:
+                path = next(remaining, None)
+                if path is not None:
+                    futures[pool.submit(load_and_split, path, courses.get(path))] = path
+
+            for _ in range(max_in_flight):
+                submit_next()
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                while done:
+                    future = done.pop()
+                    path = futures.pop(future)
+                    submit_next()
+                    try:
+                        chunks = future.result()
+                    except Exception as e:
+                        yield path, None, e
+                        continue
+                    # Drop the future before yielding so it does not pin the
+                    # chunks after the caller has batched them
+                    del future
+                    yield path, chunks, None
+                    del chunks
+
+    def _start_progress(self, files_total: int) -> None:
+        with self._lock:
+            self.progress = {
+                "status": "running",
+                "files_total": files_total,
+                "files_parsed": 0,
+                "files_indexed": 0,
+                "files_failed": 0,
+                "chunks_indexed": 0,
+                "parse_workers": self.parse_workers,
+                "embed_batch_size": self.embed_batch_size,
+                "started_at": time.time(),
+                "finished_at": None,
+                "last_batch_seconds": None,
+                "errors": [],
+            }
+
+    def _update(self, **fields) -> None:
+        with self._lock:
+            self.progress = {**self.progress, **fields}
+
+    def _record_failure(self, path: str, error: Exception) -> None:
+        with self._lock:
+            errors = (self.progress["errors"] + [f"{os.path.basename(path)}: {error}"])[-20:]
+            self.progress = {
+                **self.progress,
+                "files_failed": self.progress["files_failed"] + 1,
+                "errors": errors,
+            }
+
+    def status(self) -> Dict:
+        with self._lock:
+            progress = dict(self.progress)
+        if progress.get("status") == "running":
+            elapsed = time.time() - progress["started_at"]
+            progress["elapsed_seconds"] = round(elapsed, 1)
+            if elapsed > 0:
+                progress["chunks_per_second"] = round(progress["chunks_indexed"] / elapsed, 1)
+        return progress
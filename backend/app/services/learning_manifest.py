@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from app.services.index_store import atomic_write
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def file_sha256(path: str) -> str:
+    """
+    Content hash of a file, read in chunks so large PDFs stay out of memory
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class LearningManifest:
+    """
+    Persistent record of every file the auto-learner has ingested.
+
+    Entries are keyed by absolute path and hold the size, mtime and content
+    hash seen at ingest time together with the docstore IDs of the file's
+    chunks, so a rescan can skip unchanged files and replace or remove the
+    chunks of changed and deleted ones. Stored as JSON next to the FAISS
+    index and rewritten atomically.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable learning manifest {self.path}: {e}")
+            return
+        with self._lock:
+            self.entries = data.get("files", {})
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps({"version": 1, "files": self.entries}, indent=1)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        atomic_write(self.path, data.encode("utf-8"))
+
+    def get(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            return self.entries.get(path)
+
+    def set(self, path: str, size: int, mtime_ns: int, sha256: str, chunk_ids: List[str]) -> None:
+        with self._lock:
+            self.entries[path] = {
+                "size": size,
+                "mtime_ns": mtime_ns,
+                "sha256": sha256,
+                "chunk_ids": chunk_ids,
+            }
+
+    def remove(self, path: str) -> Optional[Dict]:
+        with self._lock:
+            return self.entries.pop(path, None)
+
+    def paths_under(self, directory: str) -> List[str]:
+        prefix = os.path.join(os.path.abspath(directory), "")
+        with self._lock:
+            return [path for path in self.entries if path.startswith(prefix)]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.entries)
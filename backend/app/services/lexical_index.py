@@ -0,0 +1,194 @@
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from app.services.course_partitions import course_key
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in is it of on or that the this to was what when where which who why with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased alphanumeric terms; "CS-301" becomes ["cs", "301"], "Q7" stays "q7"
+    """
+    return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], weights: Sequence[float], rrf_k: int
+) -> List[Tuple[str, float]]:
+    """
+    Merge ranked ID lists: score(d) = sum of weight / (rrf_k + rank of d)
+    """
+    scores: Dict[str, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class LexicalQuery:
+    """
+    What a BM25 search needs, taken from a BM25Index under the caller's lock
+    so the scoring loop can run without it: the collection statistics and
+    a copy of each query term's postings (only the requested course's when
+    there is one).
+
+    Document lengths and IDs are read from the live index while scoring;
+    chunks removed meanwhile are skipped.
+    """
+    __slots__ = ("k1", "b", "avg_length", "terms", "doc_length", "id_of")
+
+    def __init__(self, k1: float, b: float, avg_length: float, terms: List[Tuple[float, Dict[int, int]]],
+                 doc_length: Dict[int, int], id_of: Dict[int, str]):
+        self.k1 = k1
+        self.b = b
+        self.avg_length = avg_length
+        self.terms = terms  # (idf, {doc key: term frequency})
+        self.doc_length = doc_length
+        self.id_of = id_of
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        """
+        Top-k (docstore ID, BM25 score)
+        """
+        if k <= 0 or not self.terms:
+            return []
+        scores: Dict[int, float] = {}
+        for idf, postings in self.terms:
+            for key, tf in postings.items():
+                length = self.doc_length.get(key)
+                if length is None:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+                scores[key] = scores.get(key, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        hits = []
+        for key, score in heapq.nlargest(k, scores.items(), key=lambda item: item[1]):
+            id_ = self.id_of.get(key)
+            if id_ is not None:
+                hits.append((id_, score))
+        return hits
+
+
+class BM25Index:
+    """
+    Incrementally maintained in-memory BM25 inverted index over the chunks
+    in the vector store, keyed by docstore ID.
+
+    Postings map each course (None for untagged chunks) and term to {doc
+    key: term frequency}, so a course-scoped search only touches its own
+    course's postings. Document lengths, document frequencies and collection
+    statistics are updated on every add/remove, so scores never need a
+    rebuild. Like the course filters it is derived from the docstore on load
+    instead of being persisted. Not thread-safe; callers hold the RAG
+    service lock, which query() lets them release before scoring.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[Optional[str], Dict[str, Dict[int, int]]] = {}
+        self._df: Dict[str, int] = {}
+        self._doc_length: Dict[int, int] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_course: Dict[int, Optional[str]] = {}
+        self._key_of: Dict[str, int] = {}
+        self._id_of: Dict[int, str] = {}
+        self._next_key = 0
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_length)
+
+    def add(self, ids: Sequence[str], texts: Sequence[str], courses: Sequence[Optional[str]]) -> None:
+        for id_, text, course in zip(ids, texts, courses):
+            if id_ in self._key_of:
+                continue
+            key = self._next_key
+            self._next_key += 1
+            self._key_of[id_] = key
+            self._id_of[key] = id_
+
+            course = course_key(course)
+            course_postings = self._postings.setdefault(course, {})
+            counts = Counter(tokenize(text))
+            for term, tf in counts.items():
+                course_postings.setdefault(term, {})[key] = tf
+                self._df[term] = self._df.get(term, 0) + 1
+            length = sum(counts.values())
+            self._doc_length[key] = length
+            self._doc_terms[key] = tuple(counts)
+            self._doc_course[key] = course
+            self._total_length += length
+
+    def remove(self, ids: Sequence[str]) -> None:
+        for id_ in ids:
+            key = self._key_of.pop(id_, None)
+            if key is None:
+                continue
+            del self._id_of[key]
+            course = self._doc_course.pop(key)
+            course_postings = self._postings[course]
+            for term in self._doc_terms.pop(key):
+                postings = course_postings[term]
+                del postings[key]
+                if not postings:
+                    del course_postings[term]
+                df = self._df[term] - 1
+                if df:
+                    self._df[term] = df
+                else:
+                    del self._df[term]
+            if not course_postings:
+                del self._postings[course]
+            self._total_length -= self._doc_length.pop(key)
+
+    def query(self, query: str, course: Optional[str] = None) -> LexicalQuery:
+        """
+        Take what a search for `query` (optionally within one course) needs,
+        to be scored with LexicalQuery.top() after the lock is released
+        """
+        n = len(self._doc_length)
+        terms: List[Tuple[float, Dict[int, int]]] = []
+        if n:
+            course = course_key(course)
+            scopes = [self._postings.get(course, {})] if course is not None else list(self._postings.values())
+            for term in set(tokenize(query)):
+                df = self._df.get(term)
+                if not df:
+                    continue
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for course_postings in scopes:
+                    postings = course_postings.get(term)
+                    if postings:
+                        terms.append((idf, dict(postings)))
+        avg_length = self._total_length / n if n else 0.0
+        return LexicalQuery(self.k1, self.b, avg_length, terms, self._doc_length, self._id_of)
+
+    def search(self, query: str, k: int, course: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (docstore ID, BM25 score) for a query, optionally within one course
+        """
+        return self.query(query, course).top(k)
+
+    def rebuild_from_store(self, store) -> None:
+        """
+        Recreate the index from every chunk in a LangChain FAISS docstore
+        """
+        self.__init__(self.k1, self.b)
+        docs = store.docstore._dict
+        self.add(
+            list(docs),
+            [doc.page_content for doc in docs.values()],
+            [doc.metadata.get("course") for doc in docs.values()],
+        )
+
+    def stats(self) -> Dict:
+        return {"documents": len(self._doc_length), "terms": len(self._df)}
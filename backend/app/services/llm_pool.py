@@ -0,0 +1,252 @@
+import asyncio
+import time
+from typing import Collection, Dict, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.services.ollama_client import OllamaClient
+
+# Weight of the newest sample in the per-backend latency average
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class NoBackendAvailable(Exception):
+    pass
+
+
+class LLMBackend:
+    """
+    One Ollama server in the pool with its concurrency cap and health state
+    """
+    def __init__(self, name: str, client: OllamaClient, max_concurrent: int):
+        self.name = name
+        self.client = client
+        self.max_concurrent = max(1, max_concurrent)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.latency_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "name": self.name,
+            "url": self.client.base_url,
+            "model": self.client.model,
+            "max_concurrent": self.max_concurrent,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1),
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "last_error": self.last_error,
+        }
+
+
+class LLMBackendPool:
+    """
+    Routes generations across several Ollama servers.
+
+    Requests go to the healthy backend with the fewest outstanding requests
+    relative to its concurrency cap (a session's previous backend is
+    preferred while it has capacity, so its context can be reused), and
+    wait when every backend is at its cap. Backends are ejected after
+    `eject_after_failures` consecutive errors (passive) or a failed probe of
+    /api/tags (active) and are probed again until they recover. When every
+    backend is ejected the pool fails open rather than refusing all traffic.
+    """
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        eject_after_failures: int = 3,
+        ejection_seconds: float = 30.0,
+        health_check_interval: float = 10.0,
+    ):
+        if not backends:
+            raise ValueError("LLM backend pool needs at least one backend")
+        self.backends = backends
+        self.eject_after_failures = eject_after_failures
+        self.ejection_seconds = ejection_seconds
+        self.health_check_interval = health_check_interval
+        self._waiters: List[asyncio.Future] = []
+        self._health_task: Optional[asyncio.Task] = None
+        self._health_loop_owner: Optional[asyncio.AbstractEventLoop] = None
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    async def acquire(self, prefer: Optional[str] = None, exclude: Collection[str] = ()) -> LLMBackend:
+        """
+        Reserve a slot on the best backend, waiting while all are at capacity
+        """
+        self._ensure_health_checks()
+        while True:
+            candidates = [b for b in self.backends if b.name not in exclude]
+            if not candidates:
+                raise NoBackendAvailable("all LLM backends failed")
+            now = time.monotonic()
+            live = [b for b in candidates if b.available(now)] or candidates
+            free = [b for b in live if b.outstanding < b.max_concurrent]
+            if free:
+                chosen = next((b for b in free if b.name == prefer), None)
+                if chosen is None:
+                    chosen = min(free, key=lambda b: (b.outstanding / b.max_concurrent, b.latency_ms or 0.0))
+                chosen.outstanding += 1
+                chosen.requests += 1
+                return chosen
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def release(
+        self, backend: LLMBackend, ok: Optional[bool], latency_ms: Optional[float] = None, error: Optional[str] = None
+    ) -> None:
+        """
+        Return a slot; `ok` is None when the request was abandoned (e.g. the
+        client disconnected), which counts neither as success nor failure
+        """
+        backend.outstanding -= 1
+        if ok:
+            backend.consecutive_failures = 0
+            if latency_ms is not None:
+                backend.latency_ms = latency_ms if backend.latency_ms is None else (
+                    LATENCY_EWMA_ALPHA * latency_ms + (1 - LATENCY_EWMA_ALPHA) * backend.latency_ms
+                )
+        elif ok is False:
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            backend.last_error = error
+            if backend.consecutive_failures >= self.eject_after_failures:
+                self._eject(backend, error)
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _eject(self, backend: LLMBackend, reason: Optional[str]) -> None:
+        if backend.available(time.monotonic()):
+            print(f"⚠️ Ejecting LLM backend {backend.name} for {self.ejection_seconds:.0f}s: {reason}")
+        backend.ejected_until = time.monotonic() + self.ejection_seconds
+
+    def _ensure_health_checks(self) -> None:
+        # The probe task runs in the serving event loop, started on first use
+        if self.health_check_interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self._health_task is None or self._health_task.done() or self._health_loop_owner is not loop:
+            self._health_task = loop.create_task(self._health_loop())
+            self._health_loop_owner = loop
+
+    async def check_health(self) -> None:
+        """
+        Probe every backend once and update its health
+        """
+        results = await asyncio.gather(*(self._probe(b) for b in self.backends), return_exceptions=True)
+        for backend, result in zip(self.backends, results):
+            if result is True:
+                if not backend.available(time.monotonic()):
+                    print(f"✅ LLM backend {backend.name} is healthy again")
+                backend.healthy = True
+                backend.ejected_until = 0.0
+                backend.consecutive_failures = 0
+            else:
+                backend.healthy = False
+                backend.last_error = (str(result).strip().splitlines() or [type(result).__name__])[0]
+                self._eject(backend, backend.last_error)
+        self._wake_waiters()
+
+    async def _probe(self, backend: LLMBackend) -> bool:
+        response = await backend.client.client.get("/api/tags", timeout=5.0)
+        response.raise_for_status()
+        models = {m.get("name") for m in response.json().get("models", [])}
+        model = backend.client.model
+        if model not in models and f"{model}:latest" not in models:
+            raise RuntimeError(f"model {model} is not available")
+        return True
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"LLM health check failed: {e}")
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+            self._health_loop_owner = None
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    def stats(self) -> List[Dict]:
+        return [b.stats() for b in self.backends]
+
+
+def parse_backend_specs(
+    specs: Sequence[str], default_url: str, default_model: str, default_max_concurrent: int
+) -> List[Tuple[str, str, int]]:
+    """
+    (url, model, max_concurrent) for each "url[|model[|max_concurrent]]" spec;
+    no specs means a single backend at `default_url`
+    """
+    if not specs:
+        return [(default_url.rstrip("/"), default_model, default_max_concurrent)]
+    parsed = []
+    for spec in specs:
+        parts = [p.strip() for p in spec.split("|")]
+        if not parts[0]:
+            continue
+        model = parts[1] if len(parts) > 1 and parts[1] else default_model
+        max_concurrent = int(parts[2]) if len(parts) > 2 and parts[2] else settings.LLM_BACKEND_MAX_CONCURRENT
+        parsed.append((parts[0].rstrip("/"), model, max_concurrent))
+    return parsed
+
+
+def configured_backends(model_name: Optional[str] = None) -> List[Tuple[str, str, int]]:
+    return parse_backend_specs(
+        settings.LLM_BACKENDS,
+        settings.OLLAMA_BASE_URL,
+        model_name or settings.LLM_MODEL,
+        settings.LLM_MAX_CONCURRENT_GENERATIONS,
+    )
+
+
+def create_backend_pool(model_name: Optional[str] = None, options: Optional[Dict] = None) -> LLMBackendPool:
+    """
+    Backend pool for the configured Ollama servers
+    """
+    backends = []
+    for url, model, max_concurrent in configured_backends(model_name):
+        name = f"{model}@{url}"
+        if any(b.name == name for b in backends):
+            name = f"{name}#{len(backends)}"
+        client = OllamaClient(
+            url,
+            model,
+            options=options,
+            keep_alive=settings.LLM_KEEP_ALIVE,
+            timeout=settings.LLM_REQUEST_TIMEOUT_SECONDS,
+        )
+        backends.append(LLMBackend(name, client, max_concurrent))
+    return LLMBackendPool(
+        backends,
+        eject_after_failures=settings.LLM_BACKEND_EJECT_AFTER_FAILURES,
+        ejection_seconds=settings.LLM_BACKEND_EJECTION_SECONDS,
+        health_check_interval=settings.LLM_HEALTH_CHECK_INTERVAL_SECONDS,
+    )
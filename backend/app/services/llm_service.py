@@ -1,7 +1,96 @@
-from typing import Optional
-from langchain_community.llms import Ollama
-from langchain_core.prompts import PromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+import asyncio
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from app.core.concurrency import GenerationLimiter
+from app.core.config import settings
+from app.core.metrics import observe_stage, registry
+from app.services.llm_pool import LLMBackend, NoBackendAvailable, configured_backends, create_backend_pool
+from app.services.ollama_client import GenerationResult, SessionContextCache
+
+ANSWER_ERROR_MESSAGE = "I apologize, but I encountered an error while processing your question. Please try again."
+SIMPLE_ANSWER_ERROR_MESSAGE = "I don't have enough information to answer that question. Please upload relevant documents to help me learn!"
+
+# Static instructions shared by every prompt. Keeping them as an identical
+# prefix lets Ollama reuse the already evaluated prefix between requests.
+SYSTEM_PREAMBLE = """You are a helpful AI assistant for students. Answer questions clearly, concisely and accurately.
+When context is provided, use it to answer; if the context doesn't contain relevant information, say so politely."""
+
+RAG_TURN_TEMPLATE = """Context:
+{context}
+
+Question: {question}
+
+Answer:"""
+
+SIMPLE_TURN_TEMPLATE = """Question: {question}
+
+Answer:"""
+
+def _clean_answer(response: str) -> str:
+    """
+    Strip whitespace and any "Answer:" prefix the model includes
+    """
+    answer = response.strip()
+    if answer.lower().startswith("answer:"):
+        answer = answer[7:].strip()
+    return answer
+
+llm_tokens = registry.counter(
+    "dabba_llm_tokens", "Tokens evaluated or generated by Ollama", ["kind"]
+)
+
+def _observe_timings(timings: Optional[Dict]) -> None:
+    """
+    Record the prompt-eval / generation split reported by Ollama
+    """
+    if not timings:
+        return
+    observe_stage("llm.load", timings["load_ms"] / 1000)
+    observe_stage("llm.prompt_eval", timings["prompt_eval_ms"] / 1000)
+    observe_stage("llm.eval", timings["eval_ms"] / 1000)
+    llm_tokens.labels("prompt").inc(timings["prompt_tokens"])
+    llm_tokens.labels("reused_context").inc(timings["reused_context_tokens"])
+    llm_tokens.labels("generated").inc(timings["generated_tokens"])
+
+def _describe_error(error: Exception) -> str:
+    """
+    First line of an exception message (httpx appends a help link)
+    """
+    text = str(error).strip()
+    return text.splitlines()[0] if text else type(error).__name__
+
+class _AnswerPrefixStripper:
+    """
+    Streaming counterpart of _clean_answer: drops leading whitespace and an
+    "Answer:" prefix before passing tokens through
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.state = "prefix"  # prefix -> leading -> passthrough
+
+    def feed(self, chunk: str) -> str:
+        if self.state == "passthrough":
+            return chunk
+        
+        self.buffer = (self.buffer + chunk).lstrip()
+        if self.state == "prefix":
+            # Hold back tokens until we know whether the model echoed "Answer:"
+            if "answer:".startswith(self.buffer.lower()):
+                return ""
+            if self.buffer.lower().startswith("answer:"):
+                self.buffer = self.buffer[7:].lstrip()
+            self.state = "leading"
+        
+        text, self.buffer = self.buffer, ""
+        if text:
+            self.state = "passthrough"
+        return text
+
+    def flush(self) -> str:
+        if self.state == "prefix" and self.buffer.lower() != "answer:":
+            return self.buffer
+        return ""
 
 class LLMService:
     """
@@ -16,97 +105,263 @@ class LLMService:
         """
         print(f"Initializing LLM service with Ollama model: {model_name}...")
         
-        # Initialize Ollama LLM
-        self.llm = Ollama(
-            model=model_name,
-            temperature=0.7,
-            num_predict=512,  # Max tokens to generate
+        # One client per configured Ollama server: they expose Ollama's
+        # context tokens and timings, and the pool balances load across servers
+        self.pool = create_backend_pool(
+            model_name,
+            options={
+                "temperature": settings.LLM_TEMPERATURE,
+                "num_predict": settings.LLM_NUM_PREDICT,
+                "num_ctx": settings.LLM_NUM_CTX,
+            },
         )
-        
-        # Output parser
-        self.output_parser = StrOutputParser()
-        
-        # Define prompt template for RAG
-        self.rag_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""You are a helpful AI assistant for students. Use the following context to answer the question clearly and concisely.
-If the context doesn't contain relevant information, say so politely.
-
-Context:
-{context}
-
-Question: {question}
-
-Answer:"""
-        )
-        
-        # Define prompt for questions without context
-        self.simple_prompt = PromptTemplate(
-            input_variables=["question"],
-            template="""You are a helpful AI assistant for students. Answer the following question concisely and accurately.
-
-Question: {question}
-
-Answer:"""
+        # Follow-up turns continue from the session's previous context; keep
+        # room for the next turn (~1k prompt tokens) and its answer
+        self.session_contexts = SessionContextCache(
+            max_sessions=settings.LLM_SESSION_CONTEXT_MAX_SESSIONS,
+            ttl_seconds=settings.LLM_SESSION_CONTEXT_TTL_SECONDS,
+            max_tokens=max(0, settings.LLM_NUM_CTX - settings.LLM_NUM_PREDICT - 1024),
         )
         
-        # Create chains using LCEL (LangChain Expression Language)
-        self.rag_chain = self.rag_prompt | self.llm | self.output_parser
-        self.simple_chain = self.simple_prompt | self.llm | self.output_parser
-        
         print("✅ LLM service initialized successfully!")
     
-    def generate_answer(self, question: str, context: str) -> str:
+    async def agenerate(
+        self, question: str, context: Optional[str] = None, session_id: Optional[str] = None
+    ) -> GenerationResult:
         """
-        Generate a coherent answer from the question and context
+        Generate an answer (from context when given) without blocking the
+        event loop, continuing the session's previous Ollama context
         
         Args:
             question: User's question
-            context: Retrieved context from RAG
+            context: Retrieved context from RAG, None for a general answer
+            session_id: Chat session whose evaluated context can be reused
             
         Returns:
-            Generated answer
+            Generated answer with prompt-eval and generation timings
         """
-        try:
-            response = self.rag_chain.invoke({"question": question, "context": context})
-            # Clean up the response
-            answer = response.strip()
+        prompt = self._turn_prompt(question, context)
+        tried = set()
+        while True:
+            try:
+                backend = await self.pool.acquire(self._preferred_backend(session_id), exclude=tried)
+            except NoBackendAvailable as e:
+                print(f"❌ Error generating answer: {e}")
+                self._forget(session_id)
+                return GenerationResult(ANSWER_ERROR_MESSAGE if context is not None else SIMPLE_ANSWER_ERROR_MESSAGE)
             
-            # Remove any "Answer:" prefix if the model includes it
-            if answer.lower().startswith("answer:"):
-                answer = answer[7:].strip()
-                
-            return answer
-        except Exception as e:
-            print(f"❌ Error generating answer: {e}")
-            return "I apologize, but I encountered an error while processing your question. Please try again."
+            system, history = self._history(session_id, backend)
+            started = time.monotonic()
+            ok, error = None, None
+            try:
+                result = await backend.client.generate(prompt, system=system, context=history)
+                ok = True
+            except Exception as e:
+                ok, error = False, _describe_error(e)
+            finally:
+                elapsed = time.monotonic() - started
+                self.pool.release(backend, ok, elapsed * 1000, error)
+                observe_stage("llm.generate" if ok else "llm.generate_failed", elapsed)
+            
+            if ok:
+                _observe_timings(result.timings)
+                self._remember(session_id, backend, result)
+                result.text = _clean_answer(result.text)
+                return result
+            # Nothing was returned yet, so the turn can be retried elsewhere
+            print(f"⚠️ LLM backend {backend.name} failed ({error}), trying another backend")
+            tried.add(backend.name)
     
-    def generate_simple_answer(self, question: str) -> str:
+    def astream(
+        self, question: str, context: Optional[str] = None, session_id: Optional[str] = None
+    ) -> "AnswerStream":
         """
-        Generate an answer without context (when no documents are available)
-        
-        Args:
-            question: User's question
-            
-        Returns:
-            Generated answer
+        Stream an answer token by token; the returned stream's `timings` are
+        set once generation has finished
+        """
+        return AnswerStream(self, question, context, session_id)
+    
+    def continues_session(self, session_id: Optional[str]) -> bool:
+        """
+        Whether the session's next turn builds on the Ollama context of its
+        earlier turns, so its answer depends on that conversation
+        """
+        return self._preferred_backend(session_id) is not None
+    
+    def forget_session(self, session_id: str) -> None:
         """
-        try:
-            response = self.simple_chain.invoke({"question": question})
-            # Clean up the response
-            answer = response.strip()
+        Drop the reusable Ollama context of a chat session
+        """
+        self.session_contexts.forget(session_id)
+    
+    async def awarm_up(self) -> str:
+        """
+        Warm every backend with a dummy generation (see OllamaClient.warm_up);
+        fails only when none of them could be warmed
+        """
+        results = await asyncio.gather(
+            *(backend.client.warm_up() for backend in self.pool.backends), return_exceptions=True
+        )
+        warmed = []
+        for backend, result in zip(self.pool.backends, results):
+            if isinstance(result, Exception):
+                print(f"⚠️ LLM warm-up failed on {backend.name}: {_describe_error(result)}")
+                continue
+            warmed.append(backend.name)
+            print(f"🔥 LLM {backend.client.model} warm on {backend.name} (load {result.get('load_ms', 0):.0f} ms)")
+        if not warmed:
+            raise RuntimeError(f"no LLM backend could be warmed ({len(results)} configured)")
+        return f"{len(warmed)}/{len(results)} backends warm"
+
+    def pool_status(self) -> List[Dict]:
+        """
+        Load and health of every LLM backend
+        """
+        return self.pool.stats()
+    
+    async def aclose(self) -> None:
+        await self.pool.aclose()
+    
+    @staticmethod
+    def _turn_prompt(question: str, context: Optional[str]) -> str:
+        if context is not None:
+            return RAG_TURN_TEMPLATE.format(context=context, question=question)
+        return SIMPLE_TURN_TEMPLATE.format(question=question)
+    
+    def _preferred_backend(self, session_id: Optional[str]) -> Optional[str]:
+        # A session's context only exists on the backend that produced it
+        if session_id and settings.LLM_SESSION_CONTEXT_ENABLED:
+            return self.session_contexts.backend_of(session_id)
+        return None
+    
+    def _history(
+        self, session_id: Optional[str], backend: LLMBackend
+    ) -> Tuple[Optional[str], Optional[List[int]]]:
+        """
+        (system, previous context) for a turn on `backend`. The system
+        preamble is only sent when the turn does not continue a session.
+        """
+        history = None
+        if session_id and settings.LLM_SESSION_CONTEXT_ENABLED:
+            history = self.session_contexts.get(session_id, backend.name)
+        return None if history else SYSTEM_PREAMBLE, history
+    
+    def _remember(self, session_id: Optional[str], backend: LLMBackend, result: GenerationResult) -> None:
+        if session_id and settings.LLM_SESSION_CONTEXT_ENABLED:
+            self.session_contexts.put(session_id, backend.name, result.context)
+        if result.timings:
+            t = result.timings
+            t["backend"] = backend.name
+            print(
+                f"⏱️ LLM prompt eval ({backend.name}): {t['prompt_tokens']} tokens in {t['prompt_eval_ms']} ms "
+                f"({t['reused_context_tokens']} reused), generation: {t['generated_tokens']} tokens in {t['eval_ms']} ms"
+            )
+    
+    def _forget(self, session_id: Optional[str]) -> None:
+        if session_id:
+            self.session_contexts.forget(session_id)
+
+class AnswerStream:
+    """
+    Async iterator over the answer chunks of one streamed generation.
+
+    When generation fails the iteration just ends and `error` holds the
+    message to show instead; it is never streamed as part of the answer.
+    """
+    def __init__(self, service: LLMService, question: str, context: Optional[str], session_id: Optional[str]):
+        self.service = service
+        self.question = question
+        self.context = context
+        self.session_id = session_id
+        self.timings: Optional[Dict] = None
+        self.error: Optional[str] = None
+    
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._run()
+    
+    async def _run(self) -> AsyncIterator[str]:
+        service = self.service
+        prompt = service._turn_prompt(self.question, self.context)
+        stripper = _AnswerPrefixStripper()
+        tried = set()
+        ok, error = None, None
+        while True:
+            try:
+                backend = await service.pool.acquire(service._preferred_backend(self.session_id), exclude=tried)
+            except NoBackendAvailable as e:
+                error = str(e)
+                break
             
-            # Remove any "Answer:" prefix if the model includes it
-            if answer.lower().startswith("answer:"):
-                answer = answer[7:].strip()
-                
-            return answer
-        except Exception as e:
-            print(f"❌ Error generating simple answer: {e}")
-            return "I don't have enough information to answer that question. Please upload relevant documents to help me learn!"
+            system, history = service._history(self.session_id, backend)
+            started = time.monotonic()
+            ok, error, streamed = None, None, False
+            try:
+                async for item in backend.client.stream(prompt, system=system, context=history):
+                    if isinstance(item, GenerationResult):
+                        service._remember(self.session_id, backend, item)
+                        self.timings = item.timings
+                        _observe_timings(item.timings)
+                        continue
+                    if not streamed:
+                        observe_stage("llm.first_token", time.monotonic() - started)
+                    streamed = True
+                    text = stripper.feed(item)
+                    if text:
+                        yield text
+                ok = True
+            except Exception as e:
+                ok, error = False, _describe_error(e)
+            finally:
+                elapsed = time.monotonic() - started
+                service.pool.release(backend, ok, elapsed * 1000, error)
+                observe_stage("llm.stream" if ok else "llm.stream_failed", elapsed)
+            
+            if ok or streamed:
+                break
+            # Fail over only before any token reached the client
+            print(f"⚠️ LLM backend {backend.name} failed ({error}), trying another backend")
+            tried.add(backend.name)
+        
+        if not ok:
+            print(f"❌ Error streaming answer: {error}")
+            service._forget(self.session_id)
+            self.error = ANSWER_ERROR_MESSAGE if self.context is not None else SIMPLE_ANSWER_ERROR_MESSAGE
+            return
+        tail = stripper.flush()
+        if tail:
+            yield tail
 
 # Global instance (lazy loaded)
 _llm_service: Optional[LLMService] = None
+_llm_service_lock = threading.Lock()
+
+# Shared cap on concurrent generations across all chat requests in this
+# worker; never below what the backend pool can serve at once
+generation_limiter = GenerationLimiter(
+    max_concurrent=max(
+        settings.LLM_MAX_CONCURRENT_GENERATIONS,
+        sum(max_concurrent for _, _, max_concurrent in configured_backends()),
+    ),
+    max_queued=settings.LLM_MAX_QUEUED_GENERATIONS,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+)
+
+def _collect_metrics():
+    stats = generation_limiter.stats()
+    yield "dabba_generation_in_flight", "gauge", "LLM generations holding a slot", {}, stats["in_flight"]
+    yield "dabba_generation_waiting", "gauge", "Requests waiting for a generation slot", {}, stats["waiting"]
+    if _llm_service is None:
+        return
+    for backend in _llm_service.pool_status():
+        labels = {"backend": backend["name"]}
+        yield "dabba_llm_backend_outstanding", "gauge", "Requests in flight per LLM backend", labels, backend["outstanding"]
+        yield "dabba_llm_backend_healthy", "gauge", "1 when the LLM backend passes health checks and is not ejected", labels, int(
+            backend["healthy"] and not backend["ejected_for_seconds"]
+        )
+        yield "dabba_llm_backend_requests_total", "counter", "Requests sent to each LLM backend", labels, backend["requests"]
+        yield "dabba_llm_backend_failures_total", "counter", "Failed requests per LLM backend", labels, backend["failures"]
+
+registry.add_collector(_collect_metrics)
 
 def get_llm_service() -> LLMService:
     """
@@ -114,5 +369,15 @@ def get_llm_service() -> LLMService:
     """
     global _llm_service
     if _llm_service is None:
-        _llm_service = LLMService()
+        # The startup warm-up creates it on a worker thread
+        with _llm_service_lock:
+            if _llm_service is None:
+                _llm_service = LLMService(settings.LLM_MODEL)
     return _llm_service
+
+async def close_llm_service() -> None:
+    """
+    Stop health checks and close backend connections, if the service was created
+    """
+    if _llm_service is not None:
+        await _llm_service.aclose()
@@ -0,0 +1,211 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from importlib import metadata
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.verification_service import ANALYSIS_VERSION
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def cache_version() -> str:
+    """
+    Everything that changes what a cached report would contain: the OCR
+    model, the report analysis and the rasterization settings
+    """
+    try:
+        ocr_version = metadata.version("paddleocr")
+    except metadata.PackageNotFoundError:
+        ocr_version = "none"
+    return (
+        f"paddleocr={ocr_version};analysis={ANALYSIS_VERSION};"
+        f"max_side={settings.VERIFICATION_MAX_IMAGE_SIDE};dpi={settings.VERIFICATION_PDF_DPI};"
+        f"max_pages={settings.VERIFICATION_PDF_MAX_PAGES}"
+    )
+
+
+class OCRResultCache:
+    """
+    Persistent verification reports keyed by the SHA-256 of the uploaded bytes.
+
+    Lives in a SQLite file (WAL mode) so it survives restarts. Entries are
+    evicted least recently used once their total size exceeds
+    `max_bytes`, and the whole cache is dropped when `version` (OCR model,
+    analysis and rasterization settings) differs from the stored one.
+
+    Image reports also carry a perceptual dHash; new scans within
+    `max_distance` bits of a cached one are reported as near-duplicates.
+    Near-duplicates are only flagged, never answered from the cache: an
+    edited copy of a certificate is itself a near-duplicate of the original.
+    """
+    def __init__(self, path: str, max_bytes: int, version: str, max_distance: int = 6):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS ocr_cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ocr_results (
+                content_hash TEXT PRIMARY KEY,
+                perceptual_hash TEXT,
+                report TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS ocr_results_last_used ON ocr_results (last_used);
+        """)
+        self.hits = 0
+        self.misses = 0
+        self.near_duplicates_found = 0
+        self._check_version()
+        # Perceptual hashes are matched in memory: content hash -> dHash
+        self._perceptual: Dict[str, int] = {
+            row[0]: int(row[1], 16)
+            for row in self._conn.execute(
+                "SELECT content_hash, perceptual_hash FROM ocr_results WHERE perceptual_hash IS NOT NULL"
+            )
+        }
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Cached report for exactly these bytes, or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT report, created_at FROM ocr_results WHERE content_hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute(
+                "UPDATE ocr_results SET last_used = ?, hits = hits + 1 WHERE content_hash = ?",
+                (time.time(), key),
+            )
+            self.hits += 1
+        report = json.loads(row[0])
+        report["cache"] = {"hit": "exact", "first_seen": row[1]}
+        return report
+
+    def near_duplicates(self, perceptual_hash: Optional[str], exclude: Optional[str] = None) -> List[Dict]:
+        """
+        Cached scans whose dHash is within `max_distance` bits, closest first
+        """
+        if not perceptual_hash or self.max_distance < 0:
+            return []
+        target = int(perceptual_hash, 16)
+        with self._lock:
+            matches = sorted(
+                (distance, key)
+                for key, value in self._perceptual.items()
+                if key != exclude and (distance := hamming_distance(target, value)) <= self.max_distance
+            )[:5]
+            if matches:
+                self.near_duplicates_found += 1
+        return [{"content_hash": key, "distance": distance} for distance, key in matches]
+
+    def put(self, key: str, report: Dict) -> None:
+        # Failed verifications (e.g. OCR unavailable) are retried next time
+        if report.get("status") == "error":
+            return
+        stored = {k: v for k, v in report.items() if k not in ("case_id", "cache")}
+        data = json.dumps(stored, separators=(",", ":"))
+        perceptual_hash = stored.get("perceptual_hash")
+        now = time.time()
+        with self._lock:
+            with self._transaction():
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO ocr_results "
+                    "(content_hash, perceptual_hash, report, size_bytes, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, perceptual_hash, data, len(data), now, now),
+                )
+                self._evict()
+            if perceptual_hash:
+                self._perceptual[key] = int(perceptual_hash, 16)
+
+    def clear(self) -> None:
+        with self._lock:
+            with self._transaction():
+                self._conn.execute("DELETE FROM ocr_results")
+            self._perceptual.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ocr_results"
+            ).fetchone()
+        return {
+            "path": self.path,
+            "version": self.version,
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "near_duplicates_found": self.near_duplicates_found,
+        }
+
+    @contextmanager
+    def _transaction(self):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+
+    def _check_version(self) -> None:
+        with self._transaction():
+            row = self._conn.execute("SELECT value FROM ocr_cache_meta WHERE key = 'version'").fetchone()
+            if row is not None and row[0] == self.version:
+                return
+            if row is not None:
+                print(f"OCR cache version changed ({row[0]} -> {self.version}), clearing cached reports")
+            self._conn.execute("DELETE FROM ocr_results")
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ocr_cache_meta (key, value) VALUES ('version', ?)", (self.version,)
+            )
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM ocr_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+            "SELECT content_hash, size_bytes FROM ocr_results ORDER BY last_used"
+        ).fetchall():
+            self._conn.execute("DELETE FROM ocr_results WHERE content_hash = ?", (key,))
+            self._perceptual.pop(key, None)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+
+ocr_cache: Optional[OCRResultCache] = None
+if settings.OCR_CACHE_ENABLED:
+    ocr_cache = OCRResultCache(
+        settings.OCR_CACHE_PATH,
+        settings.OCR_CACHE_MAX_MB * 1024 * 1024,
+        cache_version(),
+        max_distance=settings.OCR_CACHE_NEAR_DUPLICATE_DISTANCE,
+    )
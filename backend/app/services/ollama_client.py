@@ -0,0 +1,225 @@
+import asyncio
+import json
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+
+NS_PER_MS = 1_000_000
+
+
+class GenerationResult:
+    """
+    Text of one Ollama generation with its returned context and timings
+    """
+    __slots__ = ("text", "context", "timings")
+
+    def __init__(self, text: str, context: Optional[List[int]] = None, timings: Optional[Dict] = None):
+        self.text = text
+        self.context = context
+        self.timings = timings
+
+
+def parse_timings(payload: Dict, reused_tokens: int = 0) -> Dict:
+    """
+    Prompt evaluation vs generation timings from an Ollama final response
+    """
+    eval_ns = payload.get("eval_duration") or 0
+    eval_count = payload.get("eval_count") or 0
+    return {
+        "prompt_tokens": payload.get("prompt_eval_count") or 0,
+        "reused_context_tokens": reused_tokens,
+        "prompt_eval_ms": round((payload.get("prompt_eval_duration") or 0) / NS_PER_MS, 1),
+        "generated_tokens": eval_count,
+        "eval_ms": round(eval_ns / NS_PER_MS, 1),
+        "load_ms": round((payload.get("load_duration") or 0) / NS_PER_MS, 1),
+        "total_ms": round((payload.get("total_duration") or 0) / NS_PER_MS, 1),
+        "tokens_per_second": round(eval_count / (eval_ns / 1e9), 1) if eval_ns else None,
+    }
+
+
+class OllamaClient:
+    """
+    Async client for Ollama's /api/generate endpoint.
+
+    Unlike the LangChain wrapper it exposes the `context` token array that
+    Ollama returns, so a follow-up turn can continue from the previous one
+    and only the new tokens are evaluated, plus `keep_alive` and the
+    prompt-eval/eval timings of every request.
+    """
+    def __init__(
+        self,
+        base_url: str,
+        model: str,
+        options: Optional[Dict] = None,
+        keep_alive: str = "30m",
+        timeout: float = 120.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.options = options or {}
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Connections belong to an event loop; create the client on first use
+        # in the serving loop (and again if the loop was replaced)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url, timeout=httpx.Timeout(self.timeout, connect=5.0)
+            )
+            self._client_loop = loop
+        return self._client
+
+    def _payload(self, prompt: str, system: Optional[str], context: Optional[List[int]], stream: bool) -> Dict:
+        payload = {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": self.options,
+        }
+        if system is not None:
+            payload["system"] = system
+        if context:
+            payload["context"] = list(context)
+        return payload
+
+    async def generate(
+        self, prompt: str, system: Optional[str] = None, context: Optional[List[int]] = None
+    ) -> GenerationResult:
+        response = await self.client.post("/api/generate", json=self._payload(prompt, system, context, stream=False))
+        response.raise_for_status()
+        data = response.json()
+        return GenerationResult(
+            data.get("response", ""),
+            data.get("context"),
+            parse_timings(data, len(context) if context else 0),
+        )
+
+    async def warm_up(self) -> Dict:
+        """
+        Load the model into the server's memory with a one-token generation,
+        so the first real request does not wait for the model to load
+        """
+        payload = self._payload("Hello", None, None, stream=False)
+        payload["options"] = {**self.options, "num_predict": 1}
+        response = await self.client.post("/api/generate", json=payload)
+        response.raise_for_status()
+        return parse_timings(response.json())
+
+    async def stream(
+        self, prompt: str, system: Optional[str] = None, context: Optional[List[int]] = None
+    ) -> AsyncIterator[Union[str, GenerationResult]]:
+        """
+        Yield text chunks as they are generated, then the final GenerationResult
+        """
+        parts = []
+        payload = self._payload(prompt, system, context, stream=True)
+        async with self.client.stream("POST", "/api/generate", json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                chunk = data.get("response", "")
+                if chunk:
+                    parts.append(chunk)
+                    yield chunk
+                if data.get("done"):
+                    yield GenerationResult(
+                        "".join(parts),
+                        data.get("context"),
+                        parse_timings(data, len(context) if context else 0),
+                    )
+                    return
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+
+
+class SessionContextCache:
+    """
+    Ollama context (token IDs of the conversation so far) per chat session.
+
+    Contexts are kept as compact int arrays, bounded by session count (LRU)
+    and idle TTL, and dropped once they would no longer leave room for a new
+    turn in the model's context window.
+    """
+    def __init__(self, max_sessions: int, ttl_seconds: float, max_tokens: int):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_tokens = max_tokens
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # session -> (backend, tokens, last_used)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session_id: str, backend: str) -> Optional[List[int]]:
+        with self._lock:
+            entry = self._valid_entry(session_id)
+            if entry is None or entry[0] != backend:
+                self._entries.pop(session_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            return entry[1].tolist()
+
+    def backend_of(self, session_id: str) -> Optional[str]:
+        """
+        Backend that holds the session's reusable context, to route its next
+        turn there; None (and the entry dropped) once it has expired or grown
+        too long to reuse
+        """
+        with self._lock:
+            entry = self._valid_entry(session_id)
+            return entry[0] if entry is not None else None
+
+    def _valid_entry(self, session_id: str) -> Optional[tuple]:
+        """
+        The session's entry if its context can still be reused, dropping it
+        otherwise (caller holds the lock)
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry[2] > self.ttl_seconds or len(entry[1]) > self.max_tokens:
+            del self._entries[session_id]
+            return None
+        return entry
+
+    def put(self, session_id: str, backend: str, context: Optional[List[int]]) -> None:
+        with self._lock:
+            if not context:
+                self._entries.pop(session_id, None)
+                return
+            self._entries[session_id] = (backend, array("i", context), time.monotonic())
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "tokens": sum(len(e[1]) for e in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
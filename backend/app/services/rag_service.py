@@ -1,47 +1,991 @@
-from typing import List, Optional
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from typing import Callable, Dict, List, Optional, Tuple
 from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from app.core.concurrency import MicroBatcher
+from app.core.config import settings
+from app.core.metrics import registry, timed, track_stage
+from app.core.readiness import readiness
+from app.services.document_processing import load_and_split
+from app.services.index_store import LeaderLock, SegmentedIndexStore, delete_from_store, tombstone_count
+from app.services.shared_index import SharedIndex
+from app.services import ann_index
+from app.services.course_partitions import CourseFilters, course_key
+from app.services.lexical_index import BM25Index, reciprocal_rank_fusion
+from app.services.embedding_backends import cosine_agreement, create_embeddings, embedding_fingerprint
+import asyncio
+import faiss
+import functools
+import numpy as np
+import threading
+import time
+import uuid
 import os
 
+INDEX_SERVING_MODES = ("memory", "mmap")
+
 class RAGService:
+    """
+    Retrieval over the FAISS index. Construction is cheap: the embedding
+    model and the index are loaded by load(), called by the startup warm-up
+    or, failing that, on first use, so importing the app never waits for them.
+
+    With INDEX_SERVING_MODE=mmap the index is served from a SharedIndex
+    (memory-mapped snapshot plus a small delta) instead of a private
+    LangChain store, so every worker process on the host shares one copy.
+    """
     def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
         self.vector_store_path = "faiss_index"
-        self.vector_store = self._load_or_create_index()
+        self.mapped = settings.INDEX_SERVING_MODE == "mmap"
+        self._embeddings: Optional[Embeddings] = None
+        self._index_store: Optional[SegmentedIndexStore] = None
+        self._vector_store: Optional[FAISS] = None
+        self.shared_index: Optional[SharedIndex] = None
+        # One process per index directory watches folders and compacts
+        self.leader = LeaderLock(self.vector_store_path)
+        self._warned_follower = False
+        self._loaded = False
+        self._loading = False
+        self._load_lock = threading.RLock()
+        # Bumped whenever the index content changes so caches can invalidate
+        self.index_version = 0
+        # Guards the FAISS index and docstore against concurrent ingest/search
+        self._lock = threading.RLock()
+
+        # Segments are folded into a new base snapshot in the background,
+        # periodically or as soon as too many have piled up
+        self._compaction_requested = threading.Event()
+        threading.Thread(target=self._compaction_loop, name="index-compaction", daemon=True).start()
+
+        # Background ANN index (re)builds
+        self._rebuilding = False
+        self._delete_generation = 0
+        self._trained_ntotal = 0
+        self.index_report: Optional[Dict] = None
+        self.embedding_mismatch: Optional[Dict] = None
+        # Course-scoped queries search the global index filtered to their course
+        self.course_filters = CourseFilters()
+        # Course-scoped queries answered from the whole index instead
+        self.course_fallbacks = 0
+        # Keyword (BM25) index over the same chunks for hybrid retrieval
+        self.lexical_index = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+
+        # Concurrent queries are embedded and searched in batches
+        self.embedding_batcher = MicroBatcher(
+            self._embed_batch,
+            max_batch_size=settings.QUERY_BATCH_MAX_SIZE,
+            max_wait_ms=settings.QUERY_BATCH_MAX_WAIT_MS,
+            name="query-embedding",
+        )
+        self.search_batcher = MicroBatcher(
+            self._search_batch,
+            max_batch_size=settings.QUERY_BATCH_MAX_SIZE,
+            max_wait_ms=settings.QUERY_BATCH_MAX_WAIT_MS,
+            name="query-search",
+        )
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if not self._loaded:
+            self.load()
+        return self._embeddings
+
+    @property
+    def index_store(self) -> SegmentedIndexStore:
+        if not self._loaded:
+            self.load()
+        return self._index_store
+
+    @property
+    def vector_store(self) -> Optional[FAISS]:
+        if not self._loaded:
+            self.load()
+        return self._vector_store
+
+    @vector_store.setter
+    def vector_store(self, store: Optional[FAISS]) -> None:
+        self._vector_store = store
+
+    @property
+    def ntotal(self) -> int:
+        """
+        Vectors in the index; 0 before it is loaded
+        """
+        if self.shared_index is not None:
+            return self.shared_index.ntotal
+        store = self._vector_store
+        return store.index.ntotal if store is not None else 0
+
+    @property
+    def empty(self) -> bool:
+        """
+        True when there is nothing to search; loads the index on first use
+        """
+        if not self._loaded:
+            self.load()
+        if self.shared_index is not None:
+            return not self.shared_index
+        return self._vector_store is None
+
+    def claim_leadership(self) -> bool:
+        """
+        Try to become the process that runs directory watching and
+        compaction for the index directory; idempotent.
+
+        In mmap mode the other workers follow the leader through the
+        segment log. In memory mode every process keeps a private index:
+        followers (e.g. further uvicorn workers) serve the index as loaded
+        plus their own changes, and the leader replays their segments before
+        compacting so none are lost.
+        """
+        if self.leader.try_acquire({"pid": os.getpid(), "mode": settings.INDEX_SERVING_MODE}):
+            return True
+        if not self.mapped and not self._warned_follower:
+            self._warned_follower = True
+            holder = self.leader.holder() or {}
+            print(
+                f"⚠️ Index directory '{self.vector_store_path}' is led by process {holder.get('pid')}; this worker "
+                f"will not watch directories or compact, and with INDEX_SERVING_MODE=memory it only sees "
+                f"other workers' new documents after a restart. Use INDEX_SERVING_MODE=mmap for several workers"
+            )
+        return False
+
+    def load(self) -> None:
+        """
+        Load the embedding model and the persisted index. Idempotent; other
+        threads wait for a load in progress, and a failed load is retried
+        on next use.
+        """
+        with self._load_lock:
+            # _loading: re-entered from this thread while loading
+            if self._loaded or self._loading:
+                return
+            self._loading = True
+            readiness.loading("rag")
+            try:
+                with track_stage("rag.load"):
+                    self._load()
+                self._loaded = True
+                readiness.ready("rag", f"{self.ntotal} vectors")
+            except Exception as e:
+                readiness.failed("rag", e)
+                raise
+            finally:
+                self._loading = False
+
+    def _load(self) -> None:
+        if settings.INDEX_SERVING_MODE not in INDEX_SERVING_MODES:
+            raise ValueError(f"Unknown index serving mode '{settings.INDEX_SERVING_MODE}', expected one of {INDEX_SERVING_MODES}")
+        self.claim_leadership()
+        self._embeddings = create_embeddings()
+        self._index_store = SegmentedIndexStore(self.vector_store_path, self._embeddings, chunk_store=self.mapped)
+        if self.mapped:
+            self.shared_index = self._index_store.open_shared()
+            self._check_shared_embeddings()
+            # Other workers write segments and snapshots to the same directory
+            threading.Thread(target=self._sync_loop, name="index-sync", daemon=True).start()
+            return
+        self._vector_store = self._load_or_create_index()
+        if self._vector_store is not None:
+            self.course_filters.resync(self._vector_store)
+            self.lexical_index.rebuild_from_store(self._vector_store)
+            ann_index.apply_search_params(self._vector_store.index)
+            self._trained_ntotal = self._vector_store.index.ntotal
+            # Vectors written by another embedding backend/model must not be
+            # mixed with queries embedded by this one
+            self._check_embedding_compatibility()
+            self._maybe_schedule_rebuild()
+
+    def warm_up(self) -> None:
+        """
+        Load, then run one query through embedding and search so the first
+        real request does not pay for lazy initialization in the model runtime
+        """
+        self.load()
+        self.search("warm up")
 
     def _load_or_create_index(self):
         if os.path.exists(self.vector_store_path):
-            return FAISS.load_local(
-                self.vector_store_path, 
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            return self._index_store.load()
         return None
 
-    def ingest_file(self, file_path: str):
-        # 1. Load PDF
-        loader = PyPDFLoader(file_path)
-        documents = loader.load()
-
-        # 2. Split Text
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-        texts = text_splitter.split_documents(documents)
+    @timed("rag.ingest_file")
+    def ingest_file(self, file_path: str, course: Optional[str] = None):
+        # 1-2. Load PDF and split text
+        with track_stage("rag.load_split"):
+            texts = load_and_split(file_path, course=course)
+        if not texts:
+            return 0
 
         # 3. Embed & Store
-        if self.vector_store is None:
-            self.vector_store = FAISS.from_documents(texts, self.embeddings)
-        else:
-            self.vector_store.add_documents(texts)
-        
-        # 4. Save Index
-        self.vector_store.save_local(self.vector_store_path)
+        self.add_documents(texts)
         return len(texts)
 
-    def search(self, query: str, k: int = 3):
-        if not self.vector_store:
+    def add_documents(self, texts: List[Document]) -> List[str]:
+        """
+        Embed chunks, add them to the index and persist them as a new segment
+        
+        Returns:
+            Docstore IDs of the added chunks
+        """
+        # Embed outside the lock so searches keep running
+        contents = [t.page_content for t in texts]
+        metadatas = [t.metadata for t in texts]
+        with track_stage("rag.embed_documents"):
+            vectors = self.embeddings.embed_documents(contents)
+        ids = [str(uuid.uuid4()) for _ in texts]
+        text_embeddings = list(zip(contents, vectors))
+
+        with self._lock, track_stage("rag.index_update"):
+            if self.shared_index is not None:
+                self._add_shared(ids, contents, vectors, metadatas)
+                return ids
+            if self.vector_store is None:
+                self.vector_store = FAISS.from_embeddings(
+                    text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+                )
+                self.index_store.write_embedding_fingerprint(embedding_fingerprint(self.embeddings))
+            else:
+                self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            courses = [m.get("course") for m in metadatas]
+            self.course_filters.append(courses)
+            self.lexical_index.add(ids, contents, courses)
+
+            self.index_version += 1
+
+            # 4. Save Index: append only the new chunks instead of rewriting it all
+            self.index_store.append(ids, contents, np.asarray(vectors, dtype=np.float32), metadatas)
+            if self.index_store.pending_segments >= settings.INDEX_COMPACTION_SEGMENTS:
+                self._compaction_requested.set()
+            self._maybe_schedule_rebuild()
+        return ids
+
+    def delete_documents(self, ids: List[str]) -> int:
+        """
+        Remove chunks from the index and persist the removal as a new segment
+        
+        Returns:
+            Number of chunks that were present and removed
+        """
+        with self._lock:
+            if self.shared_index is not None:
+                return self._delete_shared(ids)
+            if self.vector_store is None or not ids:
+                return 0
+            removed = delete_from_store(self.vector_store, ids)
+            if not removed:
+                return 0
+            self.course_filters.resync(self.vector_store)
+            self.lexical_index.remove(ids)
+
+            self.index_version += 1
+            self._delete_generation += 1
+            self.index_store.append_delete(ids)
+            if self.index_store.pending_segments >= settings.INDEX_COMPACTION_SEGMENTS:
+                self._compaction_requested.set()
+            self._maybe_schedule_rebuild()
+        return removed
+
+    def _add_shared(self, ids: List[str], contents: List[str], vectors: List[List[float]], metadatas: List[Dict]) -> None:
+        """
+        add_documents for mmap serving (caller holds the lock): log the
+        chunks as a segment, then add them to this process's delta; the
+        other workers pick the segment up on their next sync
+        """
+        if not self.shared_index:
+            self.index_store.write_embedding_fingerprint(embedding_fingerprint(self.embeddings))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        seq = self.index_store.append(ids, contents, vectors, metadatas)
+        self.shared_index.add(ids, contents, vectors, metadatas)
+        self.shared_index.applied.add(seq)
+        self.index_version += 1
+        if self.index_store.pending_segments >= settings.INDEX_COMPACTION_SEGMENTS:
+            self._compaction_requested.set()
+
+    def _delete_shared(self, ids: List[str]) -> int:
+        """
+        delete_documents for mmap serving (caller holds the lock)
+        """
+        present = self.shared_index.present(ids)
+        if not present:
+            return 0
+        seq = self.index_store.append_delete(present)
+        removed = self.shared_index.delete(present)
+        self.shared_index.applied.add(seq)
+        self.index_version += 1
+        if self.index_store.pending_segments >= settings.INDEX_COMPACTION_SEGMENTS:
+            self._compaction_requested.set()
+        return removed
+
+    def _sync_loop(self) -> None:
+        while True:
+            time.sleep(settings.INDEX_SYNC_INTERVAL_SECONDS)
+            try:
+                self.sync_shared_index()
+            except Exception as e:
+                print(f"Index sync failed: {e}")
+
+    def sync_shared_index(self) -> None:
+        """
+        Apply segments written by other workers, and map the new base
+        snapshot once one of them has compacted. Files are read outside the
+        lock; only applying them blocks searches.
+        """
+        shared = self.shared_index
+        base, records = self.index_store.read_updates(shared)
+        if base != shared.base_name:
+            fresh = self.index_store.open_shared()
+            with self._lock:
+                if self.shared_index is not shared:
+                    fresh.close()
+                    return
+                self.shared_index = fresh
+                self.index_version += 1
+            shared.close()
+            print(f"Mapped index snapshot {fresh.base_name} ({fresh.ntotal} chunks)")
+            return
+        if not records:
+            return
+        with self._lock:
+            if self.shared_index is not shared:
+                return
+            for seq, record in records:
+                if seq not in shared.applied:
+                    shared.apply(record)
+                    shared.applied.add(seq)
+            self.index_version += 1
+        if self.leader.held and self.index_store.pending_segments >= settings.INDEX_COMPACTION_SEGMENTS:
+            self._compaction_requested.set()
+
+    def compact_index(self, index_type: Optional[str] = None) -> None:
+        """
+        Fold pending segments into a new base snapshot. In mmap mode this
+        also builds `index_type` (or the configured type when a rebuild is
+        due) into the snapshot, since no process holds a mutable index; it
+        reads every segment from disk under the host-wide lock, so explicit
+        compactions are safe from any worker.
+        """
+        if self.mapped:
+            self.load()
+            if self.index_store.compact_shared(
+                lambda store: self._prepare_shared_snapshot(store, index_type), force=index_type is not None
+            ):
+                self.sync_shared_index()
+        elif self.vector_store is not None:
+            self._compact_memory(self.vector_store)
+
+    def _compact_memory(self, store: FAISS, force: bool = False) -> None:
+        """
+        Snapshot this process's store (memory mode). Only the leader writes
+        snapshots, after replaying the segments other workers wrote, since a
+        snapshot drops every segment it covers.
+        """
+        if not self.leader.held:
+            print("Index snapshots are written by the index leader worker; keeping changes as segments")
+            return
+        self.index_store.compact(store, self._lock, force=force, prepare=self._replay_foreign_segments)
+
+    def _replay_foreign_segments(self) -> None:
+        """
+        Apply segments written by other memory-mode workers to this
+        process's store (caller holds the lock)
+        """
+        store, records = self.index_store.replay_foreign(self.vector_store)
+        if not records:
+            return
+        self.vector_store = store
+        for record in records:
+            if record["op"] == "add":
+                self.lexical_index.add(record["ids"], record["texts"], [m.get("course") for m in record["metadatas"]])
+            else:
+                self.lexical_index.remove(record["ids"])
+        self.course_filters.resync(store)
+        self.index_version += 1
+        print(f"Applied {len(records)} index segment(s) written by other workers")
+
+    def _prepare_shared_snapshot(self, store: FAISS, index_type: Optional[str]) -> bool:
+        """
+        Build the ANN index into a snapshot being compacted for mmap serving,
+        when asked to or when the corpus calls for it (type change or too
+        many tombstones; the size an index was trained on is not kept, so
+        retraining on growth is left to explicit rebuilds)
+        """
+        if index_type is None:
+            if not self._rebuild_due(store, store.index.ntotal):
+                return False
+            index_type = settings.VECTOR_INDEX_TYPE
+        live = self._live_positions(store, 0, store.index.ntotal)
+        vectors = ann_index.reconstruct_all(store.index)[live]
+        start = time.perf_counter()
+        store.index = ann_index.build_index(vectors, index_type)
+        store.index_to_docstore_id = {
+            i: store.index_to_docstore_id[int(position)] for i, position in enumerate(live)
+        }
+        self.index_report = {
+            "index_type": index_type,
+            "factory": ann_index.factory_string(index_type, len(live)),
+            "ntotal": store.index.ntotal,
+            "build_seconds": round(time.perf_counter() - start, 2),
+            "index_bytes": ann_index.memory_bytes(store.index),
+            "flat_bytes": int(vectors.nbytes),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        print(f"Built {index_type} index over {store.index.ntotal} vectors for the next snapshot")
+        return True
+
+    def index_status(self) -> Dict:
+        with self._lock:
+            if self.mapped:
+                return self._shared_index_status()
+            index = self.vector_store.index if self.vector_store is not None else None
+            return {
+                "serving_mode": "memory",
+                "index_type": ann_index.index_type_of(index) if index is not None else None,
+                "configured_index_type": settings.VECTOR_INDEX_TYPE,
+                "ntotal": index.ntotal if index is not None else 0,
+                "tombstones": tombstone_count(self.vector_store),
+                "courses": self.course_filters.stats(),
+                "lexical": self.lexical_index.stats(),
+                "embedding": {**embedding_fingerprint(self.embeddings), "mismatch": self.embedding_mismatch},
+                "pending_segments": self.index_store.pending_segments,
+                "rebuilding": self._rebuilding,
+                "last_rebuild": self.index_report,
+            }
+
+    def _shared_index_status(self) -> Dict:
+        shared = self.shared_index
+        if shared is None:
+            self.load()
+            shared = self.shared_index
+        stats = shared.stats()
+        index_type = None
+        if shared.index is not None:
+            index_type = ann_index.index_type_of(shared.index)
+        elif shared.delta is not None:
+            index_type = "flat"
+        return {
+            "serving_mode": "mmap",
+            "index_type": index_type,
+            "configured_index_type": settings.VECTOR_INDEX_TYPE,
+            "ntotal": shared.ntotal,
+            "tombstones": stats["deleted_since_snapshot"],
+            "courses": stats.pop("courses"),
+            "lexical": {"base": "fts5", "delta_documents": len(shared.delta_lexical)},
+            "embedding": {**embedding_fingerprint(self.embeddings), "mismatch": self.embedding_mismatch},
+            "pending_segments": self.index_store.pending_segments,
+            "rebuilding": self._rebuilding,
+            "last_rebuild": self.index_report,
+            "shared": stats,
+        }
+
+    def rebuild_index_async(self, index_type: Optional[str] = None) -> bool:
+        """
+        Start a background rebuild unless one is already running. In mmap
+        mode the rebuild happens as a compaction into a new snapshot.
+        """
+        with self._lock:
+            if self._rebuilding or self.empty:
+                return False
+            self._rebuilding = True
+        threading.Thread(
+            target=self._run_rebuild, args=(index_type,), name="index-rebuild", daemon=True
+        ).start()
+        return True
+
+    def rebuild_index(self, index_type: Optional[str] = None) -> Optional[Dict]:
+        """
+        Train and build a new index of the given (or configured) type from the
+        current vectors, then swap it in atomically.
+
+        Chunks added while the build runs are copied over just before the
+        swap, and tombstoned (deleted) positions are purged. Returns a report
+        with recall against exact search.
+        """
+        index_type = index_type or settings.VECTOR_INDEX_TYPE
+        with self._lock:
+            store = self.vector_store
+            if store is None:
+                return None
+            source = store.index
+            delete_generation = self._delete_generation
+            scanned = source.ntotal
+            live = self._live_positions(store, 0, scanned)
+            vectors = ann_index.reconstruct_all(source)[live]
+
+        start = time.perf_counter()
+        new_index = ann_index.build_index(vectors, index_type)
+        build_seconds = time.perf_counter() - start
+        report = ann_index.recall_report(vectors, new_index, k=10, sample_size=settings.VECTOR_INDEX_RECALL_SAMPLE)
+
+        with self._lock:
+            if (
+                self.vector_store is not store
+                or store.index is not source
+                or self._delete_generation != delete_generation
+            ):
+                print("Index changed during rebuild, discarding the new index")
+                return None
+            built = len(live)
+            if source.ntotal > scanned:
+                tail = self._live_positions(store, scanned, source.ntotal)
+                if len(tail):
+                    new_index.add(source.reconstruct_n(scanned, source.ntotal - scanned)[tail - scanned])
+                live = np.concatenate([live, tail])
+            store.index = new_index
+            store.index_to_docstore_id = {
+                i: store.index_to_docstore_id[int(position)] for i, position in enumerate(live)
+            }
+            self.course_filters.resync(store)
+            self._trained_ntotal = new_index.ntotal
+            self.index_version += 1
+
+        report.update({
+            "index_type": index_type,
+            "factory": ann_index.factory_string(index_type, built),
+            "ntotal": new_index.ntotal,
+            "build_seconds": round(build_seconds, 2),
+            "index_bytes": ann_index.memory_bytes(new_index),
+            "flat_bytes": int(vectors.nbytes),
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+        self.index_report = report
+        print(f"Swapped in {index_type} index over {new_index.ntotal} vectors (recall@{report['k']}={report['recall_at_k']})")
+
+        # Persist the new index type as the base snapshot
+        self._compact_memory(store, force=True)
+        return report
+
+    def reembed_index_async(self) -> bool:
+        """
+        Start a background re-embedding unless a rebuild is already running.
+        Not available in mmap mode: re-embedding needs the whole index in
+        memory, so run it from a process with INDEX_SERVING_MODE=memory.
+        """
+        with self._lock:
+            if self.mapped or self._rebuilding or self.vector_store is None:
+                return False
+            self._rebuilding = True
+        threading.Thread(target=self._run_reembed, name="index-reembed", daemon=True).start()
+        return True
+
+    def reembed_index(self) -> Optional[Dict]:
+        """
+        Re-embed every chunk with the current embedding backend and swap in a
+        new index built from the fresh vectors.
+
+        Chunks added while re-embedding already carry vectors from the current
+        backend and are copied over; chunks deleted meanwhile are dropped.
+        """
+        with self._lock:
+            store = self.vector_store
+            if store is None:
+                return None
+            live = self._live_positions(store, 0, store.index.ntotal)
+            ids = [store.index_to_docstore_id[int(p)] for p in live]
+            docs = [store.docstore._dict[id_] for id_ in ids]
+
+        start = time.perf_counter()
+        vectors = []
+        batch_size = settings.INGEST_EMBED_BATCH_SIZE
+        for offset in range(0, len(docs), batch_size):
+            batch = [d.page_content for d in docs[offset:offset + batch_size]]
+            vectors.extend(self.embeddings.embed_documents(batch))
+        embed_seconds = time.perf_counter() - start
+        new_store = FAISS.from_embeddings(
+            [(d.page_content, v) for d, v in zip(docs, vectors)],
+            self.embeddings,
+            metadatas=[d.metadata for d in docs],
+            ids=ids,
+        )
+
+        with self._lock:
+            if self.vector_store is not store:
+                print("Index replaced during re-embedding, discarding the new index")
+                return None
+            current = store.docstore._dict
+            gone = [id_ for id_ in ids if id_ not in current]
+            if gone:
+                delete_from_store(new_store, gone)
+            seen = set(ids)
+            added = [
+                p for p in self._live_positions(store, 0, store.index.ntotal)
+                if store.index_to_docstore_id[int(p)] not in seen
+            ]
+            if added:
+                added_ids = [store.index_to_docstore_id[int(p)] for p in added]
+                added_vectors = ann_index.reconstruct_rows(store.index, added)
+                new_store.add_embeddings(
+                    [(current[id_].page_content, v) for id_, v in zip(added_ids, added_vectors)],
+                    metadatas=[current[id_].metadata for id_ in added_ids],
+                    ids=added_ids,
+                )
+
+            self.vector_store = new_store
+            self.course_filters.resync(new_store)
+            self._trained_ntotal = new_store.index.ntotal
+            self.index_version += 1
+            self.embedding_mismatch = None
+
+        # Snapshot first: a crash before the fingerprint is written re-checks on load
+        self._compact_memory(new_store, force=True)
+        fingerprint = embedding_fingerprint(self.embeddings)
+        self.index_store.write_embedding_fingerprint(fingerprint)
+        report = {
+            **fingerprint,
+            "chunks": new_store.index.ntotal,
+            "embed_seconds": round(embed_seconds, 2),
+            "chunks_per_second": round(len(docs) / embed_seconds, 1) if embed_seconds > 0 else None,
+        }
+        print(f"Re-embedded {len(docs)} chunks with the {fingerprint['backend']} backend in {embed_seconds:.1f}s")
+        return report
+
+    def _run_reembed(self) -> None:
+        try:
+            self.reembed_index()
+        except Exception as e:
+            print(f"Index re-embedding failed: {e}")
+        finally:
+            self._rebuilding = False
+        # The fresh index is flat; build the configured ANN type if needed
+        with self._lock:
+            if self.vector_store is not None:
+                self._maybe_schedule_rebuild()
+
+    def _check_shared_embeddings(self) -> None:
+        """
+        Mmap serving cannot cheaply re-embed sample chunks against the mapped
+        vectors, so it only compares the stored fingerprint
+        """
+        current = embedding_fingerprint(self._embeddings)
+        stored = self._index_store.read_embedding_fingerprint()
+        if stored is None or stored == current or not self.shared_index:
+            return
+        self.embedding_mismatch = {"stored": stored, "current": current}
+        print(f"Index vectors were written by {stored}, not the {current['backend']} embedding backend; "
+              f"re-embed from a process with INDEX_SERVING_MODE=memory")
+
+    def _check_embedding_compatibility(self) -> None:
+        """
+        Compare stored vectors with fresh embeddings of the same chunks when
+        the index was written by another (or an unknown) backend
+        """
+        current = embedding_fingerprint(self.embeddings)
+        stored = self.index_store.read_embedding_fingerprint()
+        if stored == current:
+            return
+
+        store = self.vector_store
+        live = self._live_positions(store, 0, store.index.ntotal)
+        if not len(live):
+            return
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(live, min(settings.EMBEDDING_COMPAT_SAMPLE, len(live)), replace=False))
+        texts = [store.docstore._dict[store.index_to_docstore_id[int(p)]].page_content for p in sample]
+        fresh = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        agreement = cosine_agreement(ann_index.reconstruct_rows(store.index, sample), fresh)
+        min_cosine = float(agreement.min())
+
+        if min_cosine >= settings.EMBEDDING_COMPAT_MIN_COSINE:
+            print(f"Index vectors match the {current['backend']} embedding backend (min cosine {min_cosine:.4f})")
+            self.index_store.write_embedding_fingerprint(current)
+            return
+
+        self.embedding_mismatch = {
+            "stored": stored,
+            "current": current,
+            "min_cosine": round(min_cosine, 4),
+            "mean_cosine": round(float(agreement.mean()), 4),
+        }
+        print(f"Index vectors do not match the {current['backend']} embedding backend (min cosine {min_cosine:.4f})")
+        if settings.EMBEDDING_REEMBED_ON_MISMATCH:
+            self.reembed_index_async()
+
+    @staticmethod
+    def _live_positions(store: FAISS, start: int, stop: int) -> np.ndarray:
+        """
+        Index positions in [start, stop) whose chunk has not been deleted
+        """
+        docs = store.docstore._dict
+        mapping = store.index_to_docstore_id
+        return np.array(
+            [p for p in range(start, stop) if mapping.get(p) in docs], dtype=np.int64
+        )
+
+    def _run_rebuild(self, index_type: Optional[str]) -> None:
+        try:
+            if self.mapped:
+                self.compact_index(index_type or settings.VECTOR_INDEX_TYPE)
+            else:
+                self.rebuild_index(index_type)
+        except Exception as e:
+            print(f"Index rebuild failed: {e}")
+        finally:
+            self._rebuilding = False
+
+    def _maybe_schedule_rebuild(self) -> None:
+        """
+        Start a background rebuild when the corpus crossed the threshold for
+        the configured index type, grew enough to warrant retraining, or
+        carries too many deleted positions
+        """
+        if self._rebuild_due(self.vector_store, self._trained_ntotal):
+            self.rebuild_index_async(settings.VECTOR_INDEX_TYPE)
+
+    @staticmethod
+    def _rebuild_due(store: FAISS, trained_ntotal: int) -> bool:
+        target = settings.VECTOR_INDEX_TYPE
+        index = store.index
+        current = ann_index.index_type_of(index)
+        if current != target:
+            if target != "flat" and index.ntotal < max(
+                settings.VECTOR_INDEX_REBUILD_THRESHOLD,
+                ann_index.min_training_points(target, index.ntotal),
+            ):
+                return False
+        elif target in ("flat", "hnsw") or index.ntotal < trained_ntotal * settings.VECTOR_INDEX_RETRAIN_GROWTH:
+            # Only quantizer-based indexes need retraining as the corpus grows,
+            # unless deletes left too many tombstones behind
+            if current == "flat" or tombstone_count(store) < index.ntotal * settings.VECTOR_INDEX_TOMBSTONE_RATIO:
+                return False
+        return True
+
+    def _compaction_loop(self) -> None:
+        while True:
+            self._compaction_requested.wait(timeout=settings.INDEX_COMPACTION_INTERVAL_SECONDS)
+            self._compaction_requested.clear()
+            # Followers leave compaction to the leader, which sees their
+            # segments through the shared log
+            if not self._loaded or not self.leader.held or not self.index_store.pending_segments:
+                continue
+            try:
+                self.compact_index()
+            except Exception as e:
+                print(f"Index compaction failed: {e}")
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embedding_batcher.submit(query)
+
+    async def aembed_query(self, query: str) -> List[float]:
+        return await self.embedding_batcher.asubmit(query)
+
+    async def aembed_texts(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed several short texts through the query batcher, sharing its
+        batches with concurrent queries
+        """
+        return list(await asyncio.gather(*(self.embedding_batcher.asubmit(text) for text in texts)))
+
+    @timed("rag.search")
+    def search(self, query: str, k: int = 3, course: Optional[str] = None):
+        if self.empty:
+            return []
+        return self.search_by_vector(self.embed_query(query), k=k, course=course, query=query)
+
+    def search_by_vector(
+        self, embedding: List[float], k: int = 3, course: Optional[str] = None, query: Optional[str] = None
+    ):
+        """
+        Search with an already computed query embedding, within one course's
+        chunks when `course` is given and has indexed material. With the
+        query text, dense and BM25 results are fused (hybrid search).
+        """
+        if self.empty:
             return []
-        return self.vector_store.similarity_search(query, k=k)
+        return [doc for doc, _ in self.search_batcher.submit((embedding, k, course, query))]
+
+    async def asearch_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 3,
+        course: Optional[str] = None,
+        query: Optional[str] = None,
+        with_distances: bool = False,
+    ):
+        """
+        Async search_by_vector. With `with_distances`, returns (document, L2
+        distance to the query) pairs instead; the distance is None for
+        chunks found only by BM25.
+        """
+        if not self._loaded:
+            # Never load the index on the event loop
+            await asyncio.to_thread(self.load)
+        if self.empty:
+            return []
+        hits = await self.search_batcher.asubmit((embedding, k, course, query))
+        return hits if with_distances else [doc for doc, _ in hits]
+
+    def resolve_course(self, course: Optional[str]) -> Optional[str]:
+        """
+        The course a query is actually scoped to: `course` when it has
+        indexed material, otherwise None (the whole index, which is what the
+        search falls back to)
+        """
+        if course_key(course) is None:
+            return None
+        self.load()
+        with self._lock:
+            has_course = self.shared_index.has_course if self.shared_index is not None else self.course_filters.has
+            if has_course(course):
+                return course
+            self._note_course_fallback(course)
+        return None
+
+    async def aresolve_course(self, course: Optional[str]) -> Optional[str]:
+        if course_key(course) is None:
+            return None
+        return await asyncio.to_thread(self.resolve_course, course)
+
+    def _note_course_fallback(self, course: str) -> None:
+        self.course_fallbacks += 1
+        print(f"⚠️ Course {course!r} has no indexed material; searching all courses instead")
+
+    @timed("rag.embed_batch")
+    def _embed_batch(self, queries: List[str]) -> List[List[float]]:
+        """
+        Embed a batch of queries in one forward pass
+        """
+        return self.embeddings.embed_documents(queries)
+
+    @timed("rag.search_batch")
+    def _search_batch(
+        self, requests: List[Tuple[List[float], int, Optional[str], Optional[str]]]
+    ) -> List[List[Tuple[Document, Optional[float]]]]:
+        """
+        Run one FAISS search per course for a batch of (embedding, k, course,
+        query) requests, each restricted to its course's chunks. Courses
+        without indexed material fall back to the whole index. Requests with
+        query text also get BM25 candidates, merged with the dense ones by
+        reciprocal-rank fusion.
+
+        The lock is held for the FAISS searches and for taking each BM25
+        query's postings, released while BM25 is scored and fused, and taken
+        again to fetch the documents.
+
+        Returns (document, dense L2 distance) hits per request, with None
+        as the distance of chunks that only BM25 found.
+        """
+        hybrid = settings.HYBRID_SEARCH_ENABLED
+        # Per request: dense hits and the pending BM25 search, if any
+        pending: List[Tuple[List[Tuple[str, float]], Optional[Callable[[], List[Tuple[str, float]]]]]] = []
+        with self._lock:
+            shared = self.shared_index
+            store = self.vector_store
+            if store is None and not shared:
+                return [[] for _ in requests]
+
+            matrix = np.array([request[0] for request in requests], dtype=np.float32)
+            if shared.normalize_L2 if shared is not None else store._normalize_L2:
+                faiss.normalize_L2(matrix)
+
+            has_course = shared.has_course if shared is not None else self.course_filters.has
+            groups: Dict[Optional[str], List[int]] = {}
+            for row, request in enumerate(requests):
+                course = request[2]
+                if course_key(course) is not None and not has_course(course):
+                    self._note_course_fallback(course)
+                    course = None
+                groups.setdefault(course, []).append(row)
+
+            pending = [([], None)] * len(requests)
+            for course, rows in groups.items():
+                k_max = max(requests[row][1] for row in rows)
+                if hybrid:
+                    k_max = max(k_max, settings.HYBRID_DENSE_CANDIDATES)
+                if shared is not None:
+                    hits = shared.search(matrix[rows], k_max, course)
+                elif course is None:
+                    hits = self._search_global(store, matrix[rows], k_max)
+                else:
+                    params = self.course_filters.search_params(course, store)
+                    hits = self._search_global(store, matrix[rows], k_max, params) if params is not None else [[] for _ in rows]
+                for row, row_hits in zip(rows, hits):
+                    query = requests[row][3]
+                    lexical = self._lexical_query(query, course) if hybrid and query else None
+                    pending[row] = (row_hits, lexical)
+
+        ranked: List[List[Tuple[str, float]]] = []
+        for row_hits, lexical in pending:
+            ranked.append(self._fuse(row_hits, lexical()) if lexical is not None else row_hits)
+
+        results: List[List[Tuple[Document, Optional[float]]]] = [[] for _ in requests]
+        with self._lock:
+            # The index may have changed meanwhile; chunks gone since are skipped
+            shared = self.shared_index
+            store = self.vector_store
+            if store is None and not shared:
+                return results
+            for row, row_hits in enumerate(ranked):
+                k = requests[row][1]
+                distances = dict(pending[row][0])
+                if shared is not None:
+                    # One chunk store lookup per request
+                    docs = shared.documents([id_ for id_, _ in row_hits])
+                for id_, _ in row_hits:
+                    if len(results[row]) == k:
+                        break
+                    doc = docs.get(id_) if shared is not None else store.docstore.search(id_)
+                    if isinstance(doc, Document):
+                        results[row].append((doc, distances.get(id_)))
+        return results
+
+    def _lexical_query(self, query: str, course: Optional[str]) -> Callable[[], List[Tuple[str, float]]]:
+        """
+        BM25 search for a query, prepared under the lock and run by calling
+        the returned function after releasing it
+        """
+        k = settings.HYBRID_LEXICAL_CANDIDATES
+        if self.shared_index is not None:
+            return self.shared_index.lexical_query(query, k, course=course)
+        return functools.partial(self.lexical_index.query(query, course).top, k)
+
+    @staticmethod
+    def _fuse(dense_hits: List[Tuple[str, float]], lexical_hits: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """
+        Reciprocal-rank fusion of dense hits with BM25 hits for the same query
+        """
+        if not lexical_hits:
+            return dense_hits
+        return reciprocal_rank_fusion(
+            [[id_ for id_, _ in dense_hits], [id_ for id_, _ in lexical_hits]],
+            [settings.HYBRID_DENSE_WEIGHT, settings.HYBRID_LEXICAL_WEIGHT],
+            settings.HYBRID_RRF_K,
+        )
+
+    @staticmethod
+    def _search_global(
+        store: FAISS, queries: np.ndarray, k: int, params: Optional[faiss.SearchParameters] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """
+        Search the whole index, or the positions `params` selects, returning
+        (docstore ID, distance) hits per query
+        """
+        # Deleted chunks may still occupy positions in non-flat indexes
+        k_fetch = k * 2 if tombstone_count(store) else k
+        scores, indices = store.index.search(queries, k_fetch, params=params)
+        return [
+            [
+                (store.index_to_docstore_id[int(i)], float(score))
+                # i == -1: fewer documents in the index than requested
+                for score, i in zip(row_scores, row_indices) if i != -1
+            ]
+            for row_scores, row_indices in zip(scores, indices)
+        ]
+
+def _collect_metrics():
+    for batcher in (rag_service.embedding_batcher, rag_service.search_batcher):
+        stats = batcher.stats()
+        labels = {"batcher": batcher.name}
+        yield "dabba_batcher_queued", "gauge", "Items waiting for a micro-batch", labels, stats["queued"]
+        yield "dabba_batcher_batches_total", "counter", "Micro-batches processed", labels, stats["batches"]
+        yield "dabba_batcher_items_total", "counter", "Items processed in micro-batches", labels, stats["items"]
+    # Scraping must not trigger loading the index
+    yield "dabba_index_vectors", "gauge", "Vectors in the FAISS index", {}, rag_service.ntotal
+    yield "dabba_index_version", "gauge", "Index content version", {}, rag_service.index_version
+    yield "dabba_search_course_fallbacks_total", "counter", "Course-scoped searches run on the whole index", {}, rag_service.course_fallbacks
 
 rag_service = RAGService()
+registry.add_collector(_collect_metrics)
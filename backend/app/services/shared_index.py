@@ -0,0 +1,378 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from app.core.config import settings
+from app.services import ann_index
+from app.services.course_partitions import CourseFilters, course_key
+from app.services.lexical_index import BM25Index, tokenize
+
+CHUNK_STORE_EXTENSION = ".db"
+# Let SQLite read the chunk store through mmap as well, so its pages are
+# shared between workers like the index
+CHUNK_STORE_MMAP_BYTES = 1 << 30
+
+
+def write_chunk_store(path: str, store: FAISS) -> int:
+    """
+    Write the chunks of a LangChain FAISS store to an SQLite file keyed by
+    index position, with a full-text index of their BM25 terms. The file is
+    built under a temporary name and renamed into place, so readers never
+    see a partial store. Returns the number of chunks written.
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    docs = store.docstore._dict
+    rows = [
+        (position, id_, docs[id_])
+        for position, id_ in sorted(store.index_to_docstore_id.items())
+        if id_ in docs
+    ]
+
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.executescript("""
+            CREATE TABLE chunks (
+                position INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                course TEXT
+            );
+            -- Contentless: holds only the inverted index, the text is in chunks
+            CREATE VIRTUAL TABLE chunks_fts USING fts5(terms, content='');
+        """)
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT INTO chunks (position, id, text, metadata, course) VALUES (?, ?, ?, ?, ?)",
+            (
+                (position, id_, doc.page_content, json.dumps(doc.metadata, default=str),
+                 course_key(doc.metadata.get("course")))
+                for position, id_, doc in rows
+            ),
+        )
+        # Index the same terms as BM25Index so both rank alike
+        conn.executemany(
+            "INSERT INTO chunks_fts (rowid, terms) VALUES (?, ?)",
+            ((position, " ".join(tokenize(doc.page_content))) for position, _, doc in rows),
+        )
+        conn.execute("CREATE UNIQUE INDEX chunks_id ON chunks (id)")
+        conn.execute("CREATE INDEX chunks_course ON chunks (course, position)")
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(rows)
+
+
+class ChunkStore:
+    """
+    Read-only view of a snapshot's chunk store (see write_chunk_store).
+
+    Snapshot files are immutable once published, so the database is opened
+    with immutable=1: no locking or change detection, and the pages come
+    straight from the page cache shared by every worker.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(f"file:{path}?immutable=1", uri=True, check_same_thread=False)
+        self._conn.execute(f"PRAGMA mmap_size={CHUNK_STORE_MMAP_BYTES}")
+        self._lock = threading.Lock()
+        self.count = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def ids_at(self, positions: Iterable[int]) -> Dict[int, str]:
+        """
+        Docstore IDs of the chunks at the given index positions; positions
+        without a chunk (deleted before the snapshot) are left out
+        """
+        positions = list(set(positions))
+        if not positions:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT position, id FROM chunks WHERE position IN ({','.join('?' * len(positions))})",
+                positions,
+            ).fetchall()
+        return dict(rows)
+
+    def present(self, ids: Sequence[str]) -> List[str]:
+        """
+        The given IDs that are in this store
+        """
+        if not ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM chunks WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        found = {row[0] for row in rows}
+        return [id_ for id_ in ids if id_ in found]
+
+    def documents(self, ids: Sequence[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(ids))})", list(ids)
+            ).fetchall()
+        return {
+            id_: Document(id=id_, page_content=text, metadata=json.loads(metadata))
+            for id_, text, metadata in rows
+        }
+
+    def course_positions(self, course: str) -> np.ndarray:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT position FROM chunks WHERE course = ? ORDER BY position", (course,)
+            ).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def course_counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT course, COUNT(*) FROM chunks WHERE course IS NOT NULL GROUP BY course"
+            ).fetchall()
+        return dict(rows)
+
+    def lexical_search(self, query: str, k: int, course: Optional[str] = None) -> List[Tuple[str, float]]:
+        """
+        Top-k (docstore ID, BM25 score) by FTS5's bm25(), which uses the
+        standard k1=1.2, b=0.75 rather than BM25_K1/BM25_B
+        """
+        terms = sorted(set(tokenize(query)))
+        if not terms or k <= 0:
+            return []
+        # Terms are [a-z0-9]+, safe to quote as FTS5 strings
+        match = " OR ".join(f'"{term}"' for term in terms)
+        sql = (
+            "SELECT c.id, bm25(chunks_fts) AS score FROM chunks_fts "
+            "JOIN chunks c ON c.position = chunks_fts.rowid WHERE chunks_fts MATCH ?"
+        )
+        params: list = [match]
+        if course is not None:
+            sql += " AND c.course = ?"
+            params.append(course)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(k)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        # bm25() is negated so that lower is better; flip to match BM25Index
+        return [(id_, -score) for id_, score in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class SharedIndex:
+    """
+    Index view for serving from several worker processes on one host
+    (INDEX_SERVING_MODE=mmap).
+
+    The base snapshot's FAISS index is memory-mapped and its chunks are read
+    from the snapshot's ChunkStore, so vectors and text live once in the page
+    cache however many workers serve them. Both are strictly read-only: a
+    mapped index must never be modified. Changes since the snapshot (the
+    segment log) are held in a small per-process delta: a flat LangChain
+    store with its own course filters and BM25 index for added chunks,
+    and the set of base chunks deleted since. Compaction folds the delta into
+    a new snapshot, which every worker then maps in place of the old one.
+    Not thread-safe; callers hold the RAG service lock.
+    """
+    # LangChain's default, as for stores loaded with FAISS.load_local
+    normalize_L2 = False
+
+    def __init__(self, base_name: Optional[str], index: Optional[faiss.Index], chunks: Optional[ChunkStore],
+                 embeddings: Embeddings):
+        self.base_name = base_name
+        self.index = index
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.delta: Optional[FAISS] = None
+        self.delta_filters = CourseFilters()
+        self.delta_lexical = BM25Index(k1=settings.BM25_K1, b=settings.BM25_B)
+        # Base chunks deleted since the snapshot
+        self.deleted: Set[str] = set()
+        # Sequence numbers of the segments already applied to the delta
+        self.applied: Set[int] = set()
+        self._course_filters: Dict[str, Optional[Tuple[np.ndarray, faiss.SearchParameters]]] = {}
+
+    @property
+    def ntotal(self) -> int:
+        """
+        Live chunks: base minus deleted plus delta
+        """
+        base = self.chunks.count if self.chunks is not None else 0
+        delta = len(self.delta.docstore._dict) if self.delta is not None else 0
+        return base - len(self.deleted) + delta
+
+    def __len__(self) -> int:
+        return self.ntotal
+
+    def apply(self, record: Dict) -> int:
+        """
+        Apply one segment record to the delta; returns the number of chunks
+        added or removed
+        """
+        if record["op"] == "add":
+            self.add(record["ids"], record["texts"], record["vectors"], record["metadatas"])
+            return len(record["ids"])
+        if record["op"] == "delete":
+            return self.delete(record["ids"])
+        raise ValueError(f"Unknown index segment op: {record['op']}")
+
+    def add(self, ids: List[str], texts: List[str], vectors: np.ndarray, metadatas: List[Dict]) -> None:
+        text_embeddings = list(zip(texts, np.asarray(vectors, dtype=np.float32).tolist()))
+        if self.delta is None:
+            self.delta = FAISS.from_embeddings(text_embeddings, self.embeddings, metadatas=metadatas, ids=ids)
+        else:
+            self.delta.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        courses = [m.get("course") for m in metadatas]
+        self.delta_filters.append(courses)
+        self.delta_lexical.add(ids, texts, courses)
+
+    def present(self, ids: Sequence[str]) -> List[str]:
+        """
+        The given IDs that are live chunks of this index
+        """
+        in_delta = set(self.delta.docstore._dict) & set(ids) if self.delta is not None else set()
+        rest = [id_ for id_ in ids if id_ not in in_delta and id_ not in self.deleted]
+        in_base = set(self.chunks.present(rest)) if self.chunks is not None else set()
+        return [id_ for id_ in ids if id_ in in_delta or id_ in in_base]
+
+    def delete(self, ids: Sequence[str]) -> int:
+        present = self.present(ids)
+        in_delta = [id_ for id_ in present if self.delta is not None and id_ in self.delta.docstore._dict]
+        if in_delta:
+            # The delta is always flat, so this drops the vectors
+            self.delta.delete(in_delta)
+            self.delta_filters.resync(self.delta)
+            self.delta_lexical.remove(in_delta)
+        self.deleted.update(id_ for id_ in present if id_ not in in_delta)
+        return len(present)
+
+    def has_course(self, course: Optional[str]) -> bool:
+        key = course_key(course)
+        if key is None:
+            return False
+        return self.delta_filters.has(key) or self._course_filter(key) is not None
+
+    def _course_filter(self, key: str) -> Optional[Tuple[np.ndarray, faiss.SearchParameters]]:
+        """
+        Search parameters restricting the base index to one course's
+        positions, via a bitmap of ntotal bits (cached per course; the base
+        never changes)
+        """
+        if key not in self._course_filters:
+            positions = self.chunks.course_positions(key) if self.chunks is not None else []
+            if len(positions) == 0:
+                self._course_filters[key] = None
+            else:
+                bits = np.zeros(self.index.ntotal, dtype=bool)
+                bits[positions] = True
+                bitmap = np.packbits(bits, bitorder="little")
+                selector = faiss.IDSelectorBitmap(self.index.ntotal, faiss.swig_ptr(bitmap))
+                # The bitmap must outlive the selector that points into it
+                self._course_filters[key] = (bitmap, ann_index.search_parameters(self.index, selector))
+        return self._course_filters[key]
+
+    def search(self, queries: np.ndarray, k: int, course: Optional[str] = None) -> List[List[Tuple[str, float]]]:
+        """
+        (docstore ID, distance) hits per query over base and delta, within
+        one course when given
+        """
+        key = course_key(course)
+        hits: List[List[Tuple[str, float]]] = [[] for _ in range(len(queries))]
+
+        if self.index is not None and self.index.ntotal:
+            params = None
+            if key is not None:
+                course_filter = self._course_filter(key)
+                params = course_filter[1] if course_filter is not None else None
+            if key is None or params is not None:
+                # Deleted chunks still occupy positions in the mapped index
+                k_fetch = k * 2 if self.deleted or self.index.ntotal > self.chunks.count else k
+                scores, indices = self.index.search(queries, min(k_fetch, self.index.ntotal), params=params)
+                ids = self.chunks.ids_at(int(i) for i in indices.ravel() if i != -1)
+                for row_hits, row_scores, row_indices in zip(hits, scores, indices):
+                    row_hits.extend(
+                        (ids[int(i)], float(score)) for score, i in zip(row_scores, row_indices)
+                        if int(i) in ids and ids[int(i)] not in self.deleted
+                    )
+
+        if self.delta is not None and self.delta.index.ntotal:
+            params = self.delta_filters.search_params(key, self.delta) if key is not None else None
+            if key is None or params is not None:
+                scores, indices = self.delta.index.search(queries, min(k, self.delta.index.ntotal), params=params)
+                mapping = self.delta.index_to_docstore_id
+                for row_hits, row_scores, row_indices in zip(hits, scores, indices):
+                    row_hits.extend((mapping[int(i)], float(score)) for score, i in zip(row_scores, row_indices) if i != -1)
+
+        # L2 distances from both sides are comparable: smaller is closer
+        return [sorted(row_hits, key=lambda hit: hit[1])[:k] for row_hits in hits]
+
+    def lexical_query(self, query: str, k: int, course: Optional[str] = None) -> Callable[[], List[Tuple[str, float]]]:
+        """
+        BM25 hits from the base (FTS5) and the delta, merged by score. The
+        two sides compute IDF over their own documents, so the merge is
+        approximate; it only feeds reciprocal-rank fusion.
+
+        The base hits and the delta's postings are taken now, while the
+        caller's lock keeps this snapshot open; the returned function scores
+        the delta and merges without it.
+        """
+        base = []
+        if self.chunks is not None:
+            k_fetch = k * 2 if self.deleted else k
+            base = [hit for hit in self.chunks.lexical_search(query, k_fetch, course_key(course))
+                    if hit[0] not in self.deleted]
+        delta = self.delta_lexical.query(query, course)
+
+        def merge() -> List[Tuple[str, float]]:
+            hits = base + delta.top(k)
+            return sorted(hits, key=lambda hit: hit[1], reverse=True)[:k]
+        return merge
+
+    def documents(self, ids: Sequence[str]) -> Dict[str, Document]:
+        docs: Dict[str, Document] = {}
+        if self.delta is not None:
+            delta_docs = self.delta.docstore._dict
+            docs.update((id_, delta_docs[id_]) for id_ in ids if id_ in delta_docs)
+        base_ids = [id_ for id_ in ids if id_ not in docs and id_ not in self.deleted]
+        if base_ids and self.chunks is not None:
+            docs.update(self.chunks.documents(base_ids))
+        return docs
+
+    def stats(self) -> Dict:
+        courses = self.chunks.course_counts() if self.chunks is not None else {}
+        for key, count in self.delta_filters.stats().items():
+            courses[key] = courses.get(key, 0) + count
+        return {
+            "base": self.base_name,
+            "base_chunks": self.chunks.count if self.chunks is not None else 0,
+            "delta_chunks": len(self.delta.docstore._dict) if self.delta is not None else 0,
+            "deleted_since_snapshot": len(self.deleted),
+            "courses": dict(sorted(courses.items())),
+            "applied_segments": len(self.applied),
+        }
+
+    def close(self) -> None:
+        if self.chunks is not None:
+            self.chunks.close()
+        # Dropping the last reference unmaps the index
+        self.index = None
+        self._course_filters = {}
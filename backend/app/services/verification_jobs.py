@@ -0,0 +1,325 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import observe_stage, registry
+from app.services import verification_worker
+from app.services.ocr_cache import content_hash, ocr_cache
+from app.services.verification_service import count_pdf_pages, is_pdf, merge_page_results, verification_service
+
+JOB_STATUSES = ("queued", "running", "completed", "failed")
+
+
+def page_ranges(pages: int, parts: int) -> List[Tuple[int, int]]:
+    """
+    Split pages 1..pages into at most `parts` contiguous (first, last)
+    ranges whose sizes differ by at most one
+    """
+    parts = max(1, min(parts, pages))
+    size, extra = divmod(pages, parts)
+    ranges, first = [], 1
+    for i in range(parts):
+        last = first + size - 1 + (1 if i < extra else 0)
+        ranges.append((first, last))
+        first = last + 1
+    return ranges
+
+
+class VerificationQueueFull(Exception):
+    """
+    Raised when a verification job cannot be accepted because the queue is full
+    """
+
+
+class VerificationJob:
+    __slots__ = (
+        "job_id", "status", "submitted_at", "finished_at", "report", "error",
+        "future", "pending_tasks", "task_results", "task_error", "pages", "content_hash",
+    )
+
+    def __init__(self, job_id: str, tasks: int, pages: Optional[int] = None, content_hash: Optional[str] = None):
+        self.job_id = job_id
+        self.status = "queued"
+        self.submitted_at = datetime.now()
+        self.finished_at: Optional[datetime] = None
+        self.report: Optional[Dict] = None
+        self.error: Optional[str] = None
+        # Resolves with the final report once every task has finished
+        self.future: Future = Future()
+        self.pending_tasks = tasks
+        self.task_results: List = []
+        self.task_error: Optional[str] = None
+        self.pages = pages
+        self.content_hash = content_hash
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+
+class VerificationJobManager:
+    """
+    Runs document verification in a pool of worker processes.
+
+    Every worker loads DocumentVerificationService once (see
+    verification_worker) so OCR never runs on the event loop and uses every
+    core. Images are one task; PDFs (up to the page limit) are split into
+    one contiguous page range per worker, so each worker receives the
+    document once and rasterizes and OCRs its pages while the others do
+    theirs, and the pages are merged into one report. At most `workers + max_queued` tasks are unfinished at a
+    time; finished jobs are kept for polling until `retention` newer ones
+    have finished. Completed reports are added to the manual review queue
+    under the job ID, which doubles as the case ID. Uploads whose bytes were
+    verified before are answered from the OCR cache without touching the pool.
+    """
+    def __init__(self, workers: int, max_queued: int, retention: int, threads_per_worker: int = 0):
+        self.workers = max(1, workers)
+        self.max_queued = max_queued
+        self.retention = retention
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._jobs: "OrderedDict[str, VerificationJob]" = OrderedDict()
+        self._unfinished = 0
+        self._lock = threading.Lock()
+        self._counts = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "cached": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # Spawned (not forked) workers: the API process runs threads
+            # (batchers, watchers) that must not be duplicated mid-operation
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=verification_worker.init_worker,
+                initargs=(self.threads_per_worker,),
+            )
+        return self._executor
+
+    def submit(self, image_bytes: bytes) -> VerificationJob:
+        """
+        Queue a document; raises ValueError for unreadable PDFs and
+        VerificationQueueFull when the queue has no room. Blocking (hashing,
+        the OCR cache, reading the PDF, the review queue for cached reports):
+        call it from a worker thread, not the event loop.
+        """
+        key = content_hash(image_bytes)
+        cached = ocr_cache.get(key) if ocr_cache is not None else None
+        if cached is not None:
+            return self._finish_cached(key, cached)
+
+        pages = None
+        if is_pdf(image_bytes):
+            try:
+                pages = count_pdf_pages(image_bytes)
+            except Exception as e:
+                raise ValueError(f"Could not read PDF: {e}")
+            if pages == 0:
+                raise ValueError("PDF has no pages")
+            dpi = settings.VERIFICATION_PDF_DPI
+            calls = [
+                (verification_worker.ocr_pdf_pages, (image_bytes, first, last, dpi))
+                for first, last in page_ranges(min(pages, settings.VERIFICATION_PDF_MAX_PAGES), self.workers)
+            ]
+        else:
+            calls = [(verification_worker.verify_document, (image_bytes,))]
+
+        with self._lock:
+            # A document larger than the whole queue is still accepted when idle
+            if self._unfinished and self._unfinished + len(calls) > self.workers + self.max_queued:
+                self._counts["rejected"] += 1
+                raise VerificationQueueFull(f"{self._unfinished} verification tasks already pending")
+            job = VerificationJob(uuid.uuid4().hex[:12], tasks=len(calls), pages=pages, content_hash=key)
+            self._jobs[job.job_id] = job
+            self._unfinished += len(calls)
+            self._counts["submitted"] += 1
+            submitted = time.perf_counter()
+            futures = [(f"ocr.{fn.__name__}", self._submit_call(fn, args)) for fn, args in calls]
+        for stage, future in futures:
+            future.add_done_callback(
+                lambda future, stage=stage: self._on_task_done(job, future, stage, submitted)
+            )
+        return job
+
+    def _finish_cached(self, key: str, report: Dict) -> VerificationJob:
+        job = VerificationJob(uuid.uuid4().hex[:12], tasks=0, pages=report.get("total_pages"), content_hash=key)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._counts["submitted"] += 1
+            self._counts["cached"] += 1
+        self._finish(job, report, None, stage="ocr.job_cached")
+        return job
+
+    def _submit_call(self, fn: Callable, args: Tuple) -> Future:
+        # Workers report their own run time so queueing can be told apart
+        try:
+            return self._pool().submit(verification_worker.timed_call, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. out of memory); start a fresh pool
+            self._executor = None
+            return self._pool().submit(verification_worker.timed_call, fn, *args)
+
+    async def warm_up(self) -> str:
+        """
+        Start every worker process and run one OCR pass in each, so they
+        have loaded PaddleOCR before the first upload. Bypasses the job
+        queue; uploads arriving meanwhile simply queue behind the warm-up.
+        """
+        def submit_all() -> List[Future]:
+            with self._lock:
+                return [self._submit_call(verification_worker.warm_up, ()) for _ in range(self.workers)]
+
+        # Starting the worker processes blocks; keep it off the event loop
+        futures = await asyncio.to_thread(submit_all)
+        results = await asyncio.gather(*(asyncio.wrap_future(future) for future in futures))
+        for available, seconds in results:
+            observe_stage("ocr.warm_up", seconds)
+        if not all(available for available, _ in results):
+            return "OCR dependencies missing; verification returns errors"
+        return f"{self.workers} workers warm"
+
+    async def wait(self, job: VerificationJob) -> Dict:
+        """
+        Await a job's report without blocking the event loop
+        """
+        return await asyncio.wrap_future(job.future)
+
+    def _on_task_done(self, job: VerificationJob, future: Future, stage: str, submitted: float) -> None:
+        # Runs on the executor's management thread
+        with self._lock:
+            if future.cancelled():
+                job.task_error = "cancelled"
+            elif future.exception() is not None:
+                job.task_error = str(future.exception()) or type(future.exception()).__name__
+            else:
+                result, seconds = future.result()
+                if job.pages is None:
+                    job.task_results.append(result)
+                else:
+                    job.task_results.extend(result)
+                observe_stage(stage, seconds)
+                observe_stage("ocr.task_queue_wait", max(0.0, time.perf_counter() - submitted - seconds))
+            job.pending_tasks -= 1
+            self._unfinished -= 1
+            if job.pending_tasks:
+                return
+
+        report, error = None, job.task_error
+        if error is None:
+            try:
+                report = job.task_results[0] if job.pages is None else merge_page_results(job.task_results, job.pages)
+                if ocr_cache is not None:
+                    self._flag_near_duplicates(job, report)
+                    ocr_cache.put(job.content_hash, report)
+            except Exception as e:
+                report, error = None, str(e)
+        job.task_results = []
+        self._finish(job, report, error)
+
+    @staticmethod
+    def _flag_near_duplicates(job: VerificationJob, report: Dict) -> None:
+        """
+        Mark scans that look like an already verified one but are not byte-identical
+        """
+        matches = ocr_cache.near_duplicates(report.get("perceptual_hash"), exclude=job.content_hash)
+        if not matches:
+            return
+        report["near_duplicates"] = matches
+        report["issues"] = [i for i in report["issues"] if i != "Document appears authentic"]
+        report["issues"].append(
+            f"Scan closely resembles {len(matches)} previously verified upload(s) (possible reuse or edit)"
+        )
+        if report.get("status") == "verified":
+            report["status"] = "suspicious"
+
+    def _finish(self, job: VerificationJob, report: Optional[Dict], error: Optional[str], stage: str = "ocr.job") -> None:
+        if report is not None:
+            verification_service.submit_to_queue(report, case_id=job.job_id)
+
+        with self._lock:
+            job.report = report
+            job.error = error
+            job.status = "failed" if error else "completed"
+            job.finished_at = datetime.now()
+            self._counts[job.status] += 1
+            observe_stage(stage, (job.finished_at - job.submitted_at).total_seconds())
+            self._evict_finished()
+        if error:
+            job.future.set_exception(RuntimeError(error))
+        else:
+            job.future.set_result(report)
+
+    def _evict_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[VerificationJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def status(self, job: VerificationJob) -> Dict:
+        with self._lock:
+            status, position = job.status, None
+            if not job.finished:
+                # Tasks are started in submission order, one per worker
+                ahead = 0
+                for other in self._jobs.values():
+                    if other is job:
+                        break
+                    ahead += other.pending_tasks
+                if ahead < self.workers:
+                    status = "running"
+                else:
+                    position = ahead - self.workers
+            return {
+                "job_id": job.job_id,
+                "case_id": job.job_id,
+                "status": status,
+                "queue_position": position,
+                "submitted_at": job.submitted_at,
+                "finished_at": job.finished_at,
+                "error": job.error,
+                "pages": job.pages,
+            }
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "threads_per_worker": self.threads_per_worker,
+                "max_queued": self.max_queued,
+                "unfinished": self._unfinished,
+                "retained": len(self._jobs),
+                **self._counts,
+            }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+def _collect_metrics():
+    stats = verification_jobs.stats()
+    yield "dabba_verification_tasks_unfinished", "gauge", "OCR tasks queued or running in the worker pool", {}, stats["unfinished"]
+    yield "dabba_verification_workers", "gauge", "OCR worker processes", {}, stats["workers"]
+    for outcome in ("submitted", "completed", "failed", "rejected", "cached"):
+        yield "dabba_verification_jobs_total", "counter", "Verification jobs by outcome", {"outcome": outcome}, stats[outcome]
+
+
+verification_jobs = VerificationJobManager(
+    workers=settings.VERIFICATION_WORKERS,
+    max_queued=settings.VERIFICATION_MAX_QUEUED_JOBS,
+    retention=settings.VERIFICATION_JOB_RETENTION,
+    threads_per_worker=settings.VERIFICATION_THREADS_PER_WORKER,
+)
+registry.add_collector(_collect_metrics)
@@ -1,5 +1,136 @@
 import warnings
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.case_store import SQLiteCaseStore, case_store
+
+# Bump when the report analysis changes so cached OCR reports are recomputed
+ANALYSIS_VERSION = 1
+
+def analyze_document_structure(extracted_data: List[Dict]) -> Dict:
+    """
+    Analyze document structure and detect anomalies
+    """
+    if not extracted_data:
+        return {
+            'is_valid': False,
+            'confidence': 0.0,
+            'issues': ['No text detected in document']
+        }
+
+    total_confidence = sum(item['confidence'] for item in extracted_data)
+    avg_confidence = total_confidence / len(extracted_data)
+
+    issues = []
+
+    # Check 1: Low confidence text (potential manipulation)
+    low_conf_items = [item for item in extracted_data if item['confidence'] < 0.7]
+    if len(low_conf_items) > len(extracted_data) * 0.3:
+        issues.append(f"High number of low-confidence text blocks ({len(low_conf_items)})")
+
+    # Check 2: Suspicious keywords
+    all_text = ' '.join([item['text'].lower() for item in extracted_data])
+    suspicious_patterns = ['photoshop', 'edited', 'sample', 'watermark']
+    found_suspicious = [word for word in suspicious_patterns if word in all_text]
+    if found_suspicious:
+        issues.append(f"Suspicious keywords found: {', '.join(found_suspicious)}")
+
+    # Check 3: Text alignment (basic heuristic)
+    y_coords = [item['bbox'][0][1] for item in extracted_data]
+    if len(set(y_coords)) < len(y_coords) * 0.3:
+        issues.append("Unusual text alignment detected")
+
+    # Overall assessment
+    is_valid = avg_confidence > 0.75 and len(issues) == 0
+
+    return {
+        'is_valid': is_valid,
+        'confidence': round(avg_confidence * 100, 2),
+        'total_text_blocks': len(extracted_data),
+        'low_confidence_blocks': len(low_conf_items),
+        'issues': issues if issues else ['Document appears authentic'],
+        'extracted_text': ' '.join([item['text'] for item in extracted_data])
+    }
+
+
+def build_report(extracted_data: List[Dict]) -> Dict:
+    """
+    Verification report for the text blocks of one document
+    """
+    analysis = analyze_document_structure(extracted_data)
+    return {
+        'status': 'verified' if analysis['is_valid'] else 'suspicious',
+        'confidence_score': analysis['confidence'],
+        'total_text_blocks': analysis.get('total_text_blocks', 0),
+        'low_confidence_blocks': analysis.get('low_confidence_blocks', 0),
+        'issues': analysis['issues'],
+        'extracted_text': analysis.get('extracted_text', '')[:500],  # First 500 chars
+        'details': extracted_data
+    }
+
+def merge_page_results(pages: List[Dict], total_pages: int) -> Dict:
+    """
+    Merge per-page OCR results ({'page', 'blocks'} or {'page', 'error'})
+    into one report covering the whole PDF, with a summary per page
+    """
+    pages = sorted(pages, key=lambda p: p['page'])
+    failed = [p for p in pages if p.get('error')]
+    if pages and len(failed) == len(pages):
+        return {
+            'status': 'error',
+            'confidence_score': 0.0,
+            'total_text_blocks': 0,
+            'low_confidence_blocks': 0,
+            'issues': sorted({p['error'] for p in failed}),
+            'extracted_text': '',
+            'details': [],
+            'pages': [{'page': p['page'], 'error': p['error']} for p in pages],
+            'total_pages': total_pages
+        }
+    
+    blocks = [dict(block, page=p['page']) for p in pages for block in p.get('blocks', [])]
+    report = build_report(blocks)
+    report['pages'] = []
+    for p in pages:
+        if p.get('error'):
+            report['pages'].append({'page': p['page'], 'error': p['error']})
+            report['issues'].append(f"Page {p['page']}: {p['error']}")
+            continue
+        page_analysis = analyze_document_structure(p['blocks'])
+        report['pages'].append({
+            'page': p['page'],
+            'total_text_blocks': len(p['blocks']),
+            'confidence_score': page_analysis['confidence'],
+            'issues': page_analysis['issues']
+        })
+    if total_pages > len(pages):
+        report['issues'].append(f"Only the first {len(pages)} of {total_pages} pages were verified")
+    report['total_pages'] = total_pages
+    return report
+
+def difference_hash(gray) -> str:
+    """
+    64-bit dHash (hex) of a grayscale image: one bit per horizontally
+    adjacent pixel pair of a 9x8 thumbnail. Rescans and recompressions of
+    the same page differ by only a few bits.
+    """
+    import cv2
+    import numpy as np
+    
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+def count_pdf_pages(pdf_bytes: bytes) -> int:
+    """
+    Number of pages in a PDF (parses the page tree only, renders nothing)
+    """
+    import pymupdf
+    
+    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+        return doc.page_count
+
+def is_pdf(data: bytes) -> bool:
+    return data[:5] == b"%PDF-"
 
 # Lazy loading to handle potential dependency issues
 _verification_service_instance = None
@@ -30,6 +161,20 @@ def get_verification_service():
                     # Convert bytes to numpy array
                     nparr = np.frombuffer(image_bytes, np.uint8)
                     img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                    if img is None:
+                        raise ValueError("Could not decode image")
+                    
+                    return self.extract_text_from_array(img)
+                
+                def extract_text_from_array(self, img) -> List[Dict]:
+                    """
+                    Run PaddleOCR on a decoded BGR image, downsizing oversized scans first
+                    """
+                    height, width = img.shape[:2]
+                    max_side = settings.VERIFICATION_MAX_IMAGE_SIDE
+                    if max(height, width) > max_side:
+                        scale = max_side / max(height, width)
+                        img = cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
                     
                     # Run OCR
                     result = self.ocr.ocr(img, cls=True)
@@ -47,73 +192,53 @@ def get_verification_service():
                     
                     return extracted_data
                 
+                def extract_pdf_page(self, pdf_bytes: bytes, page_number: int, dpi: Optional[int] = None) -> List[Dict]:
+                    """
+                    Rasterize one PDF page (1-based) and extract its text. The
+                    page is rendered at `dpi`, or lower if that would exceed the
+                    maximum image side, so oversized pages are never rendered in full.
+                    """
+                    import pymupdf
+                    
+                    dpi = dpi or settings.VERIFICATION_PDF_DPI
+                    max_side = settings.VERIFICATION_MAX_IMAGE_SIDE
+                    with pymupdf.open(stream=pdf_bytes, filetype="pdf") as doc:
+                        page = doc[page_number - 1]
+                        zoom = min(dpi / 72, max_side / max(page.rect.width, page.rect.height))
+                        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), colorspace=pymupdf.csRGB, alpha=False)
+                        rgb = np.frombuffer(pixmap.samples, np.uint8).reshape(pixmap.height, pixmap.width, 3)
+                    return self.extract_text_from_array(cv2.cvtColor(rgb, cv2.COLOR_RGB2BGR))
+                
                 def analyze_document_structure(self, extracted_data: List[Dict]) -> Dict:
                     """
                     Analyze document structure and detect anomalies
                     """
-                    if not extracted_data:
-                        return {
-                            'is_valid': False,
-                            'confidence': 0.0,
-                            'issues': ['No text detected in document']
-                        }
-                    
-                    total_confidence = sum(item['confidence'] for item in extracted_data)
-                    avg_confidence = total_confidence / len(extracted_data)
-                    
-                    issues = []
-                    
-                    # Check 1: Low confidence text (potential manipulation)
-                    low_conf_items = [item for item in extracted_data if item['confidence'] < 0.7]
-                    if len(low_conf_items) > len(extracted_data) * 0.3:
-                        issues.append(f"High number of low-confidence text blocks ({len(low_conf_items)})")
-                    
-                    # Check 2: Suspicious keywords
-                    all_text = ' '.join([item['text'].lower() for item in extracted_data])
-                    suspicious_patterns = ['photoshop', 'edited', 'sample', 'watermark']
-                    found_suspicious = [word for word in suspicious_patterns if word in all_text]
-                    if found_suspicious:
-                        issues.append(f"Suspicious keywords found: {', '.join(found_suspicious)}")
-                    
-                    # Check 3: Text alignment (basic heuristic)
-                    y_coords = [item['bbox'][0][1] for item in extracted_data]
-                    if len(set(y_coords)) < len(y_coords) * 0.3:
-                        issues.append("Unusual text alignment detected")
-                    
-                    # Overall assessment
-                    is_valid = avg_confidence > 0.75 and len(issues) == 0
-                    
-                    return {
-                        'is_valid': is_valid,
-                        'confidence': round(avg_confidence * 100, 2),
-                        'total_text_blocks': len(extracted_data),
-                        'low_confidence_blocks': len(low_conf_items),
-                        'issues': issues if issues else ['Document appears authentic'],
-                        'extracted_text': ' '.join([item['text'] for item in extracted_data])
-                    }
+                    return analyze_document_structure(extracted_data)
                 
                 def verify_document(self, image_bytes: bytes) -> Dict:
                     """
                     Complete verification pipeline
                     """
                     try:
-                        # Step 1: Extract text
-                        extracted_data = self.extract_text(image_bytes)
+                        if is_pdf(image_bytes):
+                            # Single-process fallback; the job manager OCRs PDF pages in parallel
+                            total_pages = count_pdf_pages(image_bytes)
+                            pages = [
+                                {'page': n, 'blocks': self.extract_pdf_page(image_bytes, n)}
+                                for n in range(1, min(total_pages, settings.VERIFICATION_PDF_MAX_PAGES) + 1)
+                            ]
+                            return merge_page_results(pages, total_pages)
                         
-                        # Step 2: Analyze structure
-                        analysis = self.analyze_document_structure(extracted_data)
-                        
-                        # Step 3: Generate report
-                        report = {
-                            'status': 'verified' if analysis['is_valid'] else 'suspicious',
-                            'confidence_score': analysis['confidence'],
-                            'total_text_blocks': analysis['total_text_blocks'],
-                            'low_confidence_blocks': analysis['low_confidence_blocks'],
-                            'issues': analysis['issues'],
-                            'extracted_text': analysis['extracted_text'][:500],  # First 500 chars
-                            'details': extracted_data
-                        }
+                        # Step 1: Extract text
+                        img = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+                        if img is None:
+                            raise ValueError("Could not decode image")
+                        extracted_data = self.extract_text_from_array(img)
                         
+                        # Step 2 + 3: Analyze structure and generate report
+                        report = build_report(extracted_data)
+                        # Lets the OCR cache spot near-duplicate scans
+                        report['perceptual_hash'] = difference_hash(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
                         return report
                         
                     except Exception as e:
@@ -141,47 +266,33 @@ def get_verification_service():
                         'extracted_text': '',
                         'details': []
                     }
+                
+                def extract_pdf_page(self, pdf_bytes: bytes, page_number: int, dpi: Optional[int] = None) -> List[Dict]:
+                    raise RuntimeError('OCR service not available. Please install required dependencies.')
             _verification_service_instance = MockVerificationService()
     
     return _verification_service_instance
 
 # Create a proxy that lazy-loads the service and handles workflow state
-class VerificationQueueItem:
-    def __init__(self, case_id: str, report: Dict, status: str = "pending"):
-        self.case_id = case_id
-        self.report = report
-        self.status = status # pending, approved, rejected
-        self.timestamp = "now" # In real app use datetime
-
 class VerificationServiceProxy:
-    def __init__(self):
-        self._queue: List[Dict] = []
+    def __init__(self, store: SQLiteCaseStore):
+        self.store = store
 
     def __getattr__(self, name):
         service = get_verification_service()
         return getattr(service, name)
     
-    def submit_to_queue(self, report: Dict) -> str:
+    def submit_to_queue(self, report: Dict, case_id: str = None) -> str:
         """Add a verification report to the review queue"""
         import uuid
-        case_id = str(uuid.uuid4())[:8]
-        self._queue.append({
-            "case_id": case_id,
-            "report": report,
-            "status": "pending",
-            "timestamp": "Just now"
-        })
+        case_id = case_id or uuid.uuid4().hex[:12]
+        self.store.add(case_id, report)
         return case_id
 
-    def get_pending_cases(self) -> List[Dict]:
-        return [item for item in self._queue if item["status"] == "pending"]
+    def get_pending_cases(self, limit: int = 50, cursor: Optional[int] = None) -> Tuple[List[Dict], Optional[int]]:
+        return self.store.list(status="pending", limit=limit, cursor=cursor)
 
     def update_case_status(self, case_id: str, status: str, remarks: str = None) -> bool:
-        for item in self._queue:
-            if item["case_id"] == case_id:
-                item["status"] = status
-                item["remarks"] = remarks
-                return True
-        return False
-
-verification_service = VerificationServiceProxy()
+        return self.store.update_status(case_id, status, remarks)
+
+verification_service = VerificationServiceProxy(case_store)
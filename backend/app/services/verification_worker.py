@@ -0,0 +1,76 @@
+import os
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+# Each worker process loads the OCR model once and reuses it for every job
+_service = None
+
+NATIVE_THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+
+
+def init_worker(threads: int = 0) -> None:
+    """
+    Process pool initializer: cap native thread pools so workers don't
+    oversubscribe the cores, then load the verification service
+    """
+    global _service
+    if threads > 0:
+        for variable in NATIVE_THREAD_VARIABLES:
+            os.environ.setdefault(variable, str(threads))
+    from app.services.verification_service import get_verification_service
+    _service = get_verification_service()
+
+
+def timed_call(fn: Callable, *args) -> Tuple[Any, float]:
+    """
+    Run a task and report how long it took inside the worker, so the API
+    process can tell OCR time from time spent queued
+    """
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+def warm_up() -> bool:
+    """
+    Run one OCR pass on a small synthetic image so the first real job does
+    not pay for lazy initialization; False when OCR is unavailable (the mock
+    service is loaded instead)
+    """
+    if _service is None:
+        init_worker()
+    if not hasattr(_service, "extract_text_from_array"):
+        return False
+    import cv2
+    import numpy as np
+    img = np.full((64, 320, 3), 255, np.uint8)
+    cv2.putText(img, "Warm up 2024", (10, 44), cv2.FONT_HERSHEY_SIMPLEX, 1.2, (0, 0, 0), 2)
+    _service.extract_text_from_array(img)
+    return True
+
+
+def verify_document(image_bytes: bytes) -> Dict:
+    if _service is None:
+        init_worker()
+    return _service.verify_document(image_bytes)
+
+
+def ocr_pdf_page(pdf_bytes: bytes, page_number: int, dpi: int) -> Dict:
+    """
+    OCR one PDF page; failures are reported per page so the other pages
+    still make it into the merged report
+    """
+    if _service is None:
+        init_worker()
+    try:
+        return {"page": page_number, "blocks": _service.extract_pdf_page(pdf_bytes, page_number, dpi)}
+    except Exception as e:
+        return {"page": page_number, "error": str(e) or type(e).__name__}
+
+
+def ocr_pdf_pages(pdf_bytes: bytes, first_page: int, last_page: int, dpi: int) -> List[Dict]:
+    """
+    OCR a range of PDF pages (1-based, inclusive), so the document is sent
+    to the worker once per range rather than once per page
+    """
+    return [ocr_pdf_page(pdf_bytes, n, dpi) for n in range(first_page, last_page + 1)]
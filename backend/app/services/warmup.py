@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from app.core.config import settings
+from app.core.metrics import observe_stage
+from app.core.readiness import readiness
+from app.services.llm_service import get_llm_service
+from app.services.rag_service import rag_service
+from app.services.verification_jobs import verification_jobs
+
+WARMUP_COMPONENTS = ("rag", "llm", "ocr")
+
+
+async def _warm_rag() -> Optional[str]:
+    # Model and index loading is blocking work; keep it off the event loop
+    await asyncio.to_thread(rag_service.warm_up)
+    return f"{rag_service.ntotal} vectors"
+
+
+async def _warm_llm() -> Optional[str]:
+    service = await asyncio.to_thread(get_llm_service)
+    return await service.awarm_up()
+
+
+async def _warm_ocr() -> Optional[str]:
+    return await verification_jobs.warm_up()
+
+
+WARMERS: Dict[str, Callable[[], Awaitable[Optional[str]]]] = {
+    "rag": _warm_rag,
+    "llm": _warm_llm,
+    "ocr": _warm_ocr,
+}
+
+
+async def _warm(name: str) -> None:
+    """
+    Warm one component, retrying failures (e.g. Ollama still starting)
+    every WARMUP_RETRY_SECONDS
+    """
+    while True:
+        readiness.loading(name)
+        started = time.perf_counter()
+        try:
+            detail = await WARMERS[name]()
+        except Exception as e:
+            readiness.failed(name, e)
+            print(f"❌ Warm-up of {name} failed: {e}")
+            if settings.WARMUP_RETRY_SECONDS <= 0:
+                return
+            await asyncio.sleep(settings.WARMUP_RETRY_SECONDS)
+            continue
+        seconds = time.perf_counter() - started
+        observe_stage(f"warmup.{name}", seconds)
+        readiness.ready(name, detail)
+        print(f"✅ {name} warm in {seconds:.1f}s")
+        return
+
+
+def configure_readiness() -> None:
+    """
+    Register the components with /ready: warmed ones start out pending,
+    the others load lazily on first use
+    """
+    warmed = set(settings.WARMUP_COMPONENTS) if settings.WARMUP_ENABLED else set()
+    readiness.configure(
+        {name: "pending" if name in warmed else "lazy" for name in WARMUP_COMPONENTS},
+        settings.READINESS_REQUIRED_COMPONENTS,
+    )
+
+
+async def warm_up() -> None:
+    """
+    Warm the configured components concurrently. Started as a background
+    task from the app lifespan, so the server binds without waiting for it.
+    """
+    names = [name for name in WARMUP_COMPONENTS if name in settings.WARMUP_COMPONENTS]
+    await asyncio.gather(*(_warm(name) for name in names))
@@ -0,0 +1,494 @@
+"""
+Load and throughput benchmarks for the API: p50/p95/p99 latency and
+requests per second for chat, query, upload and verification across
+concurrency levels and synthetic corpus sizes.
+
+By default the app from app.main runs in this process against offline
+stand-ins: a deterministic stub Ollama (see stub_ollama) and the "hash"
+embedding backend. Everything is written to a fresh working directory,
+so the real index and databases are never touched. Requests go through
+the ASGI interface directly (--transport asgi) or over real HTTP to a
+uvicorn server started in this process (--transport http); --url targets
+an already running server instead, skipping the corpus setup.
+
+Before each corpus size the synthetic corpus is grown to that many chunks
+and compacted. Results (with a per-stage time breakdown from the app's
+metrics when in-process) are written as JSON for benchmarks.compare.
+
+Run from the backend directory:
+
+    python -m benchmarks.api_load --output bench-results/base.json
+    python -m benchmarks.api_load --scenarios query --corpus-sizes 1000,10000,100000,1000000 --concurrency 1,16
+    python -m benchmarks.api_load --transport http --scenarios chat --concurrency 1,8,32 --token-ms 30
+    python -m benchmarks.api_load --url http://localhost:8000 --scenarios query,chat
+    python -m benchmarks.compare bench-results/base.json bench-results/new.json
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.stub_ollama import StubOllamaConfig, start_stub_ollama  # noqa: E402
+
+API = "/api/v1"
+SCENARIOS = ("chat", "query", "upload", "verify")
+TOPICS = [
+    "process scheduling", "virtual memory paging", "deadlock avoidance", "binary search trees",
+    "dynamic programming", "graph shortest paths", "TCP congestion control", "relational normalization",
+    "loop invariants", "sorting algorithm complexity", "semaphores and mutexes", "hash table collisions",
+]
+FILLER = (
+    "lecture example definition theorem proof exercise property algorithm runtime memory "
+    "student course exam assignment chapter section figure table result method"
+).split()
+COURSES = ["cs101", "cs201", "cs301", "math120"]
+CORPUS_BATCH = 5000
+
+# (method, path, httpx request kwargs)
+Request = Tuple[str, str, Dict]
+
+
+def synthetic_chunk(i: int) -> str:
+    rng = np.random.default_rng(i)
+    topic = TOPICS[i % len(TOPICS)]
+    words = " ".join(rng.choice(FILLER, size=int(rng.integers(40, 120))))
+    return f"Lecture note {i} on {topic}. {topic.capitalize()} {words}."
+
+
+def synthetic_query(i: int) -> str:
+    return f"What does lecture note {i * 7919 % 100000} say about {TOPICS[i % len(TOPICS)]}?"
+
+
+def make_pdf(pages: int = 2) -> bytes:
+    import pymupdf
+
+    doc = pymupdf.open()
+    for page_number in range(pages):
+        page = doc.new_page()
+        text = "\n".join(synthetic_chunk(page_number * 10 + line)[:90] for line in range(30))
+        page.insert_text((48, 60), text, fontsize=9)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def make_png(i: int, width: int = 800, height: int = 560) -> bytes:
+    """
+    Certificate-like image; the request number is stamped into the pixels
+    so no two uploads hit the OCR cache
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.text((60, 60), "CERTIFICATE OF COMPLETION", fill="black")
+    draw.text((60, 140), f"Awarded to Student {i}", fill="black")
+    draw.text((60, 220), f"for {TOPICS[i % len(TOPICS)]}", fill="black")
+    for bit in range(32):
+        if i >> bit & 1:
+            draw.rectangle((10 + bit * 4, height - 8, 12 + bit * 4, height - 6), fill="black")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ScenarioRequests:
+    """
+    Builds the i-th request of each scenario; indexes keep growing across
+    runs so upload filenames and verification images never repeat
+    """
+    def __init__(self, run_id: str):
+        self.run_id = run_id
+        self._pdf: Optional[bytes] = None
+        self._images: Dict[int, bytes] = {}
+
+    def prepare(self, scenario: str, start: int, count: int) -> None:
+        # Payloads are built before timing starts
+        if scenario == "upload" and self._pdf is None:
+            self._pdf = make_pdf()
+        if scenario == "verify":
+            self._images = {i: make_png(i) for i in range(start, start + count)}
+
+    def build(self, scenario: str, i: int) -> Request:
+        if scenario == "chat":
+            return "POST", f"{API}/chat/chat", {"json": {"query": synthetic_query(i), "session_id": f"bench-{self.run_id}-{i}"}}
+        if scenario == "query":
+            return "POST", f"{API}/documents/query", {"params": {"query": synthetic_query(i)}}
+        if scenario == "upload":
+            return "POST", f"{API}/documents/upload", {
+                "files": {"file": (f"bench-{self.run_id}-{i}.pdf", self._pdf, "application/pdf")},
+                "data": {"course": COURSES[i % len(COURSES)]},
+            }
+        if scenario == "verify":
+            return "POST", f"{API}/verification/verify-document", {
+                "files": {"file": (f"certificate-{i}.png", self._images.pop(i), "image/png")},
+            }
+        raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict:
+    if not latencies_ms:
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    values = np.asarray(latencies_ms)
+    return {
+        "p50": round(float(np.percentile(values, 50)), 2),
+        "p95": round(float(np.percentile(values, 95)), 2),
+        "p99": round(float(np.percentile(values, 99)), 2),
+        "mean": round(float(values.mean()), 2),
+        "max": round(float(values.max()), 2),
+    }
+
+
+def stage_totals() -> Dict[str, Tuple[float, int]]:
+    """
+    Cumulative (seconds, count) per instrumented stage of the in-process app
+    """
+    from app.core.metrics import stage_seconds
+
+    totals: Dict[str, List[float]] = {}
+    for suffix, labels, value in stage_seconds.samples():
+        if suffix in ("_sum", "_count"):
+            totals.setdefault(labels["stage"], [0.0, 0])[0 if suffix == "_sum" else 1] = value
+    return {stage: (seconds, int(count)) for stage, (seconds, count) in totals.items()}
+
+
+def stage_breakdown(before: Dict[str, Tuple[float, int]], after: Dict[str, Tuple[float, int]]) -> Dict:
+    """
+    Mean milliseconds and call count per stage between two snapshots
+    """
+    breakdown = {}
+    for stage, (seconds, count) in after.items():
+        prev_seconds, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            breakdown[stage] = {
+                "calls": count - prev_count,
+                "mean_ms": round((seconds - prev_seconds) * 1000 / (count - prev_count), 3),
+            }
+    return breakdown
+
+
+async def run_level(
+    client,
+    requests: ScenarioRequests,
+    scenario: str,
+    concurrency: int,
+    total: int,
+    warmup: int,
+    first_index: int,
+    in_process: bool,
+) -> Dict:
+    requests.prepare(scenario, first_index, warmup + total)
+    for i in range(first_index, first_index + warmup):
+        method, path, kwargs = requests.build(scenario, i)
+        await client.request(method, path, **kwargs)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    answer_paths: Counter = Counter()
+    indexes = itertools.count(first_index + warmup)
+    end_index = first_index + warmup + total
+
+    async def worker() -> None:
+        while (i := next(indexes)) < end_index:
+            method, path, kwargs = requests.build(scenario, i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+            except Exception as e:
+                response, status = None, type(e).__name__
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            statuses[status] += 1
+            if response is not None and response.is_success:
+                latencies.append(elapsed_ms)
+                if scenario == "chat":
+                    answer_paths[response.json().get("answer_path") or "unknown"] += 1
+
+    stages_before = stage_totals() if in_process else {}
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    result = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "status_counts": dict(statuses),
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 2) if seconds > 0 else None,
+        # Percentiles cover successful requests only; see errors/status_counts
+        "latency_ms": latency_summary(latencies),
+    }
+    if answer_paths:
+        result["answer_paths"] = dict(answer_paths)
+    if in_process:
+        result["stages"] = stage_breakdown(stages_before, stage_totals())
+    return result
+
+
+def grow_corpus(rag_service, target: int) -> Optional[Dict]:
+    """
+    Add synthetic chunks until the index holds `target`, then compact it
+    """
+    from langchain_core.documents import Document
+
+    store = rag_service.vector_store
+    current = store.index.ntotal if store is not None else 0
+    if current >= target:
+        return None
+    started = time.perf_counter()
+    for start in range(current, target, CORPUS_BATCH):
+        stop = min(target, start + CORPUS_BATCH)
+        rag_service.add_documents([
+            Document(
+                page_content=synthetic_chunk(i),
+                metadata={"source": f"synthetic/notes-{i // 50}.pdf", "course": COURSES[i % len(COURSES)]},
+            )
+            for i in range(start, stop)
+        ])
+        print(f"  corpus {stop}/{target} chunks", end="\r", flush=True)
+    seconds = time.perf_counter() - started
+    rag_service.compact_index()
+    # Let a background ANN rebuild triggered by the growth finish first
+    while rag_service.index_status().get("rebuilding"):
+        time.sleep(0.5)
+    print(f"  corpus {target} chunks: +{target - current} in {seconds:.1f}s ({(target - current) / seconds:.0f} chunks/s)")
+    return {
+        "chunks": target,
+        "added": target - current,
+        "seconds": round(seconds, 2),
+        "chunks_per_second": round((target - current) / seconds, 1),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_uvicorn(app) -> Tuple[object, str]:
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, name="bench-uvicorn", daemon=True).start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("uvicorn did not start within 30s")
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def print_result(result: Dict, corpus: Optional[int]) -> None:
+    latency = result["latency_ms"]
+
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:>9.1f}" if value is not None else f"{'-':>9}"
+
+    print(
+        f"  {result['scenario']:<7} corpus={corpus if corpus is not None else '-':<8} c={result['concurrency']:<4} "
+        f"rps={result['rps'] or 0:>8.1f} p50={fmt(latency['p50'])} p95={fmt(latency['p95'])} "
+        f"p99={fmt(latency['p99'])} ms errors={result['errors']}"
+        + (f" paths={result['answer_paths']}" if result.get("answer_paths") else "")
+    )
+
+
+async def wait_ready(client, timeout: float) -> Optional[float]:
+    """
+    Poll /ready until the app reports its components warm; returns the
+    seconds waited, or None when the server has no readiness probe
+    """
+    started = time.perf_counter()
+    while True:
+        response = await client.get("/ready")
+        if response.status_code == 404:
+            return None
+        if response.status_code == 200:
+            return round(time.perf_counter() - started, 2)
+        if time.perf_counter() - started > timeout:
+            raise RuntimeError(f"app not ready after {timeout:.0f}s: {response.text}")
+        await asyncio.sleep(0.2)
+
+
+async def run_benchmarks(args, app, rag_service, base_url: Optional[str]) -> Tuple[List[Dict], List[Dict], Optional[float]]:
+    import httpx
+
+    in_process = rag_service is not None
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=max(args.concurrency) * 2, max_keepalive_connections=max(args.concurrency) * 2)
+    if base_url is None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout)
+    else:
+        client = httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits)
+
+    requests = ScenarioRequests(datetime.now().strftime("%H%M%S"))
+    results, corpus = [], []
+    next_index = 0
+    async with client:
+        ready_seconds = await wait_ready(client, args.timeout)
+        for corpus_size in (args.corpus_sizes if in_process else [None]):
+            if corpus_size is not None:
+                grown = await asyncio.to_thread(grow_corpus, rag_service, corpus_size)
+                if grown:
+                    corpus.append(grown)
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = await run_level(
+                        client, requests, scenario, concurrency, args.requests, args.warmup, next_index, in_process
+                    )
+                    next_index += args.warmup + args.requests
+                    result["transport"] = "url" if not in_process else args.transport
+                    result["corpus_chunks"] = corpus_size
+                    print_result(result, corpus_size)
+                    results.append(result)
+    return results, corpus, ready_seconds
+
+
+def configure_offline_app(args) -> str:
+    """
+    Fresh working directory, stub Ollama and offline settings; must run
+    before anything from `app` is imported
+    """
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="dabba-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+
+    _, ollama_url = start_stub_ollama(StubOllamaConfig(token_ms=args.token_ms, prompt_ms=args.prompt_ms, tokens=args.tokens))
+    os.environ.update({
+        "OLLAMA_BASE_URL": ollama_url,
+        "LLM_BACKENDS": "[]",
+        "EMBEDDING_BACKEND": "hash",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'app.db')}",
+        "AUTO_LEARN_WATCH_DIRECTORIES": "[]",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        # Measure warm components only
+        "READINESS_REQUIRED_COMPONENTS": '["rag", "llm", "ocr"]',
+    })
+    for assignment in args.env:
+        key, _, value = assignment.partition("=")
+        os.environ[key] = value
+    print(f"Working directory {workdir}, stub Ollama at {ollama_url}")
+    return workdir
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default="chat,query,upload,verify", help=f"subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="concurrency levels")
+    parser.add_argument("--corpus-sizes", default="1000,10000", help="synthetic corpus sizes in chunks, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each level")
+    parser.add_argument("--transport", choices=("asgi", "http"), default="asgi")
+    parser.add_argument("--url", default="", help="benchmark an already running server instead")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="stub Ollama latency per generated token")
+    parser.add_argument("--prompt-ms", type=float, default=10.0, help="stub Ollama latency per 100 prompt tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="stub Ollama tokens per answer")
+    parser.add_argument("--answer-cache", action="store_true", help="keep the semantic answer cache enabled")
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE setting for the app (repeatable)")
+    parser.add_argument("--workdir", default="", help="working directory for the index and databases (default: new temp dir)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="per-request timeout in seconds")
+    parser.add_argument("--output", default="", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",")]
+    args.corpus_sizes = sorted(int(float(s)) for s in args.corpus_sizes.split(","))
+    output = os.path.abspath(args.output) if args.output else ""
+
+    app = rag_service = None
+    server = None
+    meta = {
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k != "output"},
+    }
+
+    if args.url:
+        base_url = args.url.rstrip("/")
+        meta["target"] = base_url
+    else:
+        meta["workdir"] = configure_offline_app(args)
+        from app.main import app
+        from app.services.rag_service import rag_service
+        from app.core.config import settings
+
+        meta["settings"] = {
+            key: getattr(settings, key)
+            for key in (
+                "EMBEDDING_BACKEND", "ANN_INDEX_TYPE", "HYBRID_SEARCH_ENABLED", "ANSWER_CACHE_ENABLED",
+                "ANSWER_ROUTER_ENABLED", "LLM_MAX_CONCURRENT_GENERATIONS", "QUERY_BATCH_MAX_SIZE",
+                "VERIFICATION_WORKERS",
+            )
+            if hasattr(settings, key)
+        }
+        try:
+            import paddleocr  # noqa: F401
+            meta["ocr_available"] = True
+        except ImportError:
+            meta["ocr_available"] = False
+            if "verify" in args.scenarios:
+                print("paddleocr is not installed: verify measures the pipeline around the OCR-unavailable error")
+        base_url = None
+        if args.transport == "http":
+            server, base_url = start_uvicorn(app)
+
+    async def run() -> Tuple[List[Dict], List[Dict], Optional[float]]:
+        if app is not None and server is None:
+            # In-process ASGI: run startup/shutdown like a server would
+            async with app.router.lifespan_context(app):
+                return await run_benchmarks(args, app, rag_service, None)
+        return await run_benchmarks(args, app, rag_service, base_url)
+
+    results, corpus, meta["ready_seconds"] = asyncio.run(run())
+    if server is not None:
+        server.should_exit = True
+
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump({"meta": meta, "corpus": corpus, "results": results}, f, indent=2, default=str)
+        print(f"Results written to {output}")
+    # Skip joining the app's background threads and worker processes
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
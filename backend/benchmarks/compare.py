@@ -0,0 +1,92 @@
+"""
+Compare two benchmarks.api_load result files: throughput and latency
+percentiles per scenario, corpus size and concurrency, old -> new.
+
+Run from the backend directory:
+
+    python -m benchmarks.compare bench-results/base.json bench-results/new.json
+    python -m benchmarks.compare base.json new.json --fail-on-regression 10
+
+With --fail-on-regression PCT the exit status is 1 when any p95 latency
+rises, or any throughput falls, by more than PCT percent.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional, Tuple
+
+Key = Tuple[str, str, Optional[int], int]  # (scenario, transport, corpus chunks, concurrency)
+
+
+def load_results(path: str) -> Dict[Key, Dict]:
+    with open(path) as f:
+        data = json.load(f)
+    return {
+        (r["scenario"], r.get("transport", "asgi"), r.get("corpus_chunks"), r["concurrency"]): r
+        for r in data.get("results", [])
+    }
+
+
+def change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def fmt_pair(old: Optional[float], new: Optional[float]) -> str:
+    def fmt(value: Optional[float]) -> str:
+        return f"{value:.1f}" if value is not None else "-"
+
+    pct = change(old, new)
+    return f"{fmt(old):>8} -> {fmt(new):<8} {f'{pct:+.1f}%' if pct is not None else '':>8}"
+
+
+def compare(old: Dict[Key, Dict], new: Dict[Key, Dict], threshold: Optional[float]) -> List[str]:
+    """
+    Print the comparison table; returns descriptions of regressions beyond `threshold` percent
+    """
+    regressions: List[str] = []
+    print(f"{'scenario':<8} {'transport':<9} {'corpus':>8} {'c':>4}  {'rps':^26} {'p50 ms':^26} {'p95 ms':^26} {'p99 ms':^26}")
+    for key in sorted(set(old) | set(new), key=lambda k: (k[0], k[1], k[2] or 0, k[3])):
+        scenario, transport, corpus, concurrency = key
+        label = f"{scenario:<8} {transport:<9} {corpus if corpus is not None else '-':>8} {concurrency:>4}"
+        if key not in old or key not in new:
+            print(f"{label}  only in {'new' if key in new else 'old'} results")
+            continue
+        before, after = old[key], new[key]
+        print(
+            f"{label}  {fmt_pair(before['rps'], after['rps'])} "
+            + " ".join(fmt_pair(before["latency_ms"][p], after["latency_ms"][p]) for p in ("p50", "p95", "p99"))
+        )
+        if after["errors"] > before["errors"]:
+            print(f"{'':<34}errors {before['errors']} -> {after['errors']}")
+
+        if threshold is None:
+            continue
+        rps = change(before["rps"], after["rps"])
+        p95 = change(before["latency_ms"]["p95"], after["latency_ms"]["p95"])
+        if rps is not None and rps < -threshold:
+            regressions.append(f"{scenario} ({transport}, corpus={corpus}, c={concurrency}) throughput {rps:+.1f}%")
+        if p95 is not None and p95 > threshold:
+            regressions.append(f"{scenario} ({transport}, corpus={corpus}, c={concurrency}) p95 latency {p95:+.1f}%")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("old", help="baseline results JSON")
+    parser.add_argument("new", help="candidate results JSON")
+    parser.add_argument("--fail-on-regression", type=float, default=None, metavar="PCT",
+                        help="exit 1 if p95 latency rises or throughput falls by more than PCT percent")
+    args = parser.parse_args()
+
+    regressions = compare(load_results(args.old), load_results(args.new), args.fail_on_regression)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.fail_on_regression}%:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
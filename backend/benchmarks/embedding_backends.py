@@ -0,0 +1,142 @@
+"""
+Compare embedding backends for RAGService: load time, batch throughput,
+single-query latency, memory and cosine drift against the PyTorch backend.
+
+Run from the backend directory:
+
+    python -m benchmarks.embedding_backends --count 2000
+    python -m benchmarks.embedding_backends --pdf-dir uploaded_docs --backends torch,onnx_int8
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.embedding_backends import (  # noqa: E402
+    EMBEDDING_BACKENDS,
+    cosine_agreement,
+    create_embeddings,
+    embedding_fingerprint,
+)
+
+TOPICS = [
+    "process scheduling", "virtual memory paging", "deadlock avoidance", "binary search trees",
+    "dynamic programming", "graph shortest paths", "TCP congestion control", "relational normalization",
+    "loop invariants", "sorting algorithm complexity", "semaphores and mutexes", "hash table collisions",
+]
+
+
+def load_texts(pdf_dir: str, count: int) -> List[str]:
+    if pdf_dir:
+        from app.services.document_processing import load_and_split
+
+        texts = []
+        for root, _, files in os.walk(pdf_dir):
+            for file in files:
+                if file.endswith(".pdf"):
+                    texts.extend(chunk.page_content for chunk in load_and_split(os.path.join(root, file)))
+                if len(texts) >= count:
+                    return texts[:count]
+        if texts:
+            return texts
+        print(f"No PDF text found in {pdf_dir}, using synthetic chunks")
+
+    rng = np.random.default_rng(0)
+    texts = []
+    for i in range(count):
+        topic = TOPICS[i % len(TOPICS)]
+        words = " ".join(rng.choice(TOPICS, size=int(rng.integers(5, 40))))
+        texts.append(f"Lecture note {i}: {topic}. {words}.")
+    return texts
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_backend(backend: str, texts: List[str], queries: int) -> Dict:
+    rss_before = max_rss_mb()
+    start = time.perf_counter()
+    embeddings = create_embeddings(backend)
+    load_seconds = time.perf_counter() - start
+    actual = embedding_fingerprint(embeddings)["backend"]
+    if actual != backend:
+        return {"backend": backend, "skipped": f"fell back to {actual}"}
+
+    embeddings.embed_documents(texts[:32])  # warm-up
+    start = time.perf_counter()
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype=np.float32)
+    batch_seconds = time.perf_counter() - start
+
+    latencies = []
+    for text in texts[:queries]:
+        start = time.perf_counter()
+        embeddings.embed_query(text)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "backend": backend,
+        "vectors": vectors,
+        "load_seconds": load_seconds,
+        "texts_per_second": len(texts) / batch_seconds,
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "max_rss_mb": max_rss_mb(),
+        "rss_growth_mb": max_rss_mb() - rss_before,
+    }
+
+
+def neighbour_overlap(reference: np.ndarray, candidate: np.ndarray, k: int = 10) -> float:
+    """
+    Mean overlap of the top-k neighbours of each vector under both backends
+    """
+    sample = reference[: min(200, len(reference))]
+    _, ref = faiss.knn(sample, reference, k)
+    _, cand = faiss.knn(candidate[: len(sample)], candidate, k)
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref, cand)]))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    # The hash backend is not a model, so drift against it means nothing
+    parser.add_argument("--backends", default=",".join(b for b in EMBEDDING_BACKENDS if b != "hash"))
+    parser.add_argument("--count", type=int, default=1000, help="number of chunks to embed")
+    parser.add_argument("--queries", type=int, default=100, help="single-query latency samples")
+    parser.add_argument("--pdf-dir", default="", help="take chunks from PDFs instead of synthetic text")
+    args = parser.parse_args()
+
+    texts = load_texts(args.pdf_dir, args.count)
+    print(f"Embedding {len(texts)} chunks")
+
+    results = [bench_backend(b.strip(), texts, args.queries) for b in args.backends.split(",")]
+    reference = next((r for r in results if "vectors" in r), None)
+
+    header = f"{'backend':<10} {'load s':>7} {'texts/s':>9} {'speedup':>8} {'q p50 ms':>9} {'q p95 ms':>9} " \
+             f"{'rss MB':>7} {'cos mean':>9} {'cos min':>8} {'nn@10':>6}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['backend']:<10} skipped ({result['skipped']})")
+            continue
+        agreement = cosine_agreement(reference["vectors"], result["vectors"])
+        print(
+            f"{result['backend']:<10} {result['load_seconds']:>7.2f} {result['texts_per_second']:>9.1f} "
+            f"{result['texts_per_second'] / reference['texts_per_second']:>7.2f}x "
+            f"{result['query_p50_ms']:>9.2f} {result['query_p95_ms']:>9.2f} {result['max_rss_mb']:>7.0f} "
+            f"{agreement.mean():>9.5f} {agreement.min():>8.5f} "
+            f"{neighbour_overlap(reference['vectors'], result['vectors']):>6.3f}"
+        )
+    print(f"\nDrift is measured against {reference['backend']}; the index re-embed guard "
+          f"triggers below the EMBEDDING_COMPAT_MIN_COSINE setting.")
+
+
+if __name__ == "__main__":
+    main()
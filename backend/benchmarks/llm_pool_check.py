@@ -0,0 +1,209 @@
+"""
+End-to-end check of the LLM backend pool against several stub Ollama
+servers (see stub_ollama): a fast one, a slow one and a flaky one whose
+failures are switched on and off while the check runs.
+
+Covers least-outstanding routing, per-backend caps (requests beyond them
+wait for a slot), passive ejection after `eject_after_failures` errors,
+recovery through the /api/tags health probe, and LLMService failing over
+to another backend through `exclude`. Exits with status 1 when any check
+fails.
+
+Run from the backend directory:
+
+    python -m benchmarks.llm_pool_check
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.stub_ollama import StubOllamaConfig, start_stub_ollama  # noqa: E402
+
+MODEL = "gemma3:1b"
+FAST = StubOllamaConfig(MODEL, token_ms=2.0, prompt_ms=0.0, tokens=20)
+SLOW = StubOllamaConfig(MODEL, token_ms=10.0, prompt_ms=0.0, tokens=20)
+FLAKY = StubOllamaConfig(MODEL, token_ms=2.0, prompt_ms=0.0, tokens=20)
+URLS = {id(config): start_stub_ollama(config)[1] for config in (FAST, SLOW, FLAKY)}
+
+# The service under test routes over the flaky and the fast stub; set
+# before anything from `app` is imported
+os.environ.update({
+    "LLM_BACKENDS": json.dumps([f"{URLS[id(FLAKY)]}|{MODEL}|2", f"{URLS[id(FAST)]}|{MODEL}|2"]),
+    "LLM_BACKEND_EJECT_AFTER_FAILURES": "3",
+    "LLM_HEALTH_CHECK_INTERVAL_SECONDS": "0",
+})
+
+from app.services.llm_pool import LLMBackend, LLMBackendPool, NoBackendAvailable  # noqa: E402
+from app.services.llm_service import ANSWER_ERROR_MESSAGE, LLMService  # noqa: E402
+from app.services.ollama_client import OllamaClient  # noqa: E402
+
+failures: List[str] = []
+
+
+def check(condition: bool, description: str) -> None:
+    print(f"  {'✅' if condition else '❌'} {description}")
+    if not condition:
+        failures.append(description)
+
+
+def make_pool(
+    backends: List[Tuple[StubOllamaConfig, int]],
+    eject_after_failures: int = 2,
+    ejection_seconds: float = 60.0,
+    health_check_interval: float = 0.0,
+) -> LLMBackendPool:
+    return LLMBackendPool(
+        [
+            LLMBackend(f"{name}@{URLS[id(config)]}", OllamaClient(URLS[id(config)], MODEL, timeout=10.0), cap)
+            for name, (config, cap) in zip(("a", "b", "c"), backends)
+        ],
+        eject_after_failures=eject_after_failures,
+        ejection_seconds=ejection_seconds,
+        health_check_interval=health_check_interval,
+    )
+
+
+async def generate(pool: LLMBackendPool, prompt: str, prefer: Optional[str] = None) -> Tuple[str, bool]:
+    """
+    One generation the way LLMService runs it, without failover; returns
+    the backend used and whether it succeeded
+    """
+    backend = await pool.acquire(prefer)
+    started = time.monotonic()
+    ok, error = False, None
+    try:
+        await backend.client.generate(prompt)
+        ok = True
+    except Exception as e:
+        error = str(e).splitlines()[0]
+    finally:
+        pool.release(backend, ok, (time.monotonic() - started) * 1000, error)
+    return backend.name, ok
+
+
+async def wait_for(condition: Callable[[], bool], seconds: float) -> bool:
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def check_routing() -> None:
+    print("Least-outstanding routing")
+    pool = make_pool([(FAST, 1), (SLOW, 2)])
+    held = [await pool.acquire() for _ in range(3)]
+    names = [backend.name.split("@")[0] for backend in held]
+    check(names == ["a", "b", "b"], f"slots go to the backend with the lowest load/cap ratio (got {names})")
+    waiter = asyncio.ensure_future(pool.acquire())
+    await asyncio.sleep(0.1)
+    check(not waiter.done(), "a fourth request waits while every backend is at its cap")
+    pool.release(held[0], True, 5.0)
+    chosen = await asyncio.wait_for(waiter, 1.0)
+    check(chosen is held[0], "it takes the slot released on the fast backend")
+    for backend in held[1:] + [chosen]:
+        pool.release(backend, True)
+    await pool.aclose()
+
+
+async def check_caps() -> None:
+    print("Per-backend caps")
+    pool = make_pool([(FAST, 1), (SLOW, 2)])
+    FAST.peak_active = SLOW.peak_active = 0
+    before = FAST.requests + SLOW.requests
+    results = await asyncio.gather(*(generate(pool, f"cap check {i}") for i in range(12)))
+    check(all(ok for _, ok in results), "all 12 concurrent generations succeed")
+    check(FAST.requests + SLOW.requests - before == 12, "each reached a backend exactly once")
+    check(FAST.peak_active <= 1, f"fast backend never ran more than its cap of 1 (peak {FAST.peak_active})")
+    check(SLOW.peak_active <= 2, f"slow backend never ran more than its cap of 2 (peak {SLOW.peak_active})")
+    await pool.aclose()
+
+
+async def check_passive_ejection() -> None:
+    print("Passive ejection")
+    pool = make_pool([(FLAKY, 2), (FAST, 2)], eject_after_failures=2)
+    flaky = pool.backends[0]
+    FLAKY.fail = True
+    try:
+        first = [await generate(pool, "eject me", prefer=flaky.name) for _ in range(2)]
+        check([name for name, _ in first] == [flaky.name] * 2 and not any(ok for _, ok in first),
+              "the failing backend is still chosen until it reaches eject_after_failures")
+        check(not flaky.available(time.monotonic()), "it is ejected after 2 consecutive failures")
+        requests = FLAKY.requests
+        name, ok = await generate(pool, "route around it", prefer=flaky.name)
+        check(name != flaky.name and ok and FLAKY.requests == requests,
+              "later requests go to the healthy backend, even when the ejected one is preferred")
+    finally:
+        FLAKY.fail = False
+    await pool.aclose()
+
+
+async def check_recovery() -> None:
+    print("Recovery through the /api/tags probe")
+    pool = make_pool([(FLAKY, 2), (FAST, 2)], health_check_interval=0.2)
+    flaky = pool.backends[0]
+    FLAKY.fail = True
+    try:
+        # The first acquire starts the probe loop in this event loop
+        await generate(pool, "start probing", prefer=pool.backends[1].name)
+        check(await wait_for(lambda: not flaky.healthy, 2.0), "a failing probe ejects the backend without any traffic")
+    finally:
+        FLAKY.fail = False
+    check(await wait_for(lambda: flaky.available(time.monotonic()), 2.0),
+          "a passing probe brings it back before its ejection would have expired")
+    name, ok = await generate(pool, "welcome back", prefer=flaky.name)
+    check(name == flaky.name and ok, "the recovered backend serves requests again")
+    await pool.aclose()
+
+
+async def check_failover() -> None:
+    print("Failover via exclude")
+    pool = make_pool([(FLAKY, 2), (FAST, 2)])
+    only = await pool.acquire(exclude={pool.backends[0].name})
+    check(only is pool.backends[1], "acquire skips excluded backends")
+    pool.release(only, True)
+    try:
+        await pool.acquire(exclude={b.name for b in pool.backends})
+        check(False, "excluding every backend raises NoBackendAvailable")
+    except NoBackendAvailable:
+        check(True, "excluding every backend raises NoBackendAvailable")
+    await pool.aclose()
+
+    service = LLMService(MODEL)
+    FLAKY.fail = True
+    try:
+        flaky_before, fast_before = FLAKY.requests, FAST.requests
+        result = await service.agenerate("What is paging?", context="Paging maps pages to frames.")
+        check(result.text != ANSWER_ERROR_MESSAGE and FLAKY.requests == flaky_before + 1
+              and FAST.requests == fast_before + 1,
+              "a generation that fails on the first backend is retried on the other")
+        stream = service.astream("What is a semaphore?", context="A semaphore counts permits.")
+        chunks = [chunk async for chunk in stream]
+        check(bool(chunks) and stream.error is None and FLAKY.requests == flaky_before + 2,
+              "a stream that fails before its first token fails over too")
+        FAST.fail = True
+        result = await service.agenerate("What is a deadlock?", context="Deadlocks need circular wait.")
+        check(result.text == ANSWER_ERROR_MESSAGE, "with every backend failing the error answer is returned")
+    finally:
+        FLAKY.fail = FAST.fail = False
+        await service.aclose()
+
+
+async def main() -> None:
+    for run in (check_routing, check_caps, check_passive_ejection, check_recovery, check_failover):
+        await run()
+    if failures:
+        print(f"❌ {len(failures)} check(s) failed")
+        sys.exit(1)
+    print("✅ All LLM backend pool checks passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
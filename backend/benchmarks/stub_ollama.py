@@ -0,0 +1,194 @@
+"""
+Deterministic stand-in for an Ollama server, so chat benchmarks run
+offline and measure the API rather than the model.
+
+Implements GET /api/tags and POST /api/generate (streamed NDJSON or a
+single JSON response, with the `context` array and the timing fields real
+Ollama returns). With --fail (or `config.fail` set at runtime) both answer
+with a server error, like a backend whose model crashed. Prompt evaluation costs --prompt-ms per 100 new prompt
+tokens (words) and every generated token costs --token-ms. Each request
+sleeps on its own thread, so concurrent requests overlap like on a server
+with spare capacity; any queueing measured comes from the API itself.
+
+Run from the backend directory:
+
+    python -m benchmarks.stub_ollama --port 11500 --token-ms 20 --tokens 40
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+WORDS = (
+    "the process scheduler assigns cpu time to runnable threads while virtual memory maps pages "
+    "to frames and the kernel handles faults locks protect shared data structures from races"
+).split()
+NS_PER_MS = 1_000_000
+
+
+class StubOllamaConfig:
+    def __init__(
+        self,
+        model: str = "gemma3:1b",
+        token_ms: float = 20.0,
+        prompt_ms: float = 10.0,
+        tokens: int = 40,
+        fail: bool = False,
+    ):
+        self.model = model
+        self.token_ms = token_ms
+        self.prompt_ms = prompt_ms
+        self.tokens = tokens
+        self.fail = fail
+        self.requests = 0
+        # Generations in flight, and the most seen at once
+        self.active = 0
+        self.peak_active = 0
+        self._lock = threading.Lock()
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def begin(self) -> None:
+        with self._lock:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+
+    def end(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+
+def answer_tokens(prompt: str, count: int) -> List[str]:
+    """
+    The same prompt always gets the same answer
+    """
+    seed = int.from_bytes(hashlib.sha256(prompt.encode()).digest()[:8], "little")
+    return [WORDS[(seed + i * 7) % len(WORDS)] + " " for i in range(count)]
+
+
+def _handler(config: StubOllamaConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:
+            pass
+
+        def do_GET(self) -> None:
+            if self.path != "/api/tags":
+                self._send_json(404, {"error": "not found"})
+                return
+            if config.fail:
+                self._send_json(503, {"error": "stub backend is failing"})
+                return
+            self._send_json(200, {"models": [{"name": config.model, "model": config.model}]})
+
+        def do_POST(self) -> None:
+            if self.path != "/api/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            config.count_request()
+            if config.fail:
+                self._send_json(500, {"error": "stub backend is failing"})
+                return
+            config.begin()
+            try:
+                self._generate(request)
+            finally:
+                config.end()
+
+        def _generate(self, request: Dict) -> None:
+            context = request.get("context") or []
+            prompt = request.get("prompt", "")
+            prompt_tokens = len(prompt.split()) + (0 if context else len(request.get("system", "").split()))
+            prompt_seconds = config.prompt_ms * prompt_tokens / 100 / 1000
+            time.sleep(prompt_seconds)
+
+            tokens = answer_tokens(prompt, config.tokens)
+            final = {
+                "model": config.model,
+                "done": True,
+                "context": list(context) + list(range(prompt_tokens + len(tokens))),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * 1000 * NS_PER_MS),
+                "eval_count": len(tokens),
+                "eval_duration": int(config.token_ms * len(tokens) * NS_PER_MS),
+                "load_duration": 0,
+            }
+            final["total_duration"] = final["prompt_eval_duration"] + final["eval_duration"]
+
+            if request.get("stream", True):
+                self._stream(tokens, final)
+            else:
+                time.sleep(config.token_ms * len(tokens) / 1000)
+                self._send_json(200, {**final, "response": "".join(tokens)})
+
+        def _stream(self, tokens: List[str], final: Dict) -> None:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in tokens:
+                time.sleep(config.token_ms / 1000)
+                self._chunk({"model": config.model, "response": token, "done": False})
+            self._chunk({**final, "response": ""})
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+
+        def _chunk(self, payload: Dict) -> None:
+            data = (json.dumps(payload) + "\n").encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def _send_json(self, status: int, payload: Dict) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return Handler
+
+
+def start_stub_ollama(
+    config: Optional[StubOllamaConfig] = None, host: str = "127.0.0.1", port: int = 0
+) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Serve the stub on a background thread; returns the server and its base URL
+    """
+    config = config or StubOllamaConfig()
+    server = ThreadingHTTPServer((host, port), _handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-ollama", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--model", default="gemma3:1b")
+    parser.add_argument("--token-ms", type=float, default=20.0, help="latency per generated token")
+    parser.add_argument("--prompt-ms", type=float, default=10.0, help="latency per 100 evaluated prompt tokens")
+    parser.add_argument("--tokens", type=int, default=40, help="tokens per answer")
+    parser.add_argument("--fail", action="store_true", help="answer every request with a server error")
+    args = parser.parse_args()
+
+    config = StubOllamaConfig(args.model, args.token_ms, args.prompt_ms, args.tokens, args.fail)
+    server, url = start_stub_ollama(config, args.host, args.port)
+    print(f"Stub Ollama serving {args.model} at {url} ({args.token_ms} ms/token, {args.tokens} tokens/answer)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()